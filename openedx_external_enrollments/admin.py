@@ -4,8 +4,11 @@ Django admin page
 from django.contrib import admin
 
 from openedx_external_enrollments.models import (
+    EnrollmentOutboxEvent,
     EnrollmentRequestLog,
     ExternalEnrollment,
+    ExternalEnrollmentEvent,
+    ICCUser,
     OtherCourseSettings,
     ProgramSalesforceEnrollment,
 )
@@ -82,3 +85,52 @@ class ExternalEnrollmentAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
     ]
 
     search_fields = ('controller_name', 'course_shell__id', 'email')
+
+
+@admin.register(ExternalEnrollmentEvent)
+class ExternalEnrollmentEventAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
+    """
+    ExternalEnrollmentEvent model admin.
+    """
+    list_display = [
+        'enrollment',
+        'data',
+        'event_time',
+        'uploaded_at',
+        'quarantined_at',
+    ]
+
+    search_fields = ('enrollment__controller_name', 'enrollment__email', 'data')
+
+
+@admin.register(EnrollmentOutboxEvent)
+class EnrollmentOutboxEventAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
+    """
+    EnrollmentOutboxEvent model admin.
+    """
+    list_display = [
+        'controller_name',
+        'course_id',
+        'email',
+        'status',
+        'attempts',
+        'created_at',
+        'processed_at',
+    ]
+    list_filter = ('status', 'controller_name',)
+    search_fields = ('controller_name', 'course_id', 'email')
+
+
+@admin.register(ICCUser)
+class ICCUserAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
+    """
+    ICCUser model admin.
+    """
+    list_display = [
+        'email',
+        'icc_user_id',
+        'username',
+        'updated_at',
+    ]
+
+    search_fields = ('email', 'icc_user_id', 'username')
@@ -8,7 +8,7 @@ from opaque_keys.edx.keys import CourseKey
 from rest_framework import status
 from rest_framework.views import APIView
 
-from openedx_external_enrollments.edxapp_wrapper.get_courseware import get_course_by_id
+from openedx_external_enrollments.course_settings_cache import get_other_course_settings
 from openedx_external_enrollments.edxapp_wrapper.get_edx_rest_framework_extensions import get_jwt_authentication
 from openedx_external_enrollments.edxapp_wrapper.get_openedx_authentication import get_oauth2_authentication
 from openedx_external_enrollments.edxapp_wrapper.get_openedx_permissions import get_api_key_permission
@@ -38,9 +38,9 @@ class ExternalEnrollment(APIView):
         View to execute the external enrollment.
         """
         response = {}
-        course = self._get_course(request.data.get("course_id"))
+        course_settings = self._get_course_settings(request.data.get("course_id"))
 
-        if not course:
+        if course_settings is None:
             return JsonResponse(
                 {"error": "Invalid operation: course not found"},
                 status=status.HTTP_400_BAD_REQUEST,
@@ -49,7 +49,7 @@ class ExternalEnrollment(APIView):
         try:
             # Getting the corresponding enrollment controller
             enrollment_controller = ExternalEnrollmentFactory.get_enrollment_controller(
-                course.other_course_settings.get("external_platform_target")
+                course_settings.get("external_platform_target")
             )
         except Exception:  # pylint: disable=broad-except
             LOG.info('Course [%s] not configured as external', request.data.get("course_id"))
@@ -61,22 +61,21 @@ class ExternalEnrollment(APIView):
             # Now, let's try to execute the enrollment
             response, request_status = enrollment_controller._post_enrollment(  # pylint: disable=protected-access
                 request.data,
-                course.other_course_settings,
+                course_settings,
             )
 
         return JsonResponse(response, status=request_status, safe=False)
 
     @staticmethod
-    def _get_course(course_id):
+    def _get_course_settings(course_id):
         """
-        Return a course object.
+        Return the course other_course_settings.
         """
         if not course_id:
             return None
 
         course_key = CourseKey.from_string(course_id)
-        course = get_course_by_id(course_key)
-        return course
+        return get_other_course_settings(course_key)
 
 
 class SalesforceEnrollmentView(APIView):
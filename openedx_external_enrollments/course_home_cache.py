@@ -0,0 +1,46 @@
+"""Cache of the course home URL and entry points completion of every learner and course."""
+import hashlib
+
+from django.core.cache import cache
+
+CACHE_KEY_PREFIX = 'openedx_external_enrollments.course_home'
+COMPLETION_CACHE_KEY_PREFIX = 'openedx_external_enrollments.entry_points_completion'
+
+
+def get_course_home_cache_key(user_id, course_id):
+    """
+    Return the cache key of the course home calculated for the user in the course.
+    """
+    return _get_cache_key(CACHE_KEY_PREFIX, user_id, course_id)
+
+
+def invalidate_course_home(user_id, course_id):
+    """
+    Remove the cached course home of the user, e.g. when the enrollment changes.
+    """
+    cache.delete(get_course_home_cache_key(user_id, course_id))
+
+
+def get_entry_points_completion_cache_key(user_id, course_id):
+    """
+    Return the cache key of the entry points completion bitmap of the user in the course.
+    """
+    return _get_cache_key(COMPLETION_CACHE_KEY_PREFIX, user_id, course_id)
+
+
+def invalidate_entry_points_completion(user_id, course_id):
+    """
+    Remove the cached entry points completion and course home of the user, e.g. when a submission changes.
+    """
+    cache.delete_many([
+        get_entry_points_completion_cache_key(user_id, course_id),
+        get_course_home_cache_key(user_id, course_id),
+    ])
+
+
+def _get_cache_key(prefix, user_id, course_id):
+    """
+    Return a key that is always valid for memcached. The user and course ids are hashed,
+    since course ids can be long and contain any character.
+    """
+    return '{}.{}'.format(prefix, hashlib.md5('{}.{}'.format(user_id, course_id).encode()).hexdigest())
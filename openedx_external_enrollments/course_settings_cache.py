@@ -0,0 +1,81 @@
+"""Cached lookup of the course other_course_settings mirrored in the OtherCourseSettings table."""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from openedx_external_enrollments.models import OtherCourseSettings
+
+CACHE_KEY_PREFIX = 'openedx_external_enrollments.course_settings'
+_LOCAL_CACHE = OrderedDict()
+_LOCAL_CACHE_LOCK = threading.Lock()
+
+
+def get_other_course_settings(course_key):
+    """
+    Return the other_course_settings of the course without loading it from the modulestore.
+
+    The settings are read from an in-process LRU, then from the Django cache and finally
+    from the OtherCourseSettings table. Courses without a record, i.e. the ones that are
+    not configured as external, get an empty dict, which is cached as well.
+
+    The Django cache entry is invalidated when the course settings are updated. The
+    in-process entries expire after OEE_COURSE_SETTINGS_LOCAL_CACHE_TIMEOUT seconds,
+    since other processes can't be notified of the update.
+
+    Args:
+        course_key: CourseKey instance or course id string.
+    Returns:
+        A copy of the other_course_settings dict.
+    """
+    course_id = str(course_key)
+    now = time.time()
+
+    with _LOCAL_CACHE_LOCK:
+        entry = _LOCAL_CACHE.get(course_id)
+
+        if entry and entry['expires_at'] > now:
+            _LOCAL_CACHE.move_to_end(course_id)
+            return copy.deepcopy(entry['course_settings'])
+
+    cache_key = _get_cache_key(course_id)
+    course_settings = cache.get(cache_key)
+
+    if course_settings is None:
+        course_settings = OtherCourseSettings.objects.filter(  # pylint: disable=no-member
+            course_id=course_id,
+        ).values_list('other_course_settings', flat=True).first() or {}
+        cache.set(cache_key, course_settings, settings.OEE_COURSE_SETTINGS_CACHE_TIMEOUT)
+
+    with _LOCAL_CACHE_LOCK:
+        _LOCAL_CACHE[course_id] = {
+            'course_settings': course_settings,
+            'expires_at': now + settings.OEE_COURSE_SETTINGS_LOCAL_CACHE_TIMEOUT,
+        }
+        _LOCAL_CACHE.move_to_end(course_id)
+
+        while len(_LOCAL_CACHE) > settings.OEE_COURSE_SETTINGS_LOCAL_CACHE_SIZE:
+            _LOCAL_CACHE.popitem(last=False)
+
+    return copy.deepcopy(course_settings)
+
+
+def invalidate_other_course_settings(course_key):
+    """
+    Remove the cached settings of the course, so the next lookup reads them from the table.
+    """
+    course_id = str(course_key)
+    cache.delete(_get_cache_key(course_id))
+
+    with _LOCAL_CACHE_LOCK:
+        _LOCAL_CACHE.pop(course_id, None)
+
+
+def _get_cache_key(course_id):
+    """
+    Return the Django cache key of the course settings.
+    """
+    return '{}.{}'.format(CACHE_KEY_PREFIX, course_id)
@@ -5,18 +5,28 @@ import datetime
 
 import pytz
 from courseware.courses import get_course_by_id  # pylint: disable=import-error
+from django.conf import settings
+from django.core.cache import cache
 from opaque_keys.edx.keys import CourseKey
 from student.models import CourseEnrollment, anonymous_id_for_user  # pylint: disable=import-error
-from submissions import api as submissions_api  # pylint: disable=import-error
-
+from submissions.models import Submission  # pylint: disable=import-error
+
+from openedx_external_enrollments.course_home_cache import (
+    get_course_home_cache_key,
+    get_entry_points_completion_cache_key,
+)
+from openedx_external_enrollments.course_settings_cache import get_other_course_settings
+from openedx_external_enrollments.entry_points import get_current_entry_point
 from openedx_external_enrollments.factory import ExternalEnrollmentFactory
 
-DAYS_IN_WEEK = 7
+ANONYMOUS_ID_CACHE_KEY_PREFIX = 'openedx_external_enrollments.anonymous_id'
 
 
 def calculate_course_home(course_id, user):
     """
     Calculate course home.
+
+    The result is cached per user and course for OEE_COURSE_HOME_CACHE_TIMEOUT seconds.
     """
     course_key = CourseKey.from_string(course_id)
     user_is_enrolled = CourseEnrollment.is_enrolled(user, course_key)
@@ -24,6 +34,29 @@ def calculate_course_home(course_id, user):
     if not user_is_enrolled:
         return None
 
+    cache_key = get_course_home_cache_key(user.id, course_id)
+    cached_course_home = cache.get(cache_key)
+
+    if cached_course_home is not None:
+        return cached_course_home['url']
+
+    url = _calculate_course_home(course_id, course_key, user)
+    cache.set(cache_key, {'url': url}, settings.OEE_COURSE_HOME_CACHE_TIMEOUT)
+
+    return url
+
+
+def is_external_course(course_id):
+    """
+    Decide if the course was confiured as external or not.
+    """
+    return _is_external_course(get_other_course_settings(CourseKey.from_string(course_id)))
+
+
+def _calculate_course_home(course_id, course_key, user):
+    """
+    Return the entry point or external course home URL, loading the course only once.
+    """
     course = get_course_by_id(course_key)
     custom_course_settings = course.other_course_settings
     course_entry_points = custom_course_settings.get("course_entry_points", [])
@@ -33,7 +66,7 @@ def calculate_course_home(course_id, user):
     if custom_entry_point:
         return custom_entry_point
 
-    if is_external_course(course_id):
+    if _is_external_course(custom_course_settings):
         enrollment_controller = ExternalEnrollmentFactory.get_enrollment_controller(
             controller=custom_course_settings.get('external_platform_target'),
         )
@@ -50,14 +83,10 @@ def calculate_course_home(course_id, user):
     return None
 
 
-def is_external_course(course_id):
+def _is_external_course(custom_course_settings):
     """
-    Decide if the course was confiured as external or not.
+    True if the course settings have an external course run id and platform.
     """
-    course_key = CourseKey.from_string(course_id)
-    course = get_course_by_id(course_key)
-    custom_course_settings = course.other_course_settings
-
     return (
         custom_course_settings.get("external_course_run_id") and
         custom_course_settings.get("external_platform_target")
@@ -80,7 +109,13 @@ def _calculate_entry_point(course, course_id, course_key, course_entry_points, u
 
     current_entry_point = _get_current_entry_point(course_entry_points, student_start)
 
-    if current_entry_point and not _check_entry_point_completion(current_entry_point, user, course_key, course_id):
+    if current_entry_point and not _check_entry_point_completion(
+            course_entry_points,
+            current_entry_point,
+            user,
+            course_key,
+            course_id,
+    ):
         url = "/courses/{}/jump_to_id/{}".format(course_id, current_entry_point.get("block_id"))
 
     return url
@@ -91,35 +126,69 @@ def _get_current_entry_point(course_entry_points, student_start_date):
     Returns a valid entry point within a list of points.
     Otherwise returns None.
     """
-    entry_point = None
     difference = datetime.datetime.utcnow().replace(tzinfo=pytz.utc) - student_start_date
-    days_since_course_start = difference.days
 
-    for point in course_entry_points:
-        valid_from_day = int(point.get("valid_from_week", 0)) * DAYS_IN_WEEK
-        valid_through_day = int(point.get("valid_through_week", 0)) * DAYS_IN_WEEK
+    return get_current_entry_point(course_entry_points, difference.days)
 
-        if valid_from_day <= 0:
-            is_current_point = 0 <= days_since_course_start <= valid_through_day
-        else:
-            is_current_point = valid_from_day < days_since_course_start <= valid_through_day
 
-        if is_current_point:
-            entry_point = point
-            break
+def _check_entry_point_completion(course_entry_points, point, user, course_key, course_id):
+    """
+    Checks if there is a submission entry related with the given point and course for the user.
+    """
+    completion_bitmap = _get_entry_points_completion(course_entry_points, user, course_key, course_id)
 
-    return entry_point
+    return bool(completion_bitmap & (1 << course_entry_points.index(point)))
 
 
-def _check_entry_point_completion(point, user, course_key, course_id):
+def _get_entry_points_completion(course_entry_points, user, course_key, course_id):
     """
-    Checks if there is a submission entry related with the given point and course for the user.
+    Return a bitmap where the bit i is set when the user has a submission for the entry point i.
+
+    The submissions of all the entry points are fetched in a single query and the bitmap is
+    cached until a submission of the user in the course is saved or deleted.
     """
-    student_item = dict(
-        student_id=anonymous_id_for_user(user, course_key),
-        course_id=course_id,
-        item_id=point.get("block_id"),
-        item_type=point.get("block_type"),
+    points = [(point.get("block_id"), point.get("block_type")) for point in course_entry_points]
+    cache_key = get_entry_points_completion_cache_key(user.id, course_id)
+    cached_completion = cache.get(cache_key)
+
+    # The bitmap is only valid for the entry points it was calculated for.
+    if cached_completion and cached_completion['points'] == points:
+        return cached_completion['bitmap']
+
+    submitted_points = set(
+        Submission.objects.filter(
+            student_item__student_id=_get_anonymous_id(user, course_key),
+            student_item__course_id=course_id,
+            student_item__item_id__in=[block_id for block_id, _ in points],
+        ).values_list(
+            'student_item__item_id',
+            'student_item__item_type',
+        )
     )
+    bitmap = 0
+
+    for index, point in enumerate(points):
+        if point in submitted_points:
+            bitmap |= 1 << index
+
+    cache.set(
+        cache_key,
+        {'points': points, 'bitmap': bitmap},
+        settings.OEE_ENTRY_POINTS_COMPLETION_CACHE_TIMEOUT,
+    )
+
+    return bitmap
+
+
+def _get_anonymous_id(user, course_key):
+    """
+    Return the anonymous id of the user in the course, which never changes once created.
+    """
+    cache_key = '{}.{}.{}'.format(ANONYMOUS_ID_CACHE_KEY_PREFIX, user.id, course_key)
+    anonymous_id = cache.get(cache_key)
+
+    if anonymous_id is None:
+        anonymous_id = anonymous_id_for_user(user, course_key)
+        cache.set(cache_key, anonymous_id, settings.OEE_ANONYMOUS_ID_CACHE_TIMEOUT)
 
-    return bool(submissions_api.get_submissions(student_item))
+    return anonymous_id
@@ -5,6 +5,8 @@ import time
 from cms.djangoapps.models.settings.course_metadata import CourseMetadata  # pylint: disable=import-error
 from xmodule.modulestore.django import modulestore  # pylint: disable=import-error
 
+from openedx_external_enrollments.course_settings_cache import invalidate_other_course_settings
+from openedx_external_enrollments.entry_points import validate_course_entry_points
 from openedx_external_enrollments.models import OtherCourseSettings
 
 LOG = logging.getLogger(__name__)
@@ -14,9 +16,21 @@ def update_course_settings(*args, **kwargs):  # pylint: disable=unused-argument
     """
     Updates external_course_id and external_platform from a course overview.
     This function is called from edx-platform once advance course settings is successfully saved.
+
+    Settings with invalid course_entry_points ranges are not stored, the previous ones are kept.
+    Returns the list of errors of the entry points, empty when the settings are valid.
     """
     try:
         other_course_settings = kwargs.get('other_course_settings', {})
+        entry_points_errors = validate_course_entry_points(other_course_settings.get('course_entry_points'))
+
+        if entry_points_errors:
+            LOG.error(
+                'Invalid course_entry_points for course [%s], the settings were not updated: %s',
+                kwargs.get('course_key'),
+                entry_points_errors,
+            )
+            return entry_points_errors
 
         if other_course_settings and other_course_settings.get('external_platform_target'):
             OtherCourseSettings.objects.update_or_create(  # pylint: disable=no-member
@@ -30,9 +44,13 @@ def update_course_settings(*args, **kwargs):  # pylint: disable=unused-argument
         else:
             OtherCourseSettings.objects.filter(course_id=kwargs.get('course_key')).delete()  # pylint: disable=no-member
 
+        invalidate_other_course_settings(kwargs.get('course_key'))
+
     except Exception as error:  # pylint: disable=broad-except
         LOG.error('Failed to update course_settings in the backend. Reason: %s', str(error))
 
+    return []
+
 
 def migrate_course_settings(*args, **kwargs):  # pylint: disable=unused-argument
     """
@@ -60,6 +78,7 @@ def migrate_course_settings(*args, **kwargs):  # pylint: disable=unused-argument
                         'other_course_settings': other_course_settings,
                     },
                 )
+                invalidate_other_course_settings(course.id)
 
             # Sleeps in every group_length reach to avoid database from crashing.
             if group_counter % kwargs.get('group_length') == 0:
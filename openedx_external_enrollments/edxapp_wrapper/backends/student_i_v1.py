@@ -1,6 +1,6 @@
 """Student backend file."""
 
-from student.models import CourseEnrollment, get_user  # pylint: disable=import-error
+from student.models import CourseEnrollment, get_user, user_by_anonymous_id  # pylint: disable=import-error
 from student.signals import ENROLLMENT_TRACK_UPDATED, UNENROLL_DONE  # pylint: disable=import-error
 
 
@@ -9,6 +9,11 @@ def get_user_backend(*args, **kwargs):
     return get_user(*args, **kwargs)
 
 
+def user_by_anonymous_id_backend(*args, **kwargs):
+    """Return the method user_by_anonymous_id from student.models."""
+    return user_by_anonymous_id(*args, **kwargs)
+
+
 def get_course_enrollment_backend():
     """Return the model CourseEnrollment from the module student.models."""
     return CourseEnrollment
@@ -0,0 +1,8 @@
+"""Submissions backend file."""
+
+from submissions.models import Submission  # pylint: disable=import-error
+
+
+def get_submission_model_backend():
+    """Return the model Submission from the module submissions.models."""
+    return Submission
@@ -24,6 +24,14 @@ def get_course_enrollment():
 CourseEnrollment = get_course_enrollment()
 
 
+def user_by_anonymous_id(*args, **kwargs):
+    """ Return user_by_anonymous_id result method."""
+    backend_function = settings.OEE_STUDENT_BACKEND
+    backend = import_module(backend_function)
+
+    return backend.user_by_anonymous_id_backend(*args, **kwargs)
+
+
 def get_enrollment_track_updated_signal():
     """Returns enrollment_track_updated signal result method.."""
     backend_module = settings.OEE_STUDENT_BACKEND
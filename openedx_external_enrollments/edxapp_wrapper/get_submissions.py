@@ -0,0 +1,12 @@
+"""Submissions definitions."""
+from importlib import import_module
+
+from django.conf import settings
+
+
+def get_submission_model():
+    """ Return Submission model."""
+    backend_function = settings.OEE_SUBMISSIONS_BACKEND
+    backend = import_module(backend_function)
+
+    return backend.get_submission_model_backend()
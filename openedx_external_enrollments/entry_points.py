@@ -0,0 +1,119 @@
+"""Schedule of the course entry points configured in the course other_course_settings."""
+import json
+import logging
+from bisect import bisect_right
+from functools import lru_cache
+
+LOG = logging.getLogger(__name__)
+DAYS_IN_WEEK = 7
+COMPILED_SCHEDULES_CACHE_SIZE = 512
+
+
+def get_current_entry_point(course_entry_points, days_since_course_start):
+    """
+    Return the first entry point whose range contains the given day, otherwise None.
+
+    Points without valid_from_week, or with a value lower or equal than 0, are valid from
+    day 0 through valid_through_week, the rest from the day after valid_from_week.
+    Invalid points are ignored.
+
+    Args:
+        course_entry_points: List of entry point dicts.
+        days_since_course_start: Number of days since the student started the course.
+    """
+    starts, segments = _compile_schedule(_get_schedule_key(course_entry_points))
+    position = bisect_right(starts, days_since_course_start) - 1
+
+    if position >= 0:
+        last_day, index = segments[position]
+
+        if days_since_course_start <= last_day:
+            return course_entry_points[index]
+
+    return None
+
+
+def validate_course_entry_points(course_entry_points):
+    """
+    Return the list of errors of the entry points ranges, empty when all of them are valid.
+    """
+    errors = []
+
+    for index, point in enumerate(course_entry_points or []):
+        try:
+            first_day, last_day = _get_days_range(point.get('valid_from_week', 0), point.get('valid_through_week', 0))
+        except (AttributeError, TypeError, ValueError) as error:
+            errors.append('Entry point {}: {}'.format(index, error))
+        else:
+            if first_day > last_day:
+                errors.append('Entry point {}: valid_through_week is before valid_from_week'.format(index))
+
+    return errors
+
+
+def _get_schedule_key(course_entry_points):
+    """
+    Return a hashable representation of the entry points ranges, used as the compiled schedule key.
+    """
+    return json.dumps([
+        [point.get('valid_from_week', 0), point.get('valid_through_week', 0)]
+        for point in course_entry_points
+    ])
+
+
+@lru_cache(maxsize=COMPILED_SCHEDULES_CACHE_SIZE)
+def _compile_schedule(schedule_key):
+    """
+    Compile the entry points ranges into sorted non-overlapping day segments.
+
+    Every segment belongs to the first entry point that covers it, so overlapping ranges
+    resolve as the original linear scan. Returns the list of segment start days and the
+    matching list of (last day, entry point index) tuples.
+    """
+    ranges = []
+
+    for index, (valid_from_week, valid_through_week) in enumerate(json.loads(schedule_key)):
+        try:
+            first_day, last_day = _get_days_range(valid_from_week, valid_through_week)
+        except (TypeError, ValueError) as error:
+            LOG.error('Ignoring the invalid course entry point %s. Reason: %s', index, str(error))
+            continue
+
+        if first_day <= last_day:
+            ranges.append((first_day, last_day, index))
+
+    boundaries = sorted({first_day for first_day, _, _ in ranges} | {last_day + 1 for _, last_day, _ in ranges})
+    starts = []
+    segments = []
+
+    for segment_start, next_segment_start in zip(boundaries, boundaries[1:]):
+        covering_points = [
+            index for first_day, last_day, index in ranges
+            if first_day <= segment_start <= last_day
+        ]
+
+        if not covering_points:
+            continue
+
+        index = min(covering_points)
+
+        if segments and segments[-1] == (segment_start - 1, index):
+            segments[-1] = (next_segment_start - 1, index)
+        else:
+            starts.append(segment_start)
+            segments.append((next_segment_start - 1, index))
+
+    return starts, segments
+
+
+def _get_days_range(valid_from_week, valid_through_week):
+    """
+    Return the first and last day of the entry point.
+    """
+    valid_from_day = int(valid_from_week) * DAYS_IN_WEEK
+    valid_through_day = int(valid_through_week) * DAYS_IN_WEEK
+
+    if valid_from_day <= 0:
+        return 0, valid_through_day
+
+    return valid_from_day + 1, valid_through_day
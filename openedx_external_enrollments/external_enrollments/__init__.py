@@ -1,25 +1,26 @@
 """External enrollments method file."""
 import logging
 
+from django.conf import settings
+
+from openedx_external_enrollments.course_settings_cache import get_other_course_settings
 from openedx_external_enrollments.edxapp_wrapper.get_site_configuration import configuration_helpers
+from openedx_external_enrollments.external_enrollments.outbox import add_outbox_event
 from openedx_external_enrollments.factory import ExternalEnrollmentFactory
 
 LOG = logging.getLogger(__name__)
 
 
-def execute_external_enrollment(data, course):
+def execute_external_enrollment(data, course_key):
     """
     Execute an enrollment for the given data and course.
 
     Args:
         data: dict with the enrollment data.
-        course: instance of CourseDescriptor.
+        course_key: CourseKey instance of the course.
     """
-    try:
-        controller = course.other_course_settings.get('external_platform_target', '')
-    except AttributeError:
-        LOG.error('Course [%s] not configured as external.', str(course.id))
-        return
+    course_settings = get_other_course_settings(course_key)
+    controller = course_settings.get('external_platform_target', '')
 
     valid_external_targets = configuration_helpers.get_value('VALID_EXTERNAL_TARGETS', [])
 
@@ -35,4 +36,49 @@ def execute_external_enrollment(data, course):
         controller=controller,
     )
 
-    enrollment_controller._post_enrollment(data, course.other_course_settings)  # pylint: disable=protected-access
+    if controller.lower() in settings.OEE_OUTBOX_EXTERNAL_ENROLLMENT_CONTROLLERS:
+        add_outbox_event(
+            controller.lower(),
+            serialize_enrollment_data(data),
+            course_settings,
+            enrollment_controller.get_site_configuration(),
+        )
+        LOG.info('External enrollment for [%s] has been stored in the outbox with data: %s', controller, data)
+        return
+
+    if controller.lower() in settings.OEE_ASYNC_EXTERNAL_ENROLLMENT_CONTROLLERS:
+        # Imported here since the tasks module depends on the enrollment controllers.
+        from openedx_external_enrollments.tasks import run_external_enrollment
+
+        try:
+            run_external_enrollment.delay(
+                controller.lower(),
+                serialize_enrollment_data(data),
+                course_settings,
+                enrollment_controller.get_site_configuration(),
+            )
+        except Exception as error:  # pylint: disable=broad-except
+            # The LMS enrollment must not fail when the broker is unavailable.
+            LOG.error(
+                'Failed to queue the external enrollment for [%s] with data: %s. Reason: %s',
+                controller,
+                data,
+                str(error),
+            )
+        else:
+            LOG.info('External enrollment for [%s] has been queued with data: %s', controller, data)
+
+        return
+
+    enrollment_controller._post_enrollment(data, course_settings)  # pylint: disable=protected-access
+
+
+def serialize_enrollment_data(data):
+    """
+    Return a copy of the enrollment data that can be sent to a Celery task,
+    e.g. the course key is converted to string.
+    """
+    return {
+        key: value if value is None or isinstance(value, (bool, int, float, str)) else str(value)
+        for key, value in data.items()
+    }
@@ -1,9 +1,11 @@
 """BaseExternalEnrollment class file."""
 import logging
 
-import requests
+from django.conf import settings
 from rest_framework import status
 
+from openedx_external_enrollments.edxapp_wrapper.get_site_configuration import configuration_helpers
+from openedx_external_enrollments.external_enrollments.http_session import get_http_session
 from openedx_external_enrollments.models import EnrollmentRequestLog
 
 LOG = logging.getLogger(__name__)
@@ -13,12 +15,23 @@ class BaseExternalEnrollment():
     """
     Base class for all the enrollments.
     """
+    # Retry policy applied when the enrollment is executed asynchronously by the
+    # run_external_enrollment task. It can be overridden per controller with the
+    # OEE_ASYNC_EXTERNAL_ENROLLMENT_RETRY_POLICIES setting.
+    ASYNC_MAX_RETRIES = 3
+    ASYNC_RETRY_DELAY = 60
+    # Whether the pending outbox events of the same learner and course can be reduced to the last one.
+    COALESCE_OUTBOX_EVENTS = True
+    # Site configuration values read by the controller. Celery workers don't have a current site,
+    # so they are captured with get_site_configuration when the enrollment is queued.
+    SITE_CONFIGURATION_KEYS = ()
+    site_configuration = None
 
     def _execute_post(self, url, data=None, headers=None, json_data=None):
         """
         Execute post request.
         """
-        response = requests.post(
+        response = get_http_session(url).post(
             url=url,
             data=data,
             headers=headers,
@@ -47,6 +60,17 @@ class BaseExternalEnrollment():
                 headers=self._get_enrollment_headers(),
                 json_data=json_data,
             )
+
+            # The partner may revoke a token before it expires, retry once with a new one.
+            if response.status_code == status.HTTP_401_UNAUTHORIZED and self._forget_token():
+                LOG.warning('The token of [%s] was rejected, retrying with a new one.', self.__str__())
+                url = self._get_enrollment_url(course_settings)
+                log_details['url'] = url
+                response = self._execute_post(
+                    url=url,
+                    headers=self._get_enrollment_headers(),
+                    json_data=json_data,
+                )
         except Exception as error:  # pylint: disable=broad-except
             log_details['response'] = {'error': 'Failed to complete enrollment. Reason: %s' % str(error)}
 
@@ -66,8 +90,100 @@ class BaseExternalEnrollment():
                 details=log_details,
             )
 
+            if not self._is_successful_response(response):
+                # Keep the partner status code, a rejection sent with a successful status is a bad request.
+                return json_response, status.HTTP_400_BAD_REQUEST if response.ok else response.status_code
+
             return json_response, status.HTTP_200_OK
 
+    def _is_successful_response(self, response):
+        """
+        Return whether the partner accepted the enrollment.
+        """
+        return response.ok
+
+    def _forget_token(self):
+        """
+        Remove the cached access token after the partner rejected it.
+
+        Returns:
+            True if the controller uses a token that can be requested again.
+        """
+        return False
+
+    def run_enrollment(self, data, course_settings=None):
+        """
+        Execute the enrollment outside the request that triggered it, e.g. from a Celery task.
+        Any error is returned as a failed response instead of being raised.
+
+        Returns:
+            tuple (response, succeeded).
+        """
+        try:
+            result = self._post_enrollment(data, course_settings)
+        except Exception as error:  # pylint: disable=broad-except
+            LOG.error('Failed to complete enrollment for [%s]. Reason: %s', self.__str__(), str(error))
+            return str(error), False
+
+        # Some controllers, like Pathstream, only store the enrollment and don't return a response.
+        response, status_code = result or (None, status.HTTP_200_OK)
+
+        return response, status_code == status.HTTP_200_OK
+
+    def run_enrollments(self, enrollments):
+        """
+        Execute several enrollments, e.g. the ones delivered by the outbox relay. They are
+        executed one by one, controllers that support bulk requests override it.
+
+        Args:
+            enrollments: list of (data, course_settings) tuples.
+        Returns:
+            list of (response, succeeded) tuples in the same order.
+        """
+        return [self.run_enrollment(data, course_settings) for data, course_settings in enrollments]
+
+    def get_site_configuration(self):
+        """
+        Return the SITE_CONFIGURATION_KEYS values of the current site, skipping the missing ones.
+        """
+        site_configuration = {}
+
+        for key in self.SITE_CONFIGURATION_KEYS:
+            value = configuration_helpers.get_value(key)
+
+            if value is not None:
+                site_configuration[key] = value
+
+        return site_configuration
+
+    def set_site_configuration(self, site_configuration):
+        """
+        Read the site configuration values from the ones returned by get_site_configuration,
+        instead of the current site. None restores the current site values.
+        """
+        self.site_configuration = site_configuration
+
+    def _get_site_value(self, name, default=None):
+        """
+        Return the site configuration value of the controller.
+        """
+        if self.site_configuration is None:
+            return configuration_helpers.get_value(name, default)
+
+        return self.site_configuration.get(name, default)
+
+    def get_retry_policy(self, controller_name):
+        """
+        Return the max_retries and countdown used to retry the asynchronous enrollment.
+        """
+        retry_policy = {
+            'max_retries': self.ASYNC_MAX_RETRIES,
+            'countdown': self.ASYNC_RETRY_DELAY,
+        }
+        retry_policy.update(settings.OEE_ASYNC_EXTERNAL_ENROLLMENT_RETRY_POLICIES.get(controller_name, {}))
+
+        return retry_policy
+
     def _get_json_response(self, response):
         """Method that returns a dict. """
         json_response = {'data': ''}
@@ -5,6 +5,7 @@ from collections import OrderedDict
 from django.conf import settings
 
 from openedx_external_enrollments.external_enrollments.base_external_enrollment import BaseExternalEnrollment
+from openedx_external_enrollments.external_enrollments.token_cache import delete_cached_token, get_cached_token
 
 LOG = logging.getLogger(__name__)
 
@@ -20,6 +21,40 @@ class EdxEnterpriseExternalEnrollment(BaseExternalEnrollment):
     def _get_enrollment_headers(self):
         """
         """
+        token = get_cached_token(self._get_token_name(), self._get_access_token)
+
+        if token:
+            headers = {
+                "Accept": "application/json",
+                "Content-Type": "application/json",
+                "Authorization": "{} {}".format(
+                    token["token_type"],
+                    token["access_token"]
+                )
+            }
+            return headers
+
+        return None
+
+    @staticmethod
+    def _get_token_name():
+        """
+        Return the name of the cached edX Enterprise access token.
+        """
+        return 'edx_enterprise.{}'.format(settings.EDX_ENTERPRISE_API_CLIENT_ID)
+
+    def _forget_token(self):
+        """
+        Remove the cached edX Enterprise access token.
+        """
+        delete_cached_token(self._get_token_name())
+
+        return True
+
+    def _get_access_token(self):
+        """
+        Request a new access token using the client credentials grant.
+        """
         try:
             data = OrderedDict(
                 grant_type="client_credentials",
@@ -35,15 +70,7 @@ class EdxEnterpriseExternalEnrollment(BaseExternalEnrollment):
             LOG.error("Failed to get token: %s", str(error))
         else:
             if response.ok:
-                headers = {
-                    "Accept": "application/json",
-                    "Content-Type": "application/json",
-                    "Authorization": "{} {}".format(
-                        response.json()["token_type"],
-                        response.json()["access_token"]
-                    )
-                }
-                return headers
+                return response.json()
 
         return None
 
@@ -1,29 +1,56 @@
 """GreenfigInstanceExternalEnrollment class file."""
-import io
+import hashlib
+import json
 import logging
+import os
+import shutil
+import tempfile
 from datetime import datetime
 
-import requests
 from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.utils import timezone
 from rest_framework import status
 
-from openedx_external_enrollments.edxapp_wrapper.get_site_configuration import configuration_helpers
 from openedx_external_enrollments.edxapp_wrapper.get_student import get_user
 from openedx_external_enrollments.external_enrollments.base_external_enrollment import BaseExternalEnrollment
-from openedx_external_enrollments.models import EnrollmentRequestLog
+from openedx_external_enrollments.external_enrollments.http_session import get_http_session
+from openedx_external_enrollments.models import EnrollmentRequestLog, ExternalEnrollment, ExternalEnrollmentEvent
 
 LOG = logging.getLogger(__name__)
+COMPLETED = True
+UNCOMPLETED = False
+# Size of the blocks hashed by the Dropbox content hash.
+DROPBOX_HASH_BLOCK_SIZE = 4 * 1024 * 1024
+FLUSH_LOCK_CACHE_KEY = 'openedx_external_enrollments.greenfig_flush.lock'
+
+
+class GreenfigTaskExecutionError(Exception):
+    """Exception when the proccess of executing GreenfigInstanceExternalEnrollment.flush_enrollments fails."""
 
 
 class GreenfigInstanceExternalEnrollment(BaseExternalEnrollment):
     """
     GreenfigInstanceExternalEnrollment class.
     """
+    # Every enrollment event is exported as a line, so none of them can be skipped.
+    COALESCE_OUTBOX_EVENTS = False
+    SITE_CONFIGURATION_KEYS = ('DROPBOX_API_URL', 'DROPBOX_API_RPC_URL', 'DROPBOX_FILE_PATH', 'DROPBOX_TOKEN')
 
     def __init__(self):
-        self.DROPBOX_API_URL = configuration_helpers.get_value('DROPBOX_API_URL', 'https://content.dropboxapi.com/2')
-        self.DROPBOX_FILE_PATH = configuration_helpers.get_value('DROPBOX_FILE_PATH', '/courses.txt')
-        self.DROPBOX_TOKEN = configuration_helpers.get_value('DROPBOX_TOKEN', 'token')
+        self._set_dropbox_settings()
+
+    def set_site_configuration(self, site_configuration):
+        super().set_site_configuration(site_configuration)
+        self._set_dropbox_settings()
+
+    def _set_dropbox_settings(self):
+        """Read the dropbox settings from the site configuration, the Django settings being the defaults."""
+        self.DROPBOX_API_URL = self._get_site_value('DROPBOX_API_URL', settings.DROPBOX_API_URL)
+        self.DROPBOX_API_RPC_URL = self._get_site_value('DROPBOX_API_RPC_URL', settings.DROPBOX_API_RPC_URL)
+        self.DROPBOX_FILE_PATH = self._get_site_value('DROPBOX_FILE_PATH', settings.DROPBOX_FILE_PATH)
+        self.DROPBOX_TOKEN = self._get_site_value('DROPBOX_TOKEN', settings.DROPBOX_TOKEN)
 
     def __str__(self):
         return 'greenfig'
@@ -32,19 +59,25 @@ class GreenfigInstanceExternalEnrollment(BaseExternalEnrollment):
         """
         Send updated list of courses to dropbox.
         """
-        return requests.post(
+        return get_http_session(url).post(
             url=url,
             data=json_data,
             headers=headers,
         )
 
-    def _get_enrollment_headers(self):
+    def _get_enrollment_headers(self, rev=None):  # pylint: disable=arguments-differ
         """Returns headers required to upload a file to dropbox."""
-        return {
-            'Authorization': 'Bearer {token}'.format(token=self.DROPBOX_TOKEN),
-            'Content-Type': 'application/octet-stream',
-            'Dropbox-API-Arg': settings.DROPBOX_API_ARG_UPLOAD % self.DROPBOX_FILE_PATH,
-        }
+        return self._get_upload_session_headers(self._get_commit_info(rev))
+
+    def _get_commit_info(self, rev):
+        """
+        Returns the dropbox commit info of the upload. The file is only updated if its revision is
+        still the given one, or only added if it doesn't exist when there is no revision, so a
+        concurrent change makes the upload fail with a conflict instead of being overwritten.
+        """
+        mode = {'.tag': 'update', 'update': rev} if rev else {'.tag': 'add'}
+
+        return json.dumps({'path': self.DROPBOX_FILE_PATH, 'mode': mode, 'autorename': False}, separators=(',', ':'))
 
     def _get_download_headers(self):
         """Returns headers required to download a dropbox file."""
@@ -53,11 +86,342 @@ class GreenfigInstanceExternalEnrollment(BaseExternalEnrollment):
             'Dropbox-API-Arg': settings.DROPBOX_API_ARG_DOWNLOAD % self.DROPBOX_FILE_PATH,
         }
 
+    def _post_enrollment(self, data, course_settings=None):
+        """
+        Save enrollment data as a new ExternalEnrollmentEvent, which is appended to the dropbox
+        file by the periodic flush task. The dropbox settings of the site are stored with the event,
+        since the flush runs outside of any site.
+        """
+        LOG.info('Calling enrollment for [%s] with data: %s', self.__str__(), data)
+        LOG.info('Calling enrollment for [%s] with course settings: %s', self.__str__(), course_settings)
+
+        log_details = {
+            'data': str(data),
+            'course_advanced_settings': course_settings,
+        }
+
+        try:
+            enrollment, _ = ExternalEnrollment.objects.get_or_create(  # pylint: disable=no-member
+                controller_name=str(self),
+                course_shell_id=data.get('course_id'),
+                email=data.get('user_email'),
+                defaults={'meta': []},
+            )
+        except IntegrityError:
+            error_msg = 'Failed to complete enrollment, course_id and user_email can\'t be None.'
+            log_details['status'] = error_msg
+
+            LOG.error(error_msg)
+            EnrollmentRequestLog.objects.create(  # pylint: disable=no-member
+                request_type=str(self),
+                details=log_details,
+            )
+            return error_msg, status.HTTP_400_BAD_REQUEST
+
+        enrollment_data = self._get_enrollment_data(data, course_settings)
+        ExternalEnrollmentEvent.objects.create(  # pylint: disable=no-member
+            enrollment=enrollment,
+            data=enrollment_data,
+            event_time=timezone.now(),
+            site_configuration={key: getattr(self, key) for key in self.SITE_CONFIGURATION_KEYS},
+        )
+        LOG.info('Queued enrollment data for [%s] -- Enrollment data = [%s]', self.__str__(), enrollment_data)
+
+        log_details['status'] = 'queued'
+        log_details['payload'] = enrollment_data
+        EnrollmentRequestLog.objects.create(  # pylint: disable=no-member
+            request_type=str(self),
+            details=log_details,
+        )
+
+        return enrollment_data, status.HTTP_200_OK
+
+    def flush_enrollments(self):
+        """
+        Append the queued enrollment lines to the dropbox files, with a single download and upload
+        per dropbox file for up to OEE_GREENFIG_FLUSH_BATCH_SIZE lines. The remaining lines are
+        sent in the next run.
+
+        The lines are grouped by the dropbox settings stored with their events, so every site
+        uploads its lines to its own file. A cache lock prevents concurrent flushes, e.g. a retry
+        and the periodic run, from appending the same lines twice.
+
+        The file is streamed through a spooled temporary file, so the memory used doesn't depend
+        on the size of the file. It is only downloaded when the local copy is not the current
+        revision, and it is uploaded in update mode, so a concurrent change of the dropbox file
+        makes the flush fail and the lines are sent again in the next run.
+
+        :return: tuple (boolean, str). (True, 'successful-message') if the method executes properly,
+        otherwise (False, 'error-message')
+        """
+        if not cache.add(FLUSH_LOCK_CACHE_KEY, True, settings.OEE_GREENFIG_FLUSH_LOCK_TIMEOUT):
+            LOG.info('Another flush of the dropbox file is running.')
+            return COMPLETED, 'flush_enrollments is already running'
+
+        site_configuration = self.site_configuration
+
+        try:
+            return self._flush_pending_events()
+        finally:
+            self.set_site_configuration(site_configuration)
+            cache.delete(FLUSH_LOCK_CACHE_KEY)
+
+    def _flush_pending_events(self):
+        """
+        Append the pending lines of every dropbox file, see flush_enrollments.
+        """
+        pending_events = ExternalEnrollmentEvent.objects.filter(  # pylint: disable=no-member
+            enrollment__controller_name=str(self),
+            uploaded_at__isnull=True,
+        ).order_by('event_time', 'id').values_list(
+            'id',
+            'data',
+            'site_configuration',
+        )[:settings.OEE_GREENFIG_FLUSH_BATCH_SIZE]
+        events_by_file = {}
+
+        for event_id, data, site_configuration in pending_events:
+            file_key = json.dumps(site_configuration or {}, sort_keys=True)
+            events_by_file.setdefault(file_key, []).append((event_id, data))
+
+        if not events_by_file:
+            LOG.info('There are no new enrollments to update the dropbox file.')
+            return COMPLETED, 'flush_enrollments completed'
+
+        errors = []
+
+        for file_key, events in events_by_file.items():
+            self.set_site_configuration(json.loads(file_key))
+
+            try:
+                with tempfile.SpooledTemporaryFile(max_size=settings.DROPBOX_UPLOAD_CHUNK_SIZE) as file_object:
+                    rev = self._read_course_list(file_object)
+                    file_object.write(''.join(data for _, data in events).encode('utf-8'))
+                    metadata = self._upload_course_list(file_object, rev)
+                    self._save_local_copy(file_object, metadata)
+            except Exception as error:  # pylint: disable=broad-except
+                error_msg = 'Failed to update the dropbox course list [{}]. Reason: {}'.format(
+                    self.DROPBOX_FILE_PATH,
+                    str(error),
+                )
+                LOG.error(error_msg)
+                EnrollmentRequestLog.objects.create(  # pylint: disable=no-member
+                    request_type=str(self),
+                    details={'response': {'error': error_msg}},
+                )
+                errors.append(error_msg)
+                continue
+
+            ExternalEnrollmentEvent.objects.filter(  # pylint: disable=no-member
+                id__in=[event_id for event_id, _ in events],
+            ).update(uploaded_at=timezone.now())
+            LOG.info(
+                '%s enrollments were appended to the dropbox file [%s] for [%s]',
+                len(events),
+                self.DROPBOX_FILE_PATH,
+                self.__str__(),
+            )
+
+        if errors:
+            return UNCOMPLETED, ' '.join(errors)
+
+        return COMPLETED, 'flush_enrollments completed'
+
+    def _read_course_list(self, file_object):
+        """
+        Write the current content of the dropbox file into the given file object.
+
+        The local copy is used when its revision and content hash match the dropbox ones,
+        otherwise the file is downloaded.
+
+        :return: the revision of the dropbox file, None if it doesn't exist yet.
+        """
+        metadata = self._get_course_list_metadata()
+
+        if not metadata:
+            return None
+
+        if not self._read_local_copy(file_object, metadata):
+            self._download_course_list(file_object)
+
+        return metadata['rev']
+
+    def _get_course_list_metadata(self):
+        """Returns the dropbox metadata of the file, None if it doesn't exist."""
+        url = '{root_url}{path}'.format(root_url=self.DROPBOX_API_RPC_URL, path=settings.DROPBOX_API_GET_METADATA_URL)
+        response = get_http_session(url).post(
+            url,
+            json={'path': self.DROPBOX_FILE_PATH},
+            headers={'Authorization': 'Bearer {token}'.format(token=self.DROPBOX_TOKEN)},
+        )
+
+        if response.status_code == status.HTTP_409_CONFLICT and 'not_found' in response.text:
+            return None
+
+        response.raise_for_status()
+
+        return response.json()
+
+    def _get_local_copy_path(self):
+        """Returns the path of the local copy of the dropbox file, None if the local copy is disabled."""
+        if not settings.DROPBOX_LOCAL_COPY_DIR:
+            return None
+
+        return os.path.join(
+            settings.DROPBOX_LOCAL_COPY_DIR,
+            hashlib.sha1(self.DROPBOX_FILE_PATH.encode('utf-8')).hexdigest(),
+        )
+
+    def _read_local_copy(self, file_object, metadata):
+        """
+        Write the local copy into the given file object if it is the revision of the metadata.
+
+        :return: whether the local copy was used.
+        """
+        local_copy_path = self._get_local_copy_path()
+
+        if not local_copy_path:
+            return False
+
+        try:
+            with open('{}.json'.format(local_copy_path), 'r') as metadata_file:
+                local_metadata = json.load(metadata_file)
+
+            if local_metadata.get('rev') != metadata.get('rev'):
+                return False
+
+            with open(local_copy_path, 'rb') as local_copy:
+                shutil.copyfileobj(local_copy, file_object)
+        except (OSError, ValueError):
+            return False
+
+        if self._get_content_hash(file_object) != metadata.get('content_hash'):
+            LOG.warning('The local copy of the dropbox file [%s] is corrupted.', self.DROPBOX_FILE_PATH)
+            file_object.seek(0)
+            file_object.truncate()
+            return False
+
+        file_object.seek(0, os.SEEK_END)
+        LOG.info('Using the local copy of the dropbox file [%s], rev %s', self.DROPBOX_FILE_PATH, metadata['rev'])
+
+        return True
+
+    def _save_local_copy(self, file_object, metadata):
+        """Store the uploaded content and its metadata as the local copy of the dropbox file."""
+        local_copy_path = self._get_local_copy_path()
+
+        if not local_copy_path:
+            return
+
+        try:
+            os.makedirs(settings.DROPBOX_LOCAL_COPY_DIR, exist_ok=True)
+            file_object.seek(0)
+
+            with open('{}.tmp'.format(local_copy_path), 'wb') as local_copy:
+                shutil.copyfileobj(file_object, local_copy)
+
+            os.replace('{}.tmp'.format(local_copy_path), local_copy_path)
+
+            with open('{}.json'.format(local_copy_path), 'w') as metadata_file:
+                json.dump({'rev': metadata.get('rev'), 'content_hash': metadata.get('content_hash')}, metadata_file)
+        except OSError as error:
+            LOG.warning('Failed to save the local copy of the dropbox file. Reason: %s', str(error))
+
+    @staticmethod
+    def _get_content_hash(file_object):
+        """Returns the dropbox content hash of the file content: the SHA-256 of the SHA-256 of every 4MB block."""
+        file_object.seek(0)
+        blocks_hash = hashlib.sha256()
+
+        for block in iter(lambda: file_object.read(DROPBOX_HASH_BLOCK_SIZE), b''):
+            blocks_hash.update(hashlib.sha256(block).digest())
+
+        return blocks_hash.hexdigest()
+
+    def _download_course_list(self, file_object):
+        """Download the dropbox file into the given file object, DROPBOX_UPLOAD_CHUNK_SIZE bytes at a time."""
+        url = '{root_url}{path}'.format(root_url=self.DROPBOX_API_URL, path=settings.DROPBOX_API_DOWNLOAD_URL)
+        response = get_http_session(url).post(url, headers=self._get_download_headers(), stream=True)
+        response.raise_for_status()
+
+        for chunk in response.iter_content(chunk_size=settings.DROPBOX_UPLOAD_CHUNK_SIZE):
+            file_object.write(chunk)
+
+    def _upload_course_list(self, file_object, rev=None):
+        """
+        Upload the content of the file object to the dropbox file, reading one chunk at a time.
+
+        Content that fits in a single chunk is sent to /files/upload. Bigger content is sent with
+        an upload session, since single uploads are limited in size: the first chunk starts the
+        session, the following ones are appended and the last one finishes it.
+
+        :param: rev (str). Revision of the dropbox file that is updated, None if it doesn't exist.
+        :return: the dropbox metadata of the uploaded file.
+        """
+        chunk_size = settings.DROPBOX_UPLOAD_CHUNK_SIZE
+        file_object.seek(0)
+        chunk = file_object.read(chunk_size)
+        next_chunk = file_object.read(chunk_size)
+
+        if not next_chunk:
+            return self._post_dropbox(self._get_enrollment_url(None), self._get_enrollment_headers(rev), chunk).json()
+
+        response = self._post_dropbox(
+            '{}{}'.format(self.DROPBOX_API_URL, settings.DROPBOX_API_UPLOAD_SESSION_START_URL),
+            self._get_upload_session_headers('{"close":false}'),
+            chunk,
+        )
+        session_id = response.json()['session_id']
+        offset = len(chunk)
+        chunk, next_chunk = next_chunk, file_object.read(chunk_size)
+
+        while next_chunk:
+            self._post_dropbox(
+                '{}{}'.format(self.DROPBOX_API_URL, settings.DROPBOX_API_UPLOAD_SESSION_APPEND_URL),
+                self._get_upload_session_headers(
+                    '{{"cursor":{},"close":false}}'.format(self._get_upload_session_cursor(session_id, offset)),
+                ),
+                chunk,
+            )
+            offset += len(chunk)
+            chunk, next_chunk = next_chunk, file_object.read(chunk_size)
+
+        return self._post_dropbox(
+            '{}{}'.format(self.DROPBOX_API_URL, settings.DROPBOX_API_UPLOAD_SESSION_FINISH_URL),
+            self._get_upload_session_headers(
+                '{{"cursor":{},"commit":{}}}'.format(
+                    self._get_upload_session_cursor(session_id, offset),
+                    self._get_commit_info(rev),
+                ),
+            ),
+            chunk,
+        ).json()
+
+    def _post_dropbox(self, url, headers, content):
+        """Send the content to the dropbox url and raise an HTTPError if the request fails."""
+        response = self._execute_post(url=url, headers=headers, json_data=content)
+        response.raise_for_status()
+
+        return response
+
+    def _get_upload_session_headers(self, api_arg):
+        """Returns headers required to send a chunk of an upload session."""
+        return {
+            'Authorization': 'Bearer {token}'.format(token=self.DROPBOX_TOKEN),
+            'Content-Type': 'application/octet-stream',
+            'Dropbox-API-Arg': api_arg,
+        }
+
+    @staticmethod
+    def _get_upload_session_cursor(session_id, offset):
+        """Returns the cursor of the upload session, offset being the number of bytes already uploaded."""
+        return json.dumps({'session_id': session_id, 'offset': offset}, separators=(',', ':'))
+
     def _get_enrollment_data(self, data, course_settings):
-        """Returns a file in memory with a new or updated enroll."""
+        """Returns the dropbox file line of a new or updated enroll."""
         user, _ = get_user(email=data.get('user_email'))
-        dropbox_file = self._get_course_list(course_settings).text
-        enrollment_data = u'{date}, {fullname}, {first_name}, {last_name}, {email}, {course_id}, {enrolled}\n'.format(
+
+        return u'{date}, {fullname}, {first_name}, {last_name}, {email}, {course_id}, {enrolled}\n'.format(
             date=datetime.now().strftime(settings.DROPBOX_DATE_FORMAT),
             fullname=user.profile.name,
             first_name=user.first_name,
@@ -66,35 +430,7 @@ class GreenfigInstanceExternalEnrollment(BaseExternalEnrollment):
             course_id=course_settings.get('external_course_run_id'),
             enrolled=str(data.get('is_active')).lower(),
         )
-        dropbox_file += enrollment_data
-        temp_file = io.StringIO()
-        temp_file.write(dropbox_file)
-        temp_file.seek(0)
-
-        return temp_file.getvalue()
 
     def _get_enrollment_url(self, course_settings):
         """Gets dropbox upload file url."""
         return '{root_url}{path}'.format(root_url=self.DROPBOX_API_URL, path=settings.DROPBOX_API_UPLOAD_URL)
-
-    def _get_course_list(self, course_settings):
-        """Gets the enrollment list."""
-        url = '{root_url}{path}'.format(root_url=self.DROPBOX_API_URL, path=settings.DROPBOX_API_DOWNLOAD_URL)
-        log_details = {
-            'url': url,
-            'course_advanced_settings': course_settings,
-        }
-
-        try:
-            response = requests.post(url, headers=self._get_download_headers())
-        except Exception as error:  # pylint: disable=broad-except
-            LOG.error('Failed to download course list. Reason: %s', str(error))
-            log_details['response'] = {'error': 'Failed to download dropbox course list. Reason: ' + str(error)}
-            EnrollmentRequestLog.objects.create(  # pylint: disable=no-member
-                request_type=str(self),
-                details=log_details,
-            )
-
-            return str(error), status.HTTP_500_INTERNAL_SERVER_ERROR
-        else:
-            return response
@@ -0,0 +1,64 @@
+"""Shared HTTP sessions for the external enrollment controllers."""
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+_SESSIONS_PID = None
+
+
+def get_http_session(url):
+    """
+    Return the pooled requests session for the host of the given url.
+
+    Sessions are kept per process and per host, so the connections opened against a
+    partner API are reused by the following enrollments instead of paying a new
+    TCP/TLS handshake every time. The process id is checked in order to not share
+    connections between Celery prefork workers.
+
+    Args:
+        url: The URL the request will be sent to.
+    Returns:
+        requests.Session instance.
+    """
+    global _SESSIONS_PID
+
+    url_parts = urlsplit(url)
+    key = (url_parts.scheme, url_parts.netloc)
+
+    with _SESSIONS_LOCK:
+        if _SESSIONS_PID != os.getpid():
+            _SESSIONS.clear()
+            _SESSIONS_PID = os.getpid()
+
+        session = _SESSIONS.get(key)
+
+        if session is None:
+            session = _build_session()
+            _SESSIONS[key] = session
+
+    return session
+
+
+def _build_session():
+    """
+    Return a new requests session with the pool size and keep-alive behavior defined in settings.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=settings.OEE_HTTP_POOL_CONNECTIONS,
+        pool_maxsize=settings.OEE_HTTP_POOL_MAXSIZE,
+        pool_block=settings.OEE_HTTP_POOL_BLOCK,
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    if not settings.OEE_HTTP_KEEP_ALIVE:
+        session.headers['Connection'] = 'close'
+
+    return session
@@ -1,25 +1,39 @@
 """ICCExternalEnrollment class file."""
+import hashlib
 import logging
 from uuid import uuid4
 
-import requests
 import xmltodict
 from django.conf import settings
+from django.core.cache import cache
 
-from openedx_external_enrollments.edxapp_wrapper.get_site_configuration import configuration_helpers
 from openedx_external_enrollments.edxapp_wrapper.get_student import get_user
 from openedx_external_enrollments.external_enrollments.base_external_enrollment import BaseExternalEnrollment
-from openedx_external_enrollments.models import EnrollmentRequestLog
+from openedx_external_enrollments.external_enrollments.http_session import get_http_session
+from openedx_external_enrollments.models import EnrollmentRequestLog, ICCUser
 
 LOG = logging.getLogger(__name__)
+ICC_USER_CACHE_KEY_PREFIX = 'openedx_external_enrollments.icc_user'
+# Format of the ICC web services responses.
+ICC_REST_FORMAT = 'json'
+# Debug info of the core_user_create_users error raised for a taken username.
+ICC_DUPLICATED_USERNAME_ERROR = 'Username already exists'
+
+
+class ICCResponseError(Exception):
+    """
+    ICC responded with an error, or with a response that can't be understood.
+    """
 
 
 class ICCExternalEnrollment(BaseExternalEnrollment):
     """
     ICCExternalEnrollment class.
     """
-    USER_CREATION_MAX_RETRIES = 5
+    # Number of suffixed usernames tried when the username of the learner is taken in ICC.
+    USERNAME_SUFFIXED_CANDIDATES = 5
     USERNAME_SUFFIX_LENGTH = 5
+    SITE_CONFIGURATION_KEYS = ('ICC_AUTH_METHOD_OVERRIDE', 'DEFAULT_USER_TESTING_PASSWORD')
 
     def __str__(self):
         return 'ICC'
@@ -27,18 +41,76 @@ class ICCExternalEnrollment(BaseExternalEnrollment):
     def _execute_post(self, url, data=None, headers=None, json_data=None):
         """
         Execute post request to achieve the ICC external enrollment.
+
+        When ICC rejects the enrollment, the stored ICC user is forgotten, so the next attempt
+        looks it up again in case it was removed from ICC.
         """
-        return requests.post(
+        response = get_http_session(url).post(
             url=url,
             data=json_data,
         )
 
+        if json_data and self._get_icc_response_error(response):
+            self._forget_icc_user(json_data.get('enrolments[0][userid]'))
+
+        return response
+
+    def _is_successful_response(self, response):
+        """
+        ICC answers the web service exceptions with a 200 status, so the body is checked too.
+        """
+        return response.ok and not self._get_icc_response_error(response)
+
     def _get_enrollment_headers(self):
         """
         Method that returns None by default, ICC integration does not require headers.
         """
         return
 
+    def run_enrollments(self, enrollments):
+        """
+        Execute the enrollments with bulk requests. The unknown ICC users are looked up with
+        core_user_get_users_by_field and the missing ones created with core_user_create_users,
+        then the learners are enrolled with enrol_manual_enrol_users, each request carrying up
+        to OEE_ICC_BULK_REQUEST_SIZE learners.
+
+        Enrollments that can't be sent in bulk, or whose bulk request fails, are executed one
+        by one, so an invalid learner doesn't fail the rest of the batch.
+        """
+        results = [None] * len(enrollments)
+        icc_users = self._get_icc_users([data.get('user_email') for data, _ in enrollments])
+        bulk_enrollments = []
+
+        for index, (data, course_settings) in enumerate(enrollments):
+            icc_user = icc_users.get((data.get('user_email') or '').lower())
+            course_id = (course_settings or {}).get('external_course_run_id')
+
+            if icc_user and course_id:
+                bulk_enrollments.append((index, icc_user['id'], course_id))
+            else:
+                results[index] = self.run_enrollment(data, course_settings)
+
+        for batch in self._get_bulk_batches(bulk_enrollments):
+            request_data = {}
+
+            for position, (_, icc_user_id, course_id) in enumerate(batch):
+                request_data.update({
+                    'enrolments[{}][roleid]'.format(position): settings.ICC_LEARNER_ROLE_ID,
+                    'enrolments[{}][userid]'.format(position): icc_user_id,
+                    'enrolments[{}][courseid]'.format(position): course_id,
+                })
+
+            try:
+                self._call_icc(settings.ICC_ENROLLMENT_API_FUNCTION, request_data)
+            except ICCResponseError:
+                for index, _, _ in batch:
+                    results[index] = self.run_enrollment(*enrollments[index])
+            else:
+                for index, _, _ in batch:
+                    results[index] = (None, True)
+
+        return results
+
     def _get_enrollment_data(self, data, course_settings):
         """
         Method that provide the relevant data for the enrollment.
@@ -52,6 +124,7 @@ class ICCExternalEnrollment(BaseExternalEnrollment):
             enrollment_data = {
                 'wstoken': settings.ICC_API_TOKEN,
                 'wsfunction': settings.ICC_ENROLLMENT_API_FUNCTION,
+                'moodlewsrestformat': ICC_REST_FORMAT,
                 'enrolments[0][roleid]': settings.ICC_LEARNER_ROLE_ID,
                 'enrolments[0][userid]': self._get_icc_user(data).get('id'),
                 'enrolments[0][courseid]': course_settings.get('external_course_run_id'),
@@ -77,20 +150,28 @@ class ICCExternalEnrollment(BaseExternalEnrollment):
         """
         Method that look for the user in ICC database through the API, if the user is not
         found then it calls create method.
+
+        The ICC user of the learner is stored after the first lookup, so the API is only
+        called for learners that were never enrolled before.
         """
+        icc_user = self._get_stored_icc_user(data.get('user_email'))
+
+        if icc_user:
+            return icc_user
+
         log_details = {
             'url': settings.ICC_API_TOKEN,
         }
-        icc_user = {}
 
         try:
             request_data = {
                 'wstoken': settings.ICC_API_TOKEN,
                 'wsfunction': settings.ICC_GET_USER_API_FUNCTION,
+                'moodlewsrestformat': ICC_REST_FORMAT,
                 'criteria[0][key]': 'email',
                 'criteria[0][value]': data.get('user_email'),
             }
-            response = requests.post(
+            response = get_http_session(settings.ICC_BASE_URL).post(
                 url=settings.ICC_BASE_URL,
                 data=request_data,
             )
@@ -105,45 +186,278 @@ class ICCExternalEnrollment(BaseExternalEnrollment):
                 details=log_details,
             )
         else:
-            icc_user = self._get_icc_user_from_xml_response(response, 'get_user')
+            try:
+                icc_user = self._get_icc_user_from_response(response, 'get_user')
+            except ICCResponseError as error:
+                # The user is not created, since it is unknown whether it exists.
+                log_details['request_payload']['wstoken'] = 'icc-api-token'
+                log_details['response'] = {'error': 'Failed to retrieve ICC user. Reason: %s' % str(error)}
+
+                LOG.error('Failed to retrieve ICC user. Reason: %s', str(error))
+                EnrollmentRequestLog.objects.create(  # pylint: disable=no-member
+                    request_type=str(self),
+                    details=log_details,
+                )
+                return icc_user
+
             icc_user = self._validate_icc_user(data, icc_user)
+            self._store_icc_user(data.get('user_email'), icc_user)
 
         return icc_user
 
-    def _create_icc_user(self, data, duplicated_username):
+    def _get_stored_icc_user(self, email):
         """
-        Method that creates a user in the ICC database based in the current user logged in data.
-        Also takes care of duplicated usernames.
+        Return the stored ICC user of the email from the cache or the ICCUser table, an empty dict if there is none.
         """
-        log_details = {
-            'url': settings.ICC_CREATE_USER_API_FUNCTION,
+        if not email:
+            return {}
+
+        cache_key = self._get_icc_user_cache_key(email)
+        icc_user = cache.get(cache_key)
+
+        if icc_user is None:
+            stored_user = ICCUser.objects.filter(  # pylint: disable=no-member
+                email=email.lower(),
+            ).values('icc_user_id', 'username').first()
+
+            if not stored_user:
+                return {}
+
+            icc_user = {'id': stored_user['icc_user_id'], 'username': stored_user['username']}
+            cache.set(cache_key, icc_user, settings.OEE_ICC_USER_CACHE_TIMEOUT)
+
+        return icc_user
+
+    def _store_icc_user(self, email, icc_user):
+        """
+        Store the ICC user of the email in the ICCUser table and the cache.
+        """
+        if not email or not icc_user or not icc_user.get('id'):
+            return
+
+        ICCUser.objects.update_or_create(  # pylint: disable=no-member
+            email=email.lower(),
+            defaults={
+                'icc_user_id': icc_user['id'],
+                'username': icc_user.get('username') or '',
+            },
+        )
+        cache.set(self._get_icc_user_cache_key(email), icc_user, settings.OEE_ICC_USER_CACHE_TIMEOUT)
+
+    def _forget_icc_user(self, icc_user_id):
+        """
+        Remove the stored ICC users with the given id from the ICCUser table and the cache.
+        """
+        if not icc_user_id:
+            return
+
+        stored_users = ICCUser.objects.filter(icc_user_id=icc_user_id)  # pylint: disable=no-member
+        cache.delete_many([
+            self._get_icc_user_cache_key(email) for email in stored_users.values_list('email', flat=True)
+        ])
+        stored_users.delete()
+
+    def _get_icc_users(self, emails):
+        """
+        Return the ICC users of the emails as a dict by lowercase email. The stored users are read
+        from the cache and the ICCUser table, the rest are looked up and created in bulk.
+        Emails whose ICC user couldn't be retrieved are not included, the users of a batch whose
+        lookup fails are not created, since it is unknown whether they exist.
+        """
+        emails = {email.lower() for email in emails if email}
+        cache_keys = {self._get_icc_user_cache_key(email): email for email in emails}
+        icc_users = {
+            cache_keys[cache_key]: icc_user
+            for cache_key, icc_user in cache.get_many(list(cache_keys)).items()
         }
-        icc_user = {}
+        stored_users = ICCUser.objects.filter(  # pylint: disable=no-member
+            email__in=emails - set(icc_users),
+        ).values('email', 'icc_user_id', 'username')
+        cached_users = {}
+
+        for stored_user in stored_users:
+            icc_user = {'id': stored_user['icc_user_id'], 'username': stored_user['username']}
+            icc_users[stored_user['email']] = icc_user
+            cached_users[self._get_icc_user_cache_key(stored_user['email'])] = icc_user
+
+        cache.set_many(cached_users, settings.OEE_ICC_USER_CACHE_TIMEOUT)
+
+        for batch in self._get_bulk_batches(sorted(emails - set(icc_users))):
+            new_users = self._find_icc_users(batch)
+
+            if new_users is None:
+                continue
+
+            new_users.update(self._create_icc_users([email for email in batch if email not in new_users]))
+
+            for email, icc_user in new_users.items():
+                self._store_icc_user(email, icc_user)
+
+            icc_users.update(new_users)
+
+        return icc_users
+
+    def _find_icc_users(self, emails):
+        """
+        Look up the ICC users of the emails with a single request.
+        Returns a dict by lowercase email, None if the request fails.
+        """
+        if not emails:
+            return {}
 
         try:
-            user, _ = get_user(email=data.get('user_email'))
-            username = user.username.lower()
-            request_data = {
-                'wstoken': settings.ICC_API_TOKEN,
-                'wsfunction': settings.ICC_CREATE_USER_API_FUNCTION,
-                'users[0][username]': username + self._get_random_string(
-                    self.USERNAME_SUFFIX_LENGTH) if duplicated_username else username,
-                'users[0][password]': self._get_random_string(settings.ICC_HASH_LENGTH),
-                'users[0][firstname]': user.first_name,
-                'users[0][lastname]': user.last_name,
-                'users[0][email]': user.email,
-                'users[0][auth]': configuration_helpers.get_value(
-                    'ICC_AUTH_METHOD_OVERRIDE',
-                    settings.ICC_AUTH_METHOD,
+            users = self._call_icc(
+                settings.ICC_GET_USERS_BY_FIELD_API_FUNCTION,
+                dict(
+                    {'values[{}]'.format(position): email for position, email in enumerate(emails)},
+                    field='email',
                 ),
+            )
+            return {
+                user['email'].lower(): {'id': str(user['id']), 'username': user.get('username')}
+                for user in users
             }
-            log_details['request_payload'] = request_data
-            response = requests.post(
+        except (ICCResponseError, AttributeError, TypeError, KeyError):
+            return None
+
+    def _create_icc_users(self, emails):
+        """
+        Create the ICC users of the emails with a single request.
+        Returns a dict by lowercase email, empty if the request fails.
+        """
+        request_data = {}
+        created_emails = []
+        users = []
+
+        for email in emails:
+            try:
+                user, _ = get_user(email=email)
+            except Exception as error:  # pylint: disable=broad-except
+                LOG.error('Failed to create ICC user. Reason: %s', str(error))
+                continue
+
+            users.append((email, user))
+
+        usernames = self._get_available_usernames([user for _, user in users])
+
+        for (email, user), username in zip(users, usernames):
+            if not username:
+                LOG.error('Failed to create ICC user. Reason: all the usernames of %s are taken', email)
+                continue
+
+            request_data.update(self._get_icc_user_fields(user, len(created_emails), username))
+            created_emails.append(email)
+
+        if not created_emails:
+            return {}
+
+        try:
+            users = self._call_icc(settings.ICC_CREATE_USER_API_FUNCTION, request_data)
+            return {
+                email: {'id': str(user['id']), 'username': user.get('username')}
+                for email, user in zip(created_emails, users)
+            }
+        except (ICCResponseError, AttributeError, TypeError, KeyError):
+            return {}
+
+    def _call_icc(self, wsfunction, request_data):
+        """
+        Call the ICC web service function and return its decoded JSON response.
+
+        Raises:
+            ICCResponseError: the request failed or ICC responded with an error.
+        """
+        request_data = dict(
+            request_data,
+            wstoken=settings.ICC_API_TOKEN,
+            wsfunction=wsfunction,
+            moodlewsrestformat=ICC_REST_FORMAT,
+        )
+        log_details = {
+            'url': settings.ICC_BASE_URL,
+            'request_payload': self._get_loggable_request_data(request_data),
+        }
+        content = None
+
+        try:
+            response = get_http_session(settings.ICC_BASE_URL).post(
                 url=settings.ICC_BASE_URL,
                 data=request_data,
             )
+            response.raise_for_status()
+            content = response.json()
+            error = self._get_icc_response_error(response, content)
+        except Exception as request_error:  # pylint: disable=broad-except
+            error = str(request_error)
+
+        log_details['response'] = {'error': error} if error else content
+        EnrollmentRequestLog.objects.create(  # pylint: disable=no-member
+            request_type=str(self),
+            details=log_details,
+        )
+
+        if error:
+            LOG.error('ICC %s request failed. Reason: %s', wsfunction, error)
+            raise ICCResponseError(error)
+
+        return content
+
+    @staticmethod
+    def _get_bulk_batches(items):
+        """
+        Split the items in lists of OEE_ICC_BULK_REQUEST_SIZE items.
+        """
+        batch_size = settings.OEE_ICC_BULK_REQUEST_SIZE
+
+        return [items[start:start + batch_size] for start in range(0, len(items), batch_size)]
+
+    @staticmethod
+    def _get_icc_user_cache_key(email):
+        """
+        Return the cache key of the ICC user of the email.
+        """
+        return '{}.{}'.format(ICC_USER_CACHE_KEY_PREFIX, hashlib.sha1(email.lower().encode('utf-8')).hexdigest())
+
+    def _create_icc_user(self, data):
+        """
+        Method that creates a user in the ICC database based in the current user logged in data.
+
+        The first available username candidate is used. When ICC still rejects it as duplicated,
+        e.g. core_user_get_users_by_field is not enabled for the token, the next candidates are tried.
+        """
+        log_details = {
+            'url': settings.ICC_CREATE_USER_API_FUNCTION,
+            'request_payload': {},
+        }
+        icc_user = {}
+
+        try:
+            user, _ = get_user(email=data.get('user_email'))
+            username = self._get_available_usernames([user])[0]
+
+            if not username:
+                raise ICCResponseError('all the usernames of {} are taken'.format(user.email))
+
+            candidates = self._get_username_candidates(user)
+
+            for username in candidates[candidates.index(username):]:
+                request_data = dict(
+                    self._get_icc_user_fields(user, 0, username),
+                    wstoken=settings.ICC_API_TOKEN,
+                    wsfunction=settings.ICC_CREATE_USER_API_FUNCTION,
+                    moodlewsrestformat=ICC_REST_FORMAT,
+                )
+                log_details['request_payload'] = self._get_loggable_request_data(request_data)
+                response = get_http_session(settings.ICC_BASE_URL).post(
+                    url=settings.ICC_BASE_URL,
+                    data=request_data,
+                )
+
+                if not self._is_duplicated_username_error(response):
+                    break
+
+                LOG.warning('The ICC username %s is taken, trying the next candidate.', username)
         except Exception as error:  # pylint: disable=broad-except
-            log_details['request_payload']['wstoken'] = 'icc-api-token'
             log_details['response'] = {'error': 'Failed to create ICC user. Reason: %s' % str(error)}
 
             LOG.error('Failed to create ICC user. Reason: %s', str(error))
@@ -152,24 +466,156 @@ class ICCExternalEnrollment(BaseExternalEnrollment):
                 details=log_details,
             )
         else:
-            icc_user = self._get_icc_user_from_xml_response(response, 'create_user')
+            try:
+                icc_user = self._get_icc_user_from_response(response, 'create_user')
+            except ICCResponseError as error:
+                LOG.error('Failed to create ICC user. Reason: %s', str(error))
 
         return icc_user
 
+    @staticmethod
+    def _get_loggable_request_data(request_data):
+        """
+        Return the request data without the API token nor the user passwords, so it can be logged.
+        """
+        return {
+            key: value for key, value in dict(request_data, wstoken='icc-api-token').items()
+            if not key.endswith('[password]')
+        }
+
+    def _get_icc_user_fields(self, user, position, username):
+        """
+        Return the core_user_create_users fields of the user at the given position of the request.
+        """
+        return {
+            'users[{}][username]'.format(position): username,
+            'users[{}][password]'.format(position): self._get_random_string(settings.ICC_HASH_LENGTH),
+            'users[{}][firstname]'.format(position): user.first_name,
+            'users[{}][lastname]'.format(position): user.last_name,
+            'users[{}][email]'.format(position): user.email,
+            'users[{}][auth]'.format(position): self._get_site_value(
+                'ICC_AUTH_METHOD_OVERRIDE',
+                settings.ICC_AUTH_METHOD,
+            ),
+        }
+
     def _validate_icc_user(self, data, icc_user):
         """
-        Ensure the user creation avoiding failure for username duplicates.
+        Create the ICC user when it was not found.
+        """
+        if not icc_user:
+            icc_user = self._create_icc_user(data)
+
+        return icc_user
+
+    def _get_available_usernames(self, users):
+        """
+        Return the first username candidate of every user that is not taken, or None when all of them are.
+
+        The taken candidates are read from the ICCUser table and from ICC with a single
+        core_user_get_users_by_field request, so no user creation fails for a duplicated username.
+        When that request fails, only the ICCUser table is used.
+        """
+        candidates = [self._get_username_candidates(user) for user in users]
+        all_candidates = sorted({candidate for user_candidates in candidates for candidate in user_candidates})
+        taken_usernames = set(
+            ICCUser.objects.filter(  # pylint: disable=no-member
+                username__in=all_candidates,
+            ).values_list('username', flat=True)
+        )
+
+        try:
+            icc_users = self._call_icc(
+                settings.ICC_GET_USERS_BY_FIELD_API_FUNCTION,
+                dict(
+                    {'values[{}]'.format(position): candidate for position, candidate in enumerate(all_candidates)},
+                    field='username',
+                ),
+            )
+            taken_usernames.update(icc_user['username'].lower() for icc_user in icc_users)
+        except (ICCResponseError, AttributeError, TypeError, KeyError) as error:
+            LOG.warning('Failed to check the taken ICC usernames. Reason: %s', str(error))
+
+        usernames = []
+
+        for user_candidates in candidates:
+            username = next((candidate for candidate in user_candidates if candidate not in taken_usernames), None)
+            taken_usernames.add(username)
+            usernames.append(username)
+
+        return usernames
+
+    def _get_username_candidates(self, user):
+        """
+        Return the usernames that can be used for the user in ICC, by preference: the platform
+        username, then the username with suffixes derived from the email, so they are always the same.
+        """
+        username = user.username.lower()
+        suffixes = [
+            hashlib.sha1('{}:{}'.format(user.email.lower(), attempt).encode('utf-8')).hexdigest()
+            for attempt in range(self.USERNAME_SUFFIXED_CANDIDATES)
+        ]
+
+        return [username] + [username + suffix[:self.USERNAME_SUFFIX_LENGTH] for suffix in suffixes]
+
+    def _get_icc_user_from_response(self, response, method_type):
+        """
+        Return the id and username of the user in a get_user or create_user response, or an
+        empty dict when no user was found. Responses that are not JSON are parsed as XML.
+
+        Raises:
+            ICCResponseError: ICC responded with an error or an unexpected response.
         """
-        duplicated_username = False
-        call_counter = 0
+        try:
+            content = response.json()
+        except ValueError:
+            return self._get_icc_user_from_xml_response(response, method_type)
+
+        error = self._get_icc_response_error(response, content)
 
-        while not icc_user and call_counter <= self.USER_CREATION_MAX_RETRIES:
-            icc_user = self._create_icc_user(data, duplicated_username)
-            duplicated_username = True
-            call_counter += 1
+        if error:
+            raise ICCResponseError(error)
+
+        try:
+            users = content if method_type == 'create_user' else content['users']
+            user = users[0] if users else {}
+            icc_user = {'id': str(user['id']), 'username': user.get('username')} if user else {}
+        except (AttributeError, TypeError, KeyError, IndexError) as parse_error:
+            raise ICCResponseError('Unexpected {} response: {}'.format(method_type, parse_error))
 
         return icc_user
 
+    @staticmethod
+    def _is_duplicated_username_error(response):
+        """
+        Return whether ICC rejected the user creation because the username is taken.
+        """
+        try:
+            content = response.json()
+        except ValueError:
+            return ICC_DUPLICATED_USERNAME_ERROR in response.text
+
+        if not isinstance(content, dict) or not content.get('exception'):
+            return False
+
+        return ICC_DUPLICATED_USERNAME_ERROR in '{} {}'.format(content.get('message'), content.get('debuginfo'))
+
+    @staticmethod
+    def _get_icc_response_error(response, content=None):
+        """
+        Return the error message of an ICC response, None if it is not an error.
+        """
+        if content is None:
+            try:
+                content = response.json()
+            except ValueError:
+                return 'XML exception' if 'EXCEPTION' in response.text else None
+
+        if isinstance(content, dict) and content.get('exception'):
+            return '{}: {}'.format(content.get('errorcode'), content.get('message'))
+
+        return None
+
     def _get_icc_user_from_xml_response(self, response, method_type):
         """
         Method that receives a xml response and convert it to json object and returns it.
@@ -199,11 +645,6 @@ class ICCExternalEnrollment(BaseExternalEnrollment):
 
     def _get_random_string(self, length):
         """
-        Method that generates and return a random string.
+        Method that generates and return a random string, the DEFAULT_USER_TESTING_PASSWORD if it is set.
         """
-        random_string = (
-            uuid4().hex[:length] if length == self.USERNAME_SUFFIX_LENGTH else
-            configuration_helpers.get_value('DEFAULT_USER_TESTING_PASSWORD')
-        )
-
-        return uuid4().hex[:length] if not random_string else random_string
+        return self._get_site_value('DEFAULT_USER_TESTING_PASSWORD') or uuid4().hex[:length]
@@ -1,17 +1,22 @@
 """MITHzInstanceExternalEnrollment class file."""
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from urllib.parse import quote_plus
 
-import requests
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
 from rest_framework import status
 
-from openedx_external_enrollments.edxapp_wrapper.get_site_configuration import configuration_helpers
 from openedx_external_enrollments.external_enrollments.base_external_enrollment import BaseExternalEnrollment
+from openedx_external_enrollments.external_enrollments.http_session import get_http_session
+from openedx_external_enrollments.external_enrollments.token_cache import delete_cached_token, get_cached_token
 from openedx_external_enrollments.models import EnrollmentRequestLog, ExternalEnrollment
 
 LOG = logging.getLogger(__name__)
+USER_MISS_CACHE_KEY_PREFIX = 'openedx_external_enrollments.mit_hz_user_miss'
 
 
 class MITHzInstanceExternalEnrollment(BaseExternalEnrollment):
@@ -19,15 +24,7 @@ class MITHzInstanceExternalEnrollment(BaseExternalEnrollment):
     MITHzInstanceExternalEnrollment class.
     """
 
-    def __init__(self):
-        self.MIT_HZ_PROVIDER = configuration_helpers.get_value(
-            'MIT_HZ_PROVIDER',
-            'samlp',
-        )
-        self.MIT_HZ_ORG = configuration_helpers.get_value(
-            'MIT_HZ_ORG',
-            'Pearson',
-        )
+    SITE_CONFIGURATION_KEYS = ('MIT_HZ_PROVIDER', 'MIT_HZ_ORG')
 
     def __str__(self):
         return 'mit_hz'
@@ -45,6 +42,7 @@ class MITHzInstanceExternalEnrollment(BaseExternalEnrollment):
         # should be updated to the corresponding MIT HZ courses.
         if response.ok:
             user_subscription = response.json().get('user', {})
+            cache.delete(self._get_user_miss_cache_key(self._get_user_id(json_data.get('user_email'))))
 
             ExternalEnrollment.objects.filter(  # pylint: disable=no-member
                 controller_name=str(self),
@@ -60,10 +58,146 @@ class MITHzInstanceExternalEnrollment(BaseExternalEnrollment):
 
         return response
 
+    def _is_successful_response(self, response):
+        """
+        Unknown users are answered with a 404, their enrollment is stored anyway and their
+        subscription is refreshed later, so it is not retried.
+        """
+        return response.ok or response.status_code == status.HTTP_404_NOT_FOUND
+
+    def refresh_subscriptions(self, batch_size, max_workers, site_configuration=None):
+        """
+        Refresh the subscription stored in the meta of every MIT HZ enrollment.
+
+        The enrollments are read in batches of batch_size rows paginated by id. Every learner is
+        refreshed once per run, with up to max_workers concurrent partner calls sharing the cached
+        token, and the subscription is reused for the learner enrollments of the following batches.
+        Each batch is saved with a single bulk_update. Enrollments of learners whose refresh failed,
+        or that MIT HZ doesn't know, keep their current subscription.
+
+        The refresh runs outside of any site, so the MIT_HZ_PROVIDER and MIT_HZ_ORG of the user ids
+        are read from site_configuration, or from the settings when it isn't given.
+
+        Returns:
+            dict with the number of refreshed, not found and failed learners.
+        """
+        if site_configuration is not None:
+            self.set_site_configuration(site_configuration)
+
+        outcomes = {}
+        url = self._get_enrollment_url(None)
+        last_id = 0
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                enrollments = list(
+                    ExternalEnrollment.objects.filter(  # pylint: disable=no-member
+                        controller_name=str(self),
+                        id__gt=last_id,
+                    ).only('id', 'email', 'course_shell_id').order_by('id')[:batch_size]
+                )
+
+                if not enrollments:
+                    break
+
+                last_id = enrollments[-1].id
+                pending_enrollments = {}
+
+                for enrollment in enrollments:
+                    if enrollment.email not in outcomes:
+                        pending_enrollments.setdefault(enrollment.email, enrollment)
+
+                refresh_subscription = partial(self._refresh_subscription, url, self._get_enrollment_headers())
+                outcomes.update(
+                    zip(pending_enrollments, executor.map(refresh_subscription, pending_enrollments.values()))
+                )
+                refreshed_enrollments = []
+
+                for enrollment in enrollments:
+                    outcome, subscription = outcomes[enrollment.email]
+
+                    if outcome == 'refreshed':
+                        enrollment.meta = subscription
+                        refreshed_enrollments.append(enrollment)
+
+                ExternalEnrollment.objects.bulk_update(refreshed_enrollments, ['meta'])  # pylint: disable=no-member
+
+        summary = {'refreshed': 0, 'not_found': 0, 'failed': 0}
+
+        for outcome, _ in outcomes.values():
+            summary[outcome] += 1
+
+        LOG.info('MIT HZ subscriptions refresh finished: %s', summary)
+
+        return summary
+
+    def _refresh_subscription(self, url, headers, enrollment):
+        """
+        Refresh the subscription of the enrollment learner in MIT HZ.
+
+        The request has the same payload as the enrollment one, the subscription is the
+        same for every course of the learner.
+
+        Returns:
+            tuple with the outcome of the refresh, 'refreshed', 'not_found' or 'failed',
+            and the user subscription, None unless it was refreshed.
+        """
+        email = enrollment.email
+        json_data = {
+            'user_email': email,
+            'course_id': str(enrollment.course_shell_id),
+            'user_id': self._get_user_id(email),
+        }
+
+        try:
+            response = get_http_session(url).post(url=url, headers=headers, json=json_data)
+
+            if response.status_code == status.HTTP_401_UNAUTHORIZED and self._forget_token():
+                response = get_http_session(url).post(url=url, headers=self._get_enrollment_headers(), json=json_data)
+        except Exception as error:  # pylint: disable=broad-except
+            LOG.error('Failed to refresh the MIT HZ subscription of %s. Reason: %s', email, str(error))
+            return 'failed', None
+
+        if response.ok:
+            return 'refreshed', response.json().get('user', {})
+
+        if response.status_code == status.HTTP_404_NOT_FOUND:
+            # A wrong provider or org also results in a 404, so the stored subscription is kept.
+            LOG.warning('The MIT HZ user %s was not found, the subscription is not refreshed.', json_data['user_id'])
+            return 'not_found', None
+
+        LOG.error('Failed to refresh the MIT HZ subscription of %s. Reason: %s', email, response.text)
+
+        return 'failed', None
+
     def _get_bearer_token(self):
         """
         Returns a bearer token required for the Authorization header.
         """
+        token = get_cached_token(self._get_token_name(), self._fetch_bearer_token)
+
+        return token.get('access_token') if token else 'missing token'
+
+    @staticmethod
+    def _get_token_name():
+        """
+        Return the name of the cached MIT HZ bearer token.
+        """
+        return 'mit_hz.{}'.format(settings.MIT_HZ_ID)
+
+    def _forget_token(self):
+        """
+        Remove the cached MIT HZ bearer token.
+        """
+        delete_cached_token(self._get_token_name())
+
+        return True
+
+    def _fetch_bearer_token(self):
+        """
+        Requests a new token to the MIT HZ login endpoint.
+        Returns the response data or None if the authentication failed.
+        """
         url = '{root_url}{path}'.format(
             root_url=settings.MIT_HZ_API_URL,
             path=settings.MIT_HZ_LOGIN_PATH,
@@ -77,7 +211,7 @@ class MITHzInstanceExternalEnrollment(BaseExternalEnrollment):
         }
 
         try:
-            response = requests.post(
+            response = get_http_session(url).post(
                 url=url,
                 json=data,
             )
@@ -97,10 +231,10 @@ class MITHzInstanceExternalEnrollment(BaseExternalEnrollment):
                     details=log_details,
                 )
                 LOG.error('failed when trying to authenticate with MIT HORIZON')
-                return 'missing token'
+                return None
 
-            return response.json()['access_token']
-        return 'missing token'
+            return response.json()
+        return None
 
     def _get_enrollment_headers(self):
         """
@@ -111,11 +245,18 @@ class MITHzInstanceExternalEnrollment(BaseExternalEnrollment):
             'Content-Type': 'application/json',
         }
 
-    def _check_user(self, user_id):
+    def _check_user(self, user_id, skip_recent_misses=False):
         """
         Check if user exists in MIT HORIZON.
+
+        With skip_recent_misses, users that were not found are not checked again until their
+        backoff expires, see _set_user_miss.
         """
-        headers = self._get_enrollment_headers()
+        user_miss = cache.get(self._get_user_miss_cache_key(user_id))
+
+        if skip_recent_misses and user_miss and user_miss['retry_at'] > time.time():
+            return {}
+
         url = '{root_url}{get_user_path}{user_id}'.format(
             root_url=settings.MIT_HZ_API_URL,
             get_user_path=settings.MIT_HZ_GET_USER_PATH,
@@ -127,7 +268,10 @@ class MITHzInstanceExternalEnrollment(BaseExternalEnrollment):
         }
 
         try:
-            response = requests.get(url, headers=headers)
+            response = get_http_session(url).get(url, headers=self._get_enrollment_headers())
+
+            if response.status_code == status.HTTP_401_UNAUTHORIZED and self._forget_token():
+                response = get_http_session(url).get(url, headers=self._get_enrollment_headers())
         except Exception as error:  # pylint: disable=broad-except
             LOG.error('Failed to get user at MIT HZ API.')
             log_details['response'] = {'error': 'Failed to get user at MIT HZ API. Reason: %s' % str(error)}
@@ -144,8 +288,10 @@ class MITHzInstanceExternalEnrollment(BaseExternalEnrollment):
                     request_type=str(self),
                     details=log_details,
                 )
+                self._set_user_miss(user_id, user_miss)
                 return {}
 
+            cache.delete(self._get_user_miss_cache_key(user_id))
             json_response = response.json()
             log_details['response'] = json_response
             log_details['message'] = 'User found'
@@ -156,6 +302,31 @@ class MITHzInstanceExternalEnrollment(BaseExternalEnrollment):
 
             return json_response
 
+    def _set_user_miss(self, user_id, user_miss):
+        """
+        Remember that the user was not found. The user is checked again after
+        OEE_MIT_HZ_USER_MISS_CACHE_TIMEOUT seconds, doubling the wait after every miss up to
+        OEE_MIT_HZ_USER_MISS_CACHE_MAX_TIMEOUT seconds.
+        """
+        misses = user_miss['misses'] + 1 if user_miss else 1
+        backoff = min(
+            settings.OEE_MIT_HZ_USER_MISS_CACHE_TIMEOUT * 2 ** (misses - 1),
+            settings.OEE_MIT_HZ_USER_MISS_CACHE_MAX_TIMEOUT,
+        )
+        # The entry outlives the backoff so the number of misses is kept for the next one.
+        cache.set(
+            self._get_user_miss_cache_key(user_id),
+            {'misses': misses, 'retry_at': time.time() + backoff},
+            backoff + settings.OEE_MIT_HZ_USER_MISS_CACHE_MAX_TIMEOUT,
+        )
+
+    @staticmethod
+    def _get_user_miss_cache_key(user_id):
+        """
+        Return the cache key of the misses of the MIT HZ user.
+        """
+        return '{}.{}'.format(USER_MISS_CACHE_KEY_PREFIX, user_id)
+
     def _get_enrollment_data(self, data, course_settings):
         """
         Returns the data required to refresh a user in the MIT HORIZON API.
@@ -180,8 +351,8 @@ class MITHzInstanceExternalEnrollment(BaseExternalEnrollment):
     def _get_user_id(self, email):
         """formats a valid user for the MIT HORIZON API."""
         user_id = '{provider}|{org}|{email}'.format(
-            provider=self.MIT_HZ_PROVIDER,
-            org=self.MIT_HZ_ORG,
+            provider=self._get_site_value('MIT_HZ_PROVIDER', settings.MIT_HZ_PROVIDER),
+            org=self._get_site_value('MIT_HZ_ORG', settings.MIT_HZ_ORG),
             email=email,
         )
 
@@ -205,5 +376,5 @@ class MITHzInstanceExternalEnrollment(BaseExternalEnrollment):
         except ObjectDoesNotExist:
             return
 
-        enrollment.meta = self._check_user(self._get_user_id(data.get('user_email')))
+        enrollment.meta = self._check_user(self._get_user_id(data.get('user_email')), skip_recent_misses=True)
         enrollment.save()
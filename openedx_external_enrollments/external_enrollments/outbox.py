@@ -0,0 +1,293 @@
+"""Transactional outbox for the external enrollment events."""
+import json
+import logging
+from collections import OrderedDict
+from datetime import timedelta
+from uuid import uuid4
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from openedx_external_enrollments.factory import ExternalEnrollmentFactory
+from openedx_external_enrollments.models import EnrollmentOutboxEvent
+
+LOG = logging.getLogger(__name__)
+
+
+def add_outbox_event(controller_name, data, course_settings, site_configuration=None):
+    """
+    Store an enrollment event to be delivered by the outbox relay.
+
+    This must be called within the transaction of the enrollment, then the event
+    is only persisted if the enrollment is.
+
+    Args:
+        controller_name: Name of the external enrollment controller, e.g. 'icc'.
+        data: Serialized enrollment data.
+        course_settings: The course other_course_settings.
+        site_configuration: Site configuration values of the controller, read in the request.
+    """
+    return EnrollmentOutboxEvent.objects.create(  # pylint: disable=no-member
+        controller_name=controller_name,
+        course_id=data.get('course_id'),
+        email=data.get('user_email'),
+        payload={
+            'data': data,
+            'course_settings': course_settings,
+            'site_configuration': site_configuration,
+        },
+    )
+
+
+def get_outbox_backlog():
+    """
+    Return the number of events waiting to be delivered.
+    """
+    return EnrollmentOutboxEvent.objects.filter(  # pylint: disable=no-member
+        status=EnrollmentOutboxEvent.PENDING,
+    ).count()
+
+
+def relay_outbox_events(batch_size):
+    """
+    Deliver a batch of pending events to their controllers.
+
+    Pending events of the same controller, course and learner are coalesced into the
+    last one when the controller allows it, e.g. an enroll followed by an unenroll
+    only sends the unenroll. The events of every controller are delivered together,
+    so controllers that support it can send them in bulk requests. Failed events are kept pending until they exceed the
+    max_retries of the controller retry policy, and they are retried after an exponential delay based on its countdown.
+
+    The events of controllers that don't coalesce them are delivered in order: an event waits
+    until the previous pending events of the same controller, course and learner are delivered.
+
+    The batch is claimed for OEE_ENROLLMENT_OUTBOX_LEASE_TIMEOUT seconds in its own transaction,
+    so several relays can run at the same time without delivering an event twice, and the
+    partners are called without holding database locks. The result of every event is saved
+    on its own, the events of a relay that dies are delivered again once their claim expires.
+
+    Args:
+        batch_size: Maximum number of events to process.
+    Returns:
+        dict with the number of events per result and the remaining backlog.
+    """
+    summary = {
+        EnrollmentOutboxEvent.DELIVERED: 0,
+        EnrollmentOutboxEvent.COALESCED: 0,
+        EnrollmentOutboxEvent.FAILED: 0,
+        'retried': 0,
+        'blocked': 0,
+    }
+    claim_id = uuid4()
+    events = _claim_events(claim_id, batch_size)
+    controllers = {}
+    events_to_deliver = OrderedDict()
+    blocking_events = _get_blocking_events(claim_id, events)
+
+    for event in events:
+        controller = _get_controller(controllers, event.controller_name)
+        key = (event.controller_name, event.course_id, event.email)
+
+        if controller and controller.COALESCE_OUTBOX_EVENTS:
+            previous_event = events_to_deliver.pop(key, None)
+
+            if previous_event:
+                _set_status(previous_event, EnrollmentOutboxEvent.COALESCED)
+                _save_event(previous_event)
+                summary[EnrollmentOutboxEvent.COALESCED] += 1
+        elif key in events_to_deliver or key in blocking_events:
+            _release_blocked_event(event, blocking_events.get(key))
+            summary['blocked'] += 1
+            continue
+
+        events_to_deliver[key] = event
+
+    events_per_controller = OrderedDict()
+
+    # Events of different sites can't share a request, since their site configuration may differ.
+    for event in events_to_deliver.values():
+        site_configuration = json.dumps(event.payload.get('site_configuration'), sort_keys=True)
+        events_per_controller.setdefault((event.controller_name, site_configuration), []).append(event)
+
+    for (controller_name, _), controller_events in events_per_controller.items():
+        for result in _deliver(controllers.get(controller_name), controller_events):
+            summary[result] += 1
+
+    summary['backlog'] = get_outbox_backlog()
+    LOG.info('Enrollment outbox relay finished: %s', summary)
+
+    return summary
+
+
+def _claim_events(claim_id, batch_size):
+    """
+    Claim up to batch_size pending events that are not claimed by another relay run.
+    Returns the claimed events.
+    """
+    now = timezone.now()
+    claimable_events = EnrollmentOutboxEvent.objects.filter(  # pylint: disable=no-member
+        Q(claimed_until__isnull=True) | Q(claimed_until__lt=now),
+        Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now),
+        status=EnrollmentOutboxEvent.PENDING,
+    )
+    event_ids = list(claimable_events.order_by('id').values_list('id', flat=True)[:batch_size])
+
+    # The update checks the claim again, so the events claimed in the meantime by another run are skipped.
+    claimable_events.filter(id__in=event_ids).update(
+        claim_id=claim_id,
+        claimed_until=now + timedelta(seconds=settings.OEE_ENROLLMENT_OUTBOX_LEASE_TIMEOUT),
+    )
+
+    return list(
+        EnrollmentOutboxEvent.objects.filter(claim_id=claim_id).order_by('id')  # pylint: disable=no-member
+    )
+
+
+def _get_blocking_events(claim_id, events):
+    """
+    Return the oldest pending event, not claimed by the current relay run, of every key
+    (controller, course and learner) of the given events that is older than them.
+    """
+    if not events:
+        return {}
+
+    first_event_ids = {}
+
+    for event in events:
+        first_event_ids.setdefault((event.controller_name, event.course_id, event.email), event.id)
+
+    pending_events = EnrollmentOutboxEvent.objects.filter(  # pylint: disable=no-member
+        status=EnrollmentOutboxEvent.PENDING,
+        controller_name__in={event.controller_name for event in events},
+        email__in={event.email for event in events},
+        id__lt=max(first_event_ids.values()),
+    ).exclude(
+        claim_id=claim_id,
+    ).order_by('id')
+    blocking_events = {}
+
+    for event in pending_events:
+        key = (event.controller_name, event.course_id, event.email)
+
+        if event.id < first_event_ids.get(key, 0):
+            blocking_events.setdefault(key, event)
+
+    return blocking_events
+
+
+def _release_blocked_event(event, blocking_event):
+    """
+    Release the claim of an event that must wait for a previous event, it is not retried
+    before the previous event could be delivered again.
+    """
+    next_attempt_at = None
+
+    if blocking_event:
+        next_attempt_at = max(
+            [date for date in (blocking_event.next_attempt_at, blocking_event.claimed_until) if date],
+            default=None,
+        )
+
+    event.next_attempt_at = next_attempt_at
+    _save_event(event)
+
+
+def _get_controller(controllers, controller_name):
+    """
+    Return the controller instance for the given name, creating it once per relay run.
+    Returns None when the controller doesn't exist.
+    """
+    if controller_name not in controllers:
+        try:
+            controllers[controller_name] = ExternalEnrollmentFactory.get_enrollment_controller(
+                controller=controller_name,
+            )
+        except NotImplementedError:
+            controllers[controller_name] = None
+
+    return controllers[controller_name]
+
+
+def _deliver(controller, events):
+    """
+    Execute the enrollments of the events of a controller and update their status.
+    Returns the list of delivery results.
+    """
+    if not controller:
+        for event in events:
+            _set_status(event, EnrollmentOutboxEvent.FAILED)
+            _save_event(event)
+
+        return [EnrollmentOutboxEvent.FAILED] * len(events)
+
+    controller.set_site_configuration(events[0].payload.get('site_configuration'))
+    responses = controller.run_enrollments([
+        (event.payload.get('data'), event.payload.get('course_settings'))
+        for event in events
+    ])
+
+    return [
+        _set_delivery_result(controller, event, response, succeeded)
+        for event, (response, succeeded) in zip(events, responses)
+    ]
+
+
+def _set_delivery_result(controller, event, response, succeeded):
+    """
+    Update the status of the event with the result of its enrollment.
+    Returns the result of the delivery.
+    """
+    if succeeded:
+        _set_status(event, EnrollmentOutboxEvent.DELIVERED)
+        _save_event(event)
+        return EnrollmentOutboxEvent.DELIVERED
+
+    event.attempts += 1
+    LOG.error(
+        'Failed to deliver the outbox event [%s] for [%s], attempt %s. Reason: %s',
+        event.id,
+        event.controller_name,
+        event.attempts,
+        response,
+    )
+
+    retry_policy = controller.get_retry_policy(event.controller_name)
+
+    if event.attempts > retry_policy.get('max_retries'):
+        _set_status(event, EnrollmentOutboxEvent.FAILED)
+        _save_event(event)
+        return EnrollmentOutboxEvent.FAILED
+
+    event.next_attempt_at = timezone.now() + timedelta(
+        seconds=retry_policy.get('countdown') * 2 ** (event.attempts - 1),
+    )
+    _save_event(event)
+
+    return 'retried'
+
+
+def _set_status(event, status):
+    """
+    Move the event out of the pending status.
+    """
+    event.status = status
+    event.processed_at = timezone.now()
+
+
+def _save_event(event):
+    """
+    Save the delivery result of the event and release its claim. Nothing is saved when the
+    claim expired and the event was claimed by another relay run.
+    """
+    EnrollmentOutboxEvent.objects.filter(  # pylint: disable=no-member
+        id=event.id,
+        claim_id=event.claim_id,
+    ).update(
+        status=event.status,
+        attempts=event.attempts,
+        processed_at=event.processed_at,
+        next_attempt_at=event.next_attempt_at,
+        claim_id=None,
+        claimed_until=None,
+    )
@@ -1,22 +1,38 @@
 """PathstreamExternalEnrollment class file."""
 import base64
+import csv
 import hashlib
+import io
+import json
 import logging
+import uuid
 from datetime import datetime
+from itertools import chain
 
 import boto3
 import botocore
 from botocore.exceptions import ClientError
 from django.conf import settings
+from django.core.cache import cache
 from django.db import IntegrityError
+from django.db.models import Q
+from django.utils import timezone
 
 from openedx_external_enrollments.edxapp_wrapper.get_student import get_user
 from openedx_external_enrollments.external_enrollments.base_external_enrollment import BaseExternalEnrollment
-from openedx_external_enrollments.models import EnrollmentRequestLog, ExternalEnrollment
+from openedx_external_enrollments.models import EnrollmentRequestLog, ExternalEnrollment, ExternalEnrollmentEvent
 
 LOG = logging.getLogger(__name__)
 COMPLETED = True
 UNCOMPLETED = False
+# Minimum size of every part of a S3 multipart upload, except the last one.
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+# Maximum size of every part of a S3 multipart upload, including the ones copied with upload_part_copy.
+S3_MAX_PART_SIZE = 5 * 1024 * 1024 * 1024
+S3_MAX_DELETE_OBJECTS = 1000
+# course_key,email,username,fullname,first_name,last_name,date_time,status
+ENROLLMENT_DATA_FIELDS = 8
+COMPACTION_LOCK_CACHE_KEY = 'openedx_external_enrollments.pathstream_compaction.lock'
 
 
 class PathstreamTaskExecutionError(Exception):
@@ -27,6 +43,9 @@ class PathstreamExternalEnrollment(BaseExternalEnrollment):
     """
     PathstreamExternalEnrollment class.
     """
+    # Every enrollment event is exported as a line, so none of them can be skipped.
+    COALESCE_OUTBOX_EVENTS = False
+
     def __str__(self):
         return 'pathstream'
 
@@ -34,6 +53,7 @@ class PathstreamExternalEnrollment(BaseExternalEnrollment):
         self.client = None
         self.S3_BUCKET = settings.OEE_PATHSTREAM_S3_BUCKET
         self.S3_FILE = settings.OEE_PATHSTREAM_S3_FILE
+        self.S3_PARTS_PREFIX = settings.OEE_PATHSTREAM_S3_PARTS_PREFIX
 
     def _init_s3(self):
         """Define the S3 service client.
@@ -47,111 +67,456 @@ class PathstreamExternalEnrollment(BaseExternalEnrollment):
             aws_secret_access_key=settings.OOE_PATHSTREAM_S3_SECRET_KEY,
         )
 
-    def _download_file(self):
-        """Download the file content from an S3 Bucket.
+    @staticmethod
+    def _prepare_new_content(content):
+        """This method returns the new content ready to be uploaded to S3. The content is expected to be
+        already sorted by date/time, so it is only encoded since this is the way to upload the file content to S3.
+
+        :param: content (list of strings).
+
+        :return: bytes made up of the data passed in content."""
+        return b''.join(data.encode() for data in content)
+
+    @staticmethod
+    def _is_valid_enrollment_data(data, event_time):
+        """Return whether the formatted line of an event can be exported, i.e. a single CSV row of
+        ENROLLMENT_DATA_FIELDS fields."""
+        if not event_time or not data.endswith('\n'):
+            return False
 
-        :return: file's content (bytes)"""
         try:
-            response = self.client.get_object(
+            rows = list(csv.reader(io.StringIO(data)))
+        except csv.Error:
+            return False
+
+        return len(rows) == 1 and len(rows[0]) == ENROLLMENT_DATA_FIELDS
+
+    def _quarantine_events(self, events):
+        """Exclude the given events from the export, so a malformed line doesn't block the rest of them.
+
+        :param: events (list of (id, data, event_time) tuples)."""
+        ExternalEnrollmentEvent.objects.filter(  # pylint: disable=no-member
+            id__in=[event_id for event_id, _, _ in events],
+        ).update(quarantined_at=timezone.now())
+
+        for event_id, data, _ in events:
+            LOG.error('The enrollment event %s for [%s] was quarantined. Malformed data: %s', event_id, str(self), data)
+
+    def requeue_quarantined_events(self, event_ids=None):
+        """Rebuild the line of the quarantined events and queue them for the next export.
+
+        The line is built again from the enrollment, the status and the event_time of the event,
+        the created_at date being used for events without event_time. Events whose line can't
+        be rebuilt, e.g. because the user doesn't exist anymore, stay quarantined.
+
+        :param: event_ids (list of int). Events to requeue, all the quarantined ones by default.
+        :return: tuple (int, int). Number of requeued events and of events that stay quarantined."""
+        events = ExternalEnrollmentEvent.objects.filter(  # pylint: disable=no-member
+            enrollment__controller_name=str(self),
+            uploaded_at__isnull=True,
+            quarantined_at__isnull=False,
+        ).select_related('enrollment').order_by('id')
+
+        if event_ids is not None:
+            events = events.filter(id__in=event_ids)
+
+        requeued_count = failed_count = 0
+
+        for event in events:
+            event_time = event.event_time or event.created_at
+
+            try:
+                data = self._get_enrollment_data(
+                    {
+                        'course_id': event.enrollment.course_shell_id,
+                        'user_email': event.enrollment.email,
+                        'is_active': event.data.rstrip('\n').rsplit(',', 1)[-1] == 'true',
+                    },
+                    timezone.make_naive(event_time, timezone.utc),
+                )
+            except Exception as error:  # pylint: disable=broad-except
+                LOG.error('The enrollment event %s for [%s] can\'t be requeued. Reason: %s', event.id, str(self), error)
+                failed_count += 1
+                continue
+
+            ExternalEnrollmentEvent.objects.filter(id=event.id).update(  # pylint: disable=no-member
+                data=data,
+                event_time=event_time,
+                quarantined_at=None,
+            )
+            requeued_count += 1
+
+        return requeued_count, failed_count
+
+    def _upload_file(self, file_content=None, key=None):
+        """Upload the file to an S3 bucket using MD5 to ensure that data is not corrupted
+        traversing the network.
+
+        :param: file_content (bytes).
+        :param: key (str). Object key, the S3 file by default."""
+        if not (isinstance(file_content, bytes) and file_content):
+            raise PathstreamTaskExecutionError(
+                '_upload_file', 'Can\'t upload a file with empty content or invalid content type.',
+            )
+
+        key = key or self.S3_FILE
+
+        try:
+            response = self.client.put_object(
                 Bucket=self.S3_BUCKET,
-                Key=self.S3_FILE,
+                Key=key,
+                Body=file_content,
+                ContentMD5=self._get_content_md5(file_content),
             )
         except ClientError as error:
             raise PathstreamTaskExecutionError(
-                '_download_file',
-                'Failed to download the content of the file from S3. Reason: {}'.format(str(error)),
+                '_upload_file',
+                'Failed to upload the file to S3. Reason: {}'.format(str(error)),
             )
 
-        LOG.info('File content [%s] was downloaded from S3 for [%s]', self.S3_FILE, self.__str__())
+        LOG.info('File [%s] was uploaded to S3 for [%s], response: [%s]', key, self.__str__(), response)
+
+    @staticmethod
+    def _get_content_md5(content):
+        """Return the base64-encoded 128-bit MD5 digest of the content, as expected by the S3 ContentMD5 parameter."""
+        return base64.b64encode(hashlib.md5(content).digest()).decode()
+
+    def _get_part_key(self):
+        """Return a new key under the parts prefix, partitioned by date and sortable by creation time."""
+        now = datetime.utcnow()
+
+        return '{}/{}/{}-{}.log'.format(
+            self.S3_PARTS_PREFIX.rstrip('/'),
+            now.strftime('%Y/%m/%d'),
+            now.strftime('%H%M%S%f'),
+            uuid.uuid4().hex,
+        )
+
+    def _list_parts(self):
+        """Return the (key, size) tuples of the objects under the parts prefix, in creation order."""
+        paginator = self.client.get_paginator('list_objects_v2')
+        parts = []
+
+        for page in paginator.paginate(Bucket=self.S3_BUCKET, Prefix='{}/'.format(self.S3_PARTS_PREFIX.rstrip('/'))):
+            parts.extend((item['Key'], item['Size']) for item in page.get('Contents', []))
+
+        return sorted(parts)
+
+    def _get_object_size(self, key):
+        """Return the size of the object, None if it doesn't exist."""
+        try:
+            return self.client.head_object(Bucket=self.S3_BUCKET, Key=key)['ContentLength']
+        except ClientError as error:
+            if error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+                return None
+
+            raise
+
+    def _download_range(self, key, start, end):
+        """Return the bytes of the object between start (inclusive) and end (exclusive)."""
+        if end <= start:
+            return b''
+
+        response = self.client.get_object(
+            Bucket=self.S3_BUCKET,
+            Key=key,
+            Range='bytes={}-{}'.format(start, end - 1),
+        )
 
         return response['Body'].read()
 
-    def _prepare_new_content(self, content):
-        """This method returns the new content ready to be uploaded to S3. It first sorts the input list
-        by date/time and then encode it since this is the way to upload the file content to S3.
+    def _get_objects_md5(self, sources):
+        """Return the base64-encoded MD5 digest of the concatenated source objects.
 
-        :param: content (list of strings).
-            The elements of content are expected to be the following comma-separated format:
-            "course,email,2021-08-05 17:53:41.492901,false"
+        The objects are read in chunks of S3_MIN_PART_SIZE bytes, so the worker never holds
+        more than one chunk.
+
+        :param: sources (list of (key, size) tuples)."""
+        md5 = hashlib.md5()
+
+        for key, _ in sources:
+            body = self.client.get_object(Bucket=self.S3_BUCKET, Key=key)['Body']
 
-        :return: bytes made up of the data passed in content.
+            for chunk in iter(lambda body=body: body.read(S3_MIN_PART_SIZE), b''):
+                md5.update(chunk)
 
-        :raise: AttributeError, IndexError or ValueError in case at least one element in content has a different
-        format than expected."""
+        return base64.b64encode(md5.digest()).decode()
+
+    def _get_file_md5(self):
+        """Return the content-md5 metadata of the S3 file, None if it doesn't exist or doesn't have it."""
         try:
-            content.sort(
-                #  Extract datetime out of every element in content to be the sorting parameter.
-                key=lambda data: datetime.strptime(data.split(',')[6], settings.OOE_PATHSTREAM_S3_DATETIME_FORMAT),
-            )
-        except (AttributeError, IndexError, ValueError) as error:
-            raise PathstreamTaskExecutionError(
-                '_prepare_new_content',
-                'An enrollment data is invalid. Reason: {} \nNew data: {}'.format(str(error), content),
-            )
+            response = self.client.head_object(Bucket=self.S3_BUCKET, Key=self.S3_FILE)
+        except ClientError as error:
+            if error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+                return None
 
-        # Convert elements of content to bytes.
-        content = map(lambda data: data.encode(), content)
+            raise
 
-        return b''.join(content)
+        return response.get('Metadata', {}).get('content-md5')
 
-    def _upload_file(self, file_content=None):
-        """Upload the file to an S3 bucket using MD5 to ensure that data is not corrupted
-        traversing the network.
+    def _merge_objects(self, sources, content_md5):
+        """Concatenate the source objects into the S3 file with a multipart upload.
 
-        :param: file_content (bytes)."""
-        if not (isinstance(file_content, bytes) and file_content):
-            raise PathstreamTaskExecutionError(
-                '_upload_file', 'Can\'t upload a file with empty content or invalid content type.',
-            )
+        Sources of at least S3_MIN_PART_SIZE bytes are copied inside S3, in parts of up to
+        S3_MAX_PART_SIZE bytes. Smaller ones are buffered until they fill a part, so the worker
+        never holds more than one part.
+
+        The ETag of a multipart object is not the MD5 of its content, so the MD5 is stored in
+        the content-md5 metadata of the S3 file.
 
-        hash_algorithm_md5 = hashlib.md5(file_content).digest()
-        content_encoded = base64.b64encode(hash_algorithm_md5)
+        :param: sources (list of (key, size) tuples).
+        :param: content_md5 (str). Base64-encoded MD5 digest of the concatenated sources."""
+        upload_id = self.client.create_multipart_upload(
+            Bucket=self.S3_BUCKET,
+            Key=self.S3_FILE,
+            Metadata={'content-md5': content_md5},
+        )['UploadId']
+        parts = []
+        buffer = b''
+
+        def upload_buffer(content):
+            response = self.client.upload_part(
+                Bucket=self.S3_BUCKET,
+                Key=self.S3_FILE,
+                UploadId=upload_id,
+                PartNumber=len(parts) + 1,
+                Body=content,
+                ContentMD5=self._get_content_md5(content),
+            )
+            parts.append({'ETag': response['ETag'], 'PartNumber': len(parts) + 1})
 
         try:
-            response = self.client.put_object(
+            for key, size in sources:
+                offset = 0
+
+                if buffer or size < S3_MIN_PART_SIZE:
+                    offset = min(size, S3_MIN_PART_SIZE - len(buffer))
+                    buffer += self._download_range(key, 0, offset)
+
+                    if len(buffer) >= S3_MIN_PART_SIZE:
+                        upload_buffer(buffer)
+                        buffer = b''
+
+                if size - offset >= S3_MIN_PART_SIZE:
+                    for start, end in self._split_range(offset, size):
+                        response = self.client.upload_part_copy(
+                            Bucket=self.S3_BUCKET,
+                            Key=self.S3_FILE,
+                            UploadId=upload_id,
+                            PartNumber=len(parts) + 1,
+                            CopySource={'Bucket': self.S3_BUCKET, 'Key': key},
+                            CopySourceRange='bytes={}-{}'.format(start, end - 1),
+                        )
+                        parts.append({'ETag': response['CopyPartResult']['ETag'], 'PartNumber': len(parts) + 1})
+                else:
+                    buffer += self._download_range(key, offset, size)
+
+            if buffer:
+                upload_buffer(buffer)
+
+            if not parts:
+                self._abort_multipart_upload(upload_id)
+                return
+
+            self.client.complete_multipart_upload(
                 Bucket=self.S3_BUCKET,
                 Key=self.S3_FILE,
-                Body=file_content,
-                ContentMD5=content_encoded.decode(),  # String - The base64-encoded 128-bit MD5 digest of the message.
+                UploadId=upload_id,
+                MultipartUpload={'Parts': parts},
             )
         except ClientError as error:
+            self._abort_multipart_upload(upload_id)
             raise PathstreamTaskExecutionError(
-                '_upload_file',
-                'Failed to upload the file to S3. Reason: {}'.format(str(error)),
+                '_merge_objects',
+                'Failed to merge the parts into the S3 file. Reason: {}'.format(str(error)),
             )
 
-        LOG.info('File [%s] was uploaded to S3 for [%s], response: [%s]', self.S3_FILE, self.__str__(), response)
+    def _abort_multipart_upload(self, upload_id):
+        """Abort the multipart upload of the S3 file.
 
-    def execute_upload(self):
+        Failures are only logged, so they don't hide the error that made the upload fail."""
+        try:
+            self.client.abort_multipart_upload(Bucket=self.S3_BUCKET, Key=self.S3_FILE, UploadId=upload_id)
+        except Exception as error:  # pylint: disable=broad-except
+            LOG.error('Failed to abort the multipart upload [%s] of the S3 file. Reason: %s', upload_id, str(error))
+
+    @staticmethod
+    def _split_range(start, end):
+        """Split the byte range in the fewest parts of up to S3_MAX_PART_SIZE bytes.
+
+        The parts have the same size, except the last one which can be a few bytes smaller,
+        so a range of at least S3_MIN_PART_SIZE bytes is never split into parts smaller than it.
+
+        :return: list of (start, end) tuples, start inclusive and end exclusive."""
+        parts_count = -(-(end - start) // S3_MAX_PART_SIZE)
+        part_size = -(-(end - start) // parts_count)
+
+        return [(position, min(position + part_size, end)) for position in range(start, end, part_size)]
+
+    def _delete_objects(self, keys):
+        """Delete the given objects from the S3 bucket.
+
+        :return: list of the keys that S3 failed to delete."""
+        undeleted_keys = []
+
+        for index in range(0, len(keys), S3_MAX_DELETE_OBJECTS):
+            response = self.client.delete_objects(
+                Bucket=self.S3_BUCKET,
+                Delete={
+                    'Objects': [{'Key': key} for key in keys[index:index + S3_MAX_DELETE_OBJECTS]],
+                    'Quiet': True,
+                },
+            )
+
+            for error in response.get('Errors', []):
+                LOG.error('Failed to delete the S3 object [%s]. Reason: %s', error.get('Key'), error.get('Message'))
+                undeleted_keys.append(error.get('Key'))
+
+        return undeleted_keys
+
+    def _get_merged_parts_key(self):
+        """Return the key of the object that lists the parts already merged into the S3 file."""
+        return '{}.merged.json'.format(self.S3_PARTS_PREFIX.rstrip('/'))
+
+    def _get_merged_parts(self):
+        """Return the keys of the parts already merged into the S3 file that could not be deleted.
+
+        When a previous run recorded a merge that it could not confirm, its parts are merged
+        only if the S3 file has the content-md5 expected from that merge."""
+        try:
+            response = self.client.get_object(Bucket=self.S3_BUCKET, Key=self._get_merged_parts_key())
+        except ClientError as error:
+            if error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+                return []
+
+            raise
+
+        merged_parts = json.loads(response['Body'].read().decode())
+
+        if isinstance(merged_parts, list):
+            return merged_parts
+
+        if self._get_file_md5() == merged_parts['content-md5']:
+            return merged_parts['merged'] + merged_parts['merging']
+
+        return merged_parts['merged']
+
+    def _set_merged_parts(self, keys, merging_keys=None, content_md5=None):
+        """Store the keys of the parts already merged into the S3 file, so they are not merged again.
+
+        The parts being merged are recorded with the content-md5 of the merged file before the
+        merge is completed, so a run that fails after completing it doesn't merge them twice."""
+        if merging_keys:
+            body = {'merged': keys, 'merging': merging_keys, 'content-md5': content_md5}
+        elif keys:
+            body = keys
+        else:
+            self.client.delete_object(Bucket=self.S3_BUCKET, Key=self._get_merged_parts_key())
+            return
+
+        self.client.put_object(Bucket=self.S3_BUCKET, Key=self._get_merged_parts_key(), Body=json.dumps(body))
+
+    def compact_parts(self):
         """
-        Context: This method will download, update and upload the S3 file content with the
-        corresponding data from new enrollments which have not been uploaded to the S3
-        file. It also updates the key flag 'is_uploaded' which is used to determine if an enrollment is already
-        uploaded to the S3 file.
+        Merge the objects written in append mode into the S3 file and delete them.
 
         :return: tuple (boolean, str). (True, 'successful-message') if the method executes properly,
         otherwise (False, 'error-message')
+        """
+        self._init_s3()
 
-        True means that this method either download-update-upload the S3 file content or do not
-        proceed to download-update-upload the content because there are no new enrollments.
+        if not isinstance(self.client, botocore.client.BaseClient):
+            LOG.error('_init_s3 has not been called yet or failed.')
+            return UNCOMPLETED, '_init_s3 has not been called yet or failed.'
+
+        try:
+            self._compact_parts()
+        except (ClientError, PathstreamTaskExecutionError) as error:
+            LOG.error('The proccess to compact the S3 parts has failed. Reason: %s', str(error))
+            return UNCOMPLETED, str(error)
+
+        return COMPLETED, 'compact_parts completed'
+
+    def _compact_parts(self):
         """
-        users_enrollments_qs = ExternalEnrollment.objects.filter(  # pylint: disable=no-member
-            controller_name=str(self),
-            meta__icontains='"is_uploaded":false',
-        )
+        Merge the parts into the S3 file and delete them.
 
-        if not users_enrollments_qs:
-            LOG.info('There are no new enrollments to update the S3 file.')
-            return COMPLETED, 'execute_upload completed'
+        The parts are appended after the current content of the S3 file, in creation order.
+        Parts written while the compaction runs are kept for the next run. The merged parts
+        are recorded before they are deleted, so the ones that S3 fails to delete are not
+        merged again by the next run, which only retries their deletion. The merge itself is
+        recorded before it starts, together with the content-md5 of the merged file, so the
+        next run knows whether it was completed.
 
-        new_content = []
+        A cache lock prevents concurrent compactions from merging the same parts twice, the
+        compaction is skipped while another one is running.
 
-        for user_enrollments in users_enrollments_qs:
-            for enrollment in user_enrollments.meta:
-                if not enrollment.get('is_uploaded', True):
-                    new_content.append(enrollment.get('enrollment_data_formated', ''))
+        :raise: ClientError or PathstreamTaskExecutionError when the compaction fails."""
+        if not cache.add(COMPACTION_LOCK_CACHE_KEY, True, settings.OEE_PATHSTREAM_COMPACTION_LOCK_TIMEOUT):
+            LOG.info('Another compaction of the S3 parts is running.')
+            return
 
-                    enrollment['is_uploaded'] = True
+        try:
+            parts = self._list_parts()
+
+            if not parts:
+                LOG.info('There are no parts to compact into the S3 file.')
+                return
+
+            merged_keys = set(self._get_merged_parts())
+            new_parts = [(key, size) for key, size in parts if key not in merged_keys]
+            part_keys = [key for key, _ in parts]
+
+            if new_parts:
+                file_size = self._get_object_size(self.S3_FILE)
+                sources = [(self.S3_FILE, file_size)] if file_size else []
+                content_md5 = self._get_objects_md5(sources + new_parts)
+
+                self._set_merged_parts(
+                    [key for key in part_keys if key in merged_keys],
+                    [key for key, _ in new_parts],
+                    content_md5,
+                )
+                self._merge_objects(sources + new_parts, content_md5)
+                self._set_merged_parts(part_keys)
+
+            self._set_merged_parts(self._delete_objects(part_keys))
+        finally:
+            cache.delete(COMPACTION_LOCK_CACHE_KEY)
+
+        LOG.info('%s parts were compacted into the S3 file [%s]', len(new_parts), self.S3_FILE)
+
+    def execute_upload(self):
+        """
+        Context: This method will append to the S3 file the corresponding data from new
+        enrollments which have not been uploaded to the S3 file. It also sets the 'uploaded_at'
+        date of the uploaded enrollment events, which is used to determine if an enrollment is
+        already uploaded to the S3 file.
+
+        :return: tuple (boolean, str). (True, 'successful-message') if the method executes properly,
+        otherwise (False, 'error-message')
+
+        True means that this method either updates the S3 file or does not proceed to update it
+        because there are no new enrollments.
+
+        The pending events are exported in the order of their event_time, in batches of
+        OEE_PATHSTREAM_UPLOAD_BATCH_SIZE events. Events whose line is malformed are quarantined,
+        so they don't fail the whole batch.
+
+        Every batch is uploaded as a new object under the parts prefix and marked as uploaded
+        right away, so a failure doesn't upload the previous batches again. The parts are then
+        merged into the S3 file, together with the ones left by previous failed runs, copying the
+        big objects inside S3, so the memory used doesn't depend on the size of the file.
+
+        When OEE_PATHSTREAM_S3_APPEND_MODE is enabled, the parts are not merged here, but by
+        compact_parts, so only the new bytes are transferred.
+        """
+        batches = self._get_pending_events_batches()
+        first_batch = next(batches, None)
+
+        if not first_batch:
+            LOG.info('There are no new enrollments to update the S3 file.')
+            return COMPLETED, 'execute_upload completed'
 
         self._init_s3()
 
@@ -160,40 +525,114 @@ class PathstreamExternalEnrollment(BaseExternalEnrollment):
             return UNCOMPLETED, '_init_s3 has not been called yet or failed.'
 
         try:
-            file_content = self._download_file()
-            file_content += self._prepare_new_content(new_content)
+            self._upload_batches_as_parts(chain([first_batch], batches))
 
-            self._upload_file(file_content)
-        except PathstreamTaskExecutionError as error:
+            if not settings.OEE_PATHSTREAM_S3_APPEND_MODE:
+                self._compact_parts()
+        except (ClientError, PathstreamTaskExecutionError) as error:
             LOG.error('The proccess to update the remote S3 file has failed. Reason: %s', str(error))
             return UNCOMPLETED, str(error)
 
-        ExternalEnrollment.objects.bulk_update(users_enrollments_qs, ['meta'])  # pylint: disable=no-member
         return COMPLETED, 'execute_upload completed'
 
-    def _get_enrollment_data(self, data):  # pylint: disable=arguments-differ
+    def _get_pending_events_batches(self):
+        """Yield the pending events of the controller in batches of OEE_PATHSTREAM_UPLOAD_BATCH_SIZE,
+        ordered by (event_time, id).
+
+        Every batch is read with keyset pagination, so the events of the previous batches don't need
+        to be marked as uploaded, nor skipped with an offset. Malformed events are quarantined
+        as they are found.
+
+        :return: generator of lists of (id, data, event_time) tuples."""
+        events = ExternalEnrollmentEvent.objects.filter(  # pylint: disable=no-member
+            enrollment__controller_name=str(self),
+            uploaded_at__isnull=True,
+            quarantined_at__isnull=True,
+        )
+        events_without_time = list(events.filter(event_time__isnull=True).values_list('id', 'data', 'event_time'))
+
+        if events_without_time:
+            self._quarantine_events(events_without_time)
+
+        events = events.filter(event_time__isnull=False).order_by('event_time', 'id')
+        last_id = last_event_time = None
+
+        while True:
+            batch_events = events
+
+            if last_event_time:
+                batch_events = events.filter(
+                    Q(event_time__gt=last_event_time) | Q(event_time=last_event_time, id__gt=last_id),
+                )
+
+            batch = list(
+                batch_events.values_list('id', 'data', 'event_time')[:settings.OEE_PATHSTREAM_UPLOAD_BATCH_SIZE]
+            )
+
+            if not batch:
+                return
+
+            last_id, _, last_event_time = batch[-1]
+            pending_events = []
+            malformed_events = []
+
+            for event in batch:
+                if self._is_valid_enrollment_data(event[1], event[2]):
+                    pending_events.append(event)
+                else:
+                    malformed_events.append(event)
+
+            if malformed_events:
+                self._quarantine_events(malformed_events)
+
+            if pending_events:
+                yield pending_events
+
+    def _upload_batches_as_parts(self, batches):
+        """Upload every batch as a new object under the parts prefix.
+
+        Each batch is marked as uploaded right after its object is written, so a failure
+        doesn't upload the previous batches again.
+
+        :param: batches (iterable of lists of (id, data, event_time) tuples)."""
+        for batch in batches:
+            self._upload_file(self._prepare_new_content([data for _, data, _ in batch]), key=self._get_part_key())
+            self._mark_events_as_uploaded([event_id for event_id, _, _ in batch])
+
+    @staticmethod
+    def _mark_events_as_uploaded(event_ids):
+        """Set the uploaded_at date of the given events."""
+        ExternalEnrollmentEvent.objects.filter(  # pylint: disable=no-member
+            id__in=event_ids,
+        ).update(uploaded_at=timezone.now())
+
+    def _get_enrollment_data(self, data, date_time=None):  # pylint: disable=arguments-differ
         """
         Returns a string with the data required to be treated as a log.
-        String format: 'course_key,email,username,first_name,last_name,date_time,status'
+        String format: 'course_key,email,username,fullname,first_name,last_name,date_time,status'
+
+        The line is written as a CSV row, so the fields that contain commas, e.g. names like
+        'Smith, Jr.', are quoted. The date_time is a naive UTC datetime, the current one by default.
         """
         user, _ = get_user(email=data.get('user_email'))
-        return (
-            '{course_key},{email},{username},{fullname},'
-            '{first_name},{last_name},{date_time},{status}\n'.format(
-                course_key=data.get('course_id'),
-                email=data.get('user_email'),
-                username=user.username,
-                fullname=user.profile.name,
-                first_name=user.first_name,
-                last_name=user.last_name,
-                date_time=datetime.utcnow(),
-                status=str(data.get('is_active')).lower(),
-            )
-        )
+        line = io.StringIO()
+        csv.writer(line, lineterminator='\n').writerow([
+            data.get('course_id'),
+            data.get('user_email'),
+            user.username,
+            user.profile.name,
+            user.first_name,
+            user.last_name,
+            date_time or datetime.utcnow(),
+            str(data.get('is_active')).lower(),
+        ])
+
+        return line.getvalue()
 
     def _post_enrollment(self, data, course_settings=None):
         """
-        Save enrollment data in ExternalEnrollment model.
+        Save enrollment data as a new ExternalEnrollmentEvent of the ExternalEnrollment object,
+        which is created the first time. The ExternalEnrollment object itself is not updated.
         """
         LOG.info('Calling enrollment for [%s] with data: %s', self.__str__(), data)
         LOG.info('Calling enrollment for [%s] with course settings: %s', self.__str__(), course_settings)
@@ -204,10 +643,11 @@ class PathstreamExternalEnrollment(BaseExternalEnrollment):
         }
 
         try:
-            enrollment, created = ExternalEnrollment.objects.get_or_create(  # pylint: disable=no-member
+            enrollment, _ = ExternalEnrollment.objects.get_or_create(  # pylint: disable=no-member
                 controller_name=str(self),
                 course_shell_id=data.get('course_id'),
                 email=data.get('user_email'),
+                defaults={'meta': []},
             )
         except IntegrityError:
             error_msg = 'Failed to complete enrollment, course_id and user_email can\'t be None.'
@@ -219,16 +659,14 @@ class PathstreamExternalEnrollment(BaseExternalEnrollment):
                 details=log_details,
             )
         else:
-            enrollment.meta = [] if created else enrollment.meta
-            enrollment_data = self._get_enrollment_data(data)
+            event_time = timezone.now()
+            enrollment_data = self._get_enrollment_data(data, timezone.make_naive(event_time, timezone.utc))
 
-            enrollment.meta.append(
-                {
-                    'enrollment_data_formated': enrollment_data,
-                    'is_uploaded': False,
-                },
+            ExternalEnrollmentEvent.objects.create(  # pylint: disable=no-member
+                enrollment=enrollment,
+                data=enrollment_data,
+                event_time=event_time,
             )
-            enrollment.save()
             LOG.info(
                 'Saving External enrollment object for [%s] -- ExternalEnrollment.id = %s -- Enrollment data = [%s]',
                 self.__str__(),
@@ -1,9 +1,9 @@
 """SalesforceEnrollment class file."""
 import datetime
 import logging
+from collections import namedtuple
 from urllib.parse import parse_qs, urlsplit
 
-import requests
 from django.conf import settings
 from oauthlib.oauth2 import BackendApplicationClient
 from opaque_keys.edx.keys import CourseKey
@@ -13,9 +13,18 @@ from requests_oauthlib import OAuth2Session
 from openedx_external_enrollments.edxapp_wrapper.get_courseware import get_course_by_id
 from openedx_external_enrollments.edxapp_wrapper.get_student import CourseEnrollment, get_user
 from openedx_external_enrollments.external_enrollments.base_external_enrollment import BaseExternalEnrollment
-from openedx_external_enrollments.models import ProgramSalesforceEnrollment
+from openedx_external_enrollments.external_enrollments.http_session import get_http_session
+from openedx_external_enrollments.external_enrollments.token_cache import delete_cached_token, get_cached_token
+from openedx_external_enrollments.models import OtherCourseSettings, ProgramSalesforceEnrollment
 
 LOG = logging.getLogger(__name__)
+# Subset of the course attributes used to build the Salesforce payload.
+SalesforceCourse = namedtuple(
+    'SalesforceCourse',
+    ['display_name', 'start', 'end', 'self_paced', 'other_course_settings'],
+)
+# Learner data shared by all the lines of an order.
+SalesforceOrderContext = namedtuple('SalesforceOrderContext', ['user', 'profile', 'enrollments'])
 
 
 class SalesforceEnrollment(BaseExternalEnrollment):
@@ -25,6 +34,8 @@ class SalesforceEnrollment(BaseExternalEnrollment):
     def __init__(self):
         """Instantiate SalesForce variables."""
         self.CUSTOM_BUNDLE_TYPE = 'Special Offer'
+        self._courses = {}
+        self._order_context = None
 
     def __str__(self):
         return "salesforce"
@@ -38,7 +49,7 @@ class SalesforceEnrollment(BaseExternalEnrollment):
             settings.SALESFORCE_ENROLLMENT_BASIC_AUTH_PASSWORD
         )
 
-        response = requests.post(
+        response = get_http_session(url).post(
             url=url,
             data=data,
             headers=headers,
@@ -59,14 +70,83 @@ class SalesforceEnrollment(BaseExternalEnrollment):
 
     def _get_course(self, course_id):
         """
-        Return a course object.
+        Return a course object, loading it from the modulestore only once per order.
         """
         if not course_id:
             return None
 
-        course_key = self._get_course_key(course_id)
-        course = get_course_by_id(course_key)
-        return course
+        if course_id not in self._courses:
+            course_key = self._get_course_key(course_id)
+            self._courses[course_id] = get_course_by_id(course_key)
+
+        return self._courses[course_id]
+
+    def _get_order_courses(self, order_lines):
+        """
+        Return a dict with the course of every distinct course_id in the order lines.
+
+        The courses with OtherCourseSettings are built from them and their course overview
+        in a single query. The rest are left out, so _get_course loads them from the modulestore.
+        """
+        course_keys = self._get_order_course_keys(order_lines)
+
+        if not course_keys:
+            return {}
+
+        courses = {}
+        course_settings = OtherCourseSettings.objects.select_related(  # pylint: disable=no-member
+            'course',
+        ).filter(
+            course_id__in=course_keys,
+        )
+
+        for settings_record in course_settings:
+            overview = settings_record.course
+            courses[str(overview.id)] = SalesforceCourse(
+                display_name=overview.display_name,
+                start=overview.start,
+                end=overview.end,
+                self_paced=overview.self_paced,
+                other_course_settings=settings_record.other_course_settings or {},
+            )
+
+        return courses
+
+    def _get_order_course_keys(self, order_lines):
+        """
+        Return the set of valid course keys in the order lines.
+        """
+        course_keys = set()
+
+        for line in order_lines or []:
+            try:
+                course_keys.add(self._get_course_key(line.get("course_id")))
+            except Exception:  # pylint: disable=broad-except
+                pass
+
+        return course_keys
+
+    def _get_order_context(self, order_lines):
+        """
+        Return the user, profile and course enrollments of the order learner.
+
+        They are fetched once per order, the enrollments of all the order courses
+        in a single query.
+        """
+        if self._order_context is None:
+            email = order_lines[0].get("user_email")
+            user, profile = get_user(email=email)
+            enrollments = CourseEnrollment.objects.filter(
+                user=user,
+                course_id__in=self._get_order_course_keys(order_lines),
+            )
+            self._order_context = SalesforceOrderContext(
+                user=user,
+                profile=profile,
+                enrollments={str(enrollment.course_id): enrollment for enrollment in enrollments},
+            )
+
+        return self._order_context
 
     def _get_enrollment_headers(self):
         headers = {
@@ -89,8 +169,35 @@ class SalesforceEnrollment(BaseExternalEnrollment):
     @staticmethod
     def _get_auth_token():
         """
+        Return the Salesforce OAuth token, shared by all the enrollments until it expires.
+        """
+        return get_cached_token(
+            SalesforceEnrollment._get_token_name(),
+            SalesforceEnrollment._fetch_auth_token,
+        )
 
-        :return:
+    @staticmethod
+    def _get_token_name():
+        """
+        Return the name of the cached Salesforce OAuth token.
+        """
+        return 'salesforce.{}'.format(settings.SALESFORCE_API_CLIENT_ID)
+
+    def _forget_token(self):
+        """
+        Remove the cached Salesforce OAuth token, its instance url is requested again too.
+        """
+        if not settings.SALESFORCE_ENABLE_AUTHENTICATION:
+            return False
+
+        delete_cached_token(self._get_token_name())
+
+        return True
+
+    @staticmethod
+    def _fetch_auth_token():
+        """
+        Request a new OAuth token to Salesforce using the password grant.
         """
         request_params = {
             'client_id': settings.SALESFORCE_API_CLIENT_ID,
@@ -108,8 +215,7 @@ class SalesforceEnrollment(BaseExternalEnrollment):
 
         return token
 
-    @staticmethod
-    def _get_openedx_user(data):
+    def _get_openedx_user(self, data):
         """
         :param data:
         :return:
@@ -119,7 +225,7 @@ class SalesforceEnrollment(BaseExternalEnrollment):
         if order_lines:
             try:
                 email = order_lines[0].get("user_email")
-                _, openedx_profile = get_user(email=email)
+                openedx_profile = self._get_order_context(order_lines).profile
 
                 user["Email"] = email
                 if openedx_profile.user.first_name:
@@ -173,8 +279,7 @@ class SalesforceEnrollment(BaseExternalEnrollment):
         program_of_interest = {}
         program = data.get("program")
         try:
-            email = order_lines[0].get("user_email")
-            openedx_user, _ = get_user(email=email)
+            openedx_user = self._get_order_context(order_lines).user
             request_time = datetime.datetime.utcnow()
             if program:
                 bundle_id = program.get("uuid")
@@ -227,12 +332,13 @@ class SalesforceEnrollment(BaseExternalEnrollment):
                 course_id = line.get("course_id")
                 course = self._get_course(course_id)
                 course_key = self._get_course_key(course_id)
+                enrollment = self._get_order_context(order_lines).enrollments.get(str(course_key))
                 salesforce_settings = course.other_course_settings.get("salesforce_data")
                 course_data = dict()
                 course_data["CourseName"] = salesforce_settings.get("Program_Name") or course.display_name
                 course_data["CourseID"] = "{}+{}".format(course_key.org, course_key.course)
                 course_data["CourseRunID"] = course_id
-                course_data["CourseStartDate"] = self._get_course_start_date(course, line.get("user_email"), course_id)
+                course_data["CourseStartDate"] = self._get_course_start_date(course, enrollment)
                 course_data["CourseEndDate"] = course.end.strftime("%Y-%m-%d")
                 course_data["CourseDuration"] = "0"
             except Exception:  # pylint: disable=broad-except
@@ -254,15 +360,11 @@ class SalesforceEnrollment(BaseExternalEnrollment):
         )
 
     @staticmethod
-    def _get_course_start_date(course, email, course_id):
+    def _get_course_start_date(course, enrollment):
         """
         Return the course date start.
         """
 
-        user, _ = get_user(email=email)
-        course_key = CourseKey.from_string(course_id)
-        enrollment = CourseEnrollment.get_enrollment(user, course_key)
-
         if course.self_paced:
             dates_to_check = [enrollment.created, course.start]
             student_start = max(dates_to_check)
@@ -297,6 +399,8 @@ class SalesforceEnrollment(BaseExternalEnrollment):
         payload = {
             "enrollment": {}
         }
+        self._courses = self._get_order_courses(data.get("supported_lines"))
+        self._order_context = None
         openedx_user_info = self._get_openedx_user(data)
         payload["enrollment"].update(openedx_user_info)
 
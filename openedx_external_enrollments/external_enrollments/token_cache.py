@@ -0,0 +1,119 @@
+"""Django cache backed storage for the partner API access tokens."""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+LOG = logging.getLogger(__name__)
+CACHE_KEY_PREFIX = 'openedx_external_enrollments.token'
+LOCK_POLL_INTERVAL = 0.1
+
+
+def get_cached_token(token_name, fetch_token):
+    """
+    Return the token stored in cache for the given name, fetching a new one when needed.
+
+    The token is cached for the 'expires_in' seconds returned by the partner (or
+    OEE_TOKEN_CACHE_DEFAULT_EXPIRES_IN when it is not present). Once the token enters
+    its last OEE_TOKEN_CACHE_REFRESH_MARGIN seconds, it is still returned but a new
+    one is requested in background. A cache lock ensures that only one worker
+    requests a new token at the same time, the others wait for it until the lock is
+    released, and request the token on their own when the locking worker failed.
+
+    Args:
+        token_name: String that identifies the token, e.g. the controller name plus the client id.
+        fetch_token: Callable without arguments that returns the token dict or None if it failed.
+    Returns:
+        The token dict or None.
+    """
+    cache_key = '{}.{}'.format(CACHE_KEY_PREFIX, token_name)
+    lock_key = '{}.lock'.format(cache_key)
+    cached_entry = cache.get(cache_key)
+
+    if cached_entry:
+        must_refresh = time.time() >= cached_entry['refresh_at']
+
+        if must_refresh and cache.add(lock_key, True, settings.OEE_TOKEN_CACHE_LOCK_TIMEOUT):
+            _refresh_in_background(cache_key, lock_key, fetch_token)
+
+        return cached_entry['token']
+
+    if cache.add(lock_key, True, settings.OEE_TOKEN_CACHE_LOCK_TIMEOUT):
+        return _refresh_token(cache_key, lock_key, fetch_token)
+
+    # Another worker is requesting the token, wait for it before trying on our own.
+    deadline = time.time() + settings.OEE_TOKEN_CACHE_LOCK_TIMEOUT
+
+    while time.time() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        cached_entry = cache.get(cache_key)
+
+        if cached_entry:
+            return cached_entry['token']
+
+        if not cache.get(lock_key):
+            break
+
+    return _refresh_token(cache_key, None, fetch_token)
+
+
+def delete_cached_token(token_name):
+    """
+    Remove the token from cache, e.g. when the partner rejected it before its expiration.
+    """
+    cache.delete('{}.{}'.format(CACHE_KEY_PREFIX, token_name))
+
+
+def _refresh_token(cache_key, lock_key, fetch_token):
+    """
+    Fetch a new token and store it in cache. Failed fetches are not cached.
+    """
+    try:
+        token = fetch_token()
+
+        if token:
+            expires_in = _get_expires_in(token)
+            now = time.time()
+            cache.set(
+                cache_key,
+                {
+                    'token': token,
+                    'refresh_at': now + max(expires_in - settings.OEE_TOKEN_CACHE_REFRESH_MARGIN, 0),
+                },
+                expires_in,
+            )
+    finally:
+        if lock_key:
+            cache.delete(lock_key)
+
+    return token
+
+
+def _refresh_in_background(cache_key, lock_key, fetch_token):
+    """
+    Start a thread that refreshes the token while the current one is still valid.
+    """
+    def target():
+        try:
+            _refresh_token(cache_key, lock_key, fetch_token)
+        except Exception as error:  # pylint: disable=broad-except
+            LOG.error('Failed to refresh the token [%s] in background. Reason: %s', cache_key, str(error))
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=target)
+    thread.daemon = True
+    thread.start()
+
+
+def _get_expires_in(token):
+    """
+    Return the seconds the token is valid for.
+    """
+    try:
+        return int(token['expires_in'])
+    except (KeyError, TypeError, ValueError):
+        return settings.OEE_TOKEN_CACHE_DEFAULT_EXPIRES_IN
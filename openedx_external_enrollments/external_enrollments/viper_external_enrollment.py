@@ -1,12 +1,12 @@
 """ViperExternalEnrollment class file."""
 import logging
 
-import requests
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from rest_framework import status
 
 from openedx_external_enrollments.external_enrollments.base_external_enrollment import BaseExternalEnrollment
+from openedx_external_enrollments.external_enrollments.http_session import get_http_session
 from openedx_external_enrollments.models import EnrollmentRequestLog, ExternalEnrollment
 
 LOG = logging.getLogger(__name__)
@@ -28,7 +28,7 @@ class ViperExternalEnrollment(BaseExternalEnrollment):
         Execute post request.
         """
         course_shell_id = json_data.get('variables').pop('shellCourseId')
-        response = requests.post(
+        response = get_http_session(url).post(
             url=url,
             json=json_data,
             headers=headers,
@@ -89,7 +89,7 @@ class ViperExternalEnrollment(BaseExternalEnrollment):
         Method to execute a post request to viper's API, this will refresh the API key Expiration Date.
         """
         try:
-            response = requests.post(
+            response = get_http_session(settings.OEE_VIPER_API_URL).post(
                 url=settings.OEE_VIPER_API_URL,
                 headers={'x-api-key': settings.OEE_VIPER_MUTATIONS_API_KEY},
                 json={'action': self.REFRESH_API_KEY_ACTION},
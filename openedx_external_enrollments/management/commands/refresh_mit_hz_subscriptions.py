@@ -0,0 +1,67 @@
+"""
+Script for refreshing the subscription of every learner enrolled in MIT HZ courses.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from openedx_external_enrollments.external_enrollments.mit_hz_external_enrollment import MITHzInstanceExternalEnrollment
+
+
+class Command(BaseCommand):
+    """
+    Refresh the MIT HZ subscriptions via django command.
+    Optional command arguments:
+        batch_size -> number of enrollments processed per batch.
+        max_workers -> number of concurrent MIT HZ API calls.
+        provider -> MIT HZ provider of the user ids, MIT_HZ_PROVIDER setting by default.
+        org -> MIT HZ organization of the user ids, MIT_HZ_ORG setting by default.
+    Example: 'python manage.py lms refresh_mit_hz_subscriptions -bs 500 -mw 8 --provider samlp --org Pearson'.
+    """
+    help = """Refresh the subscription stored in every MIT HZ enrollment.
+    Example: \'python manage.py lms refresh_mit_hz_subscriptions -bs 500 -mw 8\'.
+    """
+
+    def add_arguments(self, parser):
+        """
+        Optional command arguments:
+        batch_size -> number of enrollments processed per batch.
+        max_workers -> number of concurrent MIT HZ API calls.
+        provider -> MIT HZ provider of the user ids.
+        org -> MIT HZ organization of the user ids.
+        """
+        parser.add_argument(
+            '-bs', '--batch_size',
+            type=int,
+            help='Number of enrollments processed per batch.',
+            default=settings.OEE_MIT_HZ_REFRESH_BATCH_SIZE,
+        )
+        parser.add_argument(
+            '-mw', '--max_workers',
+            type=int,
+            help='Number of concurrent MIT HZ API calls.',
+            default=settings.OEE_MIT_HZ_REFRESH_MAX_WORKERS,
+        )
+        parser.add_argument(
+            '--provider',
+            help='MIT HZ provider of the user ids, the site configuration MIT_HZ_PROVIDER.',
+            default=settings.MIT_HZ_PROVIDER,
+        )
+        parser.add_argument(
+            '--org',
+            help='MIT HZ organization of the user ids, the site configuration MIT_HZ_ORG.',
+            default=settings.MIT_HZ_ORG,
+        )
+
+    def handle(self, *args, **options):
+        """
+        Execute the command.
+        """
+        summary = MITHzInstanceExternalEnrollment().refresh_subscriptions(
+            batch_size=options.get('batch_size'),
+            max_workers=options.get('max_workers'),
+            site_configuration={
+                'MIT_HZ_PROVIDER': options.get('provider'),
+                'MIT_HZ_ORG': options.get('org'),
+            },
+        )
+        self.stdout.write('MIT HZ subscriptions refresh finished: {}'.format(summary))
@@ -0,0 +1,43 @@
+"""
+Script for requeuing the quarantined Pathstream enrollment events.
+"""
+from django.core.management.base import BaseCommand
+
+from openedx_external_enrollments.external_enrollments.pathstream_external_enrollment import (
+    PathstreamExternalEnrollment,
+)
+
+
+class Command(BaseCommand):
+    """
+    Requeue the quarantined Pathstream enrollment events via django command.
+    Optional command arguments:
+        event_ids -> ids of the events to requeue, all the quarantined ones by default.
+    Example: 'python manage.py lms requeue_pathstream_events --event_ids 10 11'.
+    """
+    help = """Rebuild the line of the quarantined Pathstream enrollment events and queue them for the next export.
+    Example: \'python manage.py lms requeue_pathstream_events --event_ids 10 11\'.
+    """
+
+    def add_arguments(self, parser):
+        """
+        Optional command arguments:
+        event_ids -> ids of the events to requeue.
+        """
+        parser.add_argument(
+            '--event_ids',
+            type=int,
+            nargs='+',
+            help='Ids of the events to requeue, all the quarantined ones by default.',
+        )
+
+    def handle(self, *args, **options):
+        """
+        Execute the command.
+        """
+        requeued_count, failed_count = PathstreamExternalEnrollment().requeue_quarantined_events(
+            options.get('event_ids'),
+        )
+        self.stdout.write(
+            '{} quarantined events were requeued, {} could not be requeued.'.format(requeued_count, failed_count),
+        )
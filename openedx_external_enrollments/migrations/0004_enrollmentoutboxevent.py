@@ -0,0 +1,33 @@
+# Generated by Django 2.2.24 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import jsonfield.encoder
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openedx_external_enrollments', '0003_externalenrollment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnrollmentOutboxEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('controller_name', models.CharField(max_length=50)),
+                ('course_id', models.CharField(max_length=255)),
+                ('email', models.EmailField(max_length=254)),
+                ('payload', jsonfield.fields.JSONField(blank=True, dump_kwargs={'cls': jsonfield.encoder.JSONEncoder, 'separators': (',', ':')}, load_kwargs={})),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('delivered', 'Delivered'), ('coalesced', 'Coalesced'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='enrollmentoutboxevent',
+            index=models.Index(fields=['status', 'id'], name='openedx_ext_status_67ef97_idx'),
+        ),
+    ]
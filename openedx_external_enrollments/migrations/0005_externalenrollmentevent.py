@@ -0,0 +1,54 @@
+# Generated by Django 2.2.24 on 2026-10-18 14:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def move_pending_uploads(apps, schema_editor):
+    """
+    Create an event for every enrollment line that is waiting to be uploaded,
+    since the upload state is not read from the meta anymore.
+    """
+    ExternalEnrollment = apps.get_model('openedx_external_enrollments', 'ExternalEnrollment')
+    ExternalEnrollmentEvent = apps.get_model('openedx_external_enrollments', 'ExternalEnrollmentEvent')
+    enrollments = ExternalEnrollment.objects.filter(meta__icontains='"is_uploaded":false')
+
+    for enrollment in enrollments.iterator():
+        events = []
+
+        for enrollment_data in enrollment.meta:
+            if not enrollment_data.pop('is_uploaded', True):
+                events.append(
+                    ExternalEnrollmentEvent(
+                        enrollment=enrollment,
+                        data=enrollment_data.get('enrollment_data_formated', ''),
+                    )
+                )
+
+        ExternalEnrollmentEvent.objects.bulk_create(events)
+        enrollment.save(update_fields=['meta'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openedx_external_enrollments', '0004_enrollmentoutboxevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExternalEnrollmentEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('uploaded_at', models.DateTimeField(blank=True, null=True)),
+                ('enrollment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='openedx_external_enrollments.ExternalEnrollment')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='externalenrollmentevent',
+            index=models.Index(fields=['uploaded_at', 'id'], name='openedx_ext_uploade_a7ddc5_idx'),
+        ),
+        migrations.RunPython(move_pending_uploads, migrations.RunPython.noop),
+    ]
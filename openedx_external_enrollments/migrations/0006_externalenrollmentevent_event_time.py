@@ -0,0 +1,72 @@
+# Generated by Django 2.2.24 on 2026-10-18 15:00
+
+from datetime import datetime
+
+from django.db import migrations, models
+from django.utils import timezone
+
+LEGACY_DATETIME_FORMATS = ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S')
+
+
+def parse_event_time(data):
+    """
+    Return the aware datetime written in the seventh field of the line, None if it can't be parsed.
+    """
+    fields = data.split(',')
+
+    if len(fields) != 8:
+        return None
+
+    for datetime_format in LEGACY_DATETIME_FORMATS:
+        try:
+            return timezone.make_aware(datetime.strptime(fields[6], datetime_format), timezone.utc)
+        except ValueError:
+            continue
+
+    return None
+
+
+def set_pending_events_time(apps, schema_editor):
+    """
+    Set the event_time of the pending events from their line, since the pending events are
+    exported in that order. Events whose line is malformed are quarantined.
+    """
+    ExternalEnrollmentEvent = apps.get_model('openedx_external_enrollments', 'ExternalEnrollmentEvent')
+    pending_events = ExternalEnrollmentEvent.objects.filter(uploaded_at__isnull=True)
+
+    for event in pending_events.iterator():
+        event.event_time = parse_event_time(event.data)
+
+        if not event.event_time:
+            event.quarantined_at = timezone.now()
+
+        event.save(update_fields=['event_time', 'quarantined_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openedx_external_enrollments', '0005_externalenrollmentevent'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='externalenrollmentevent',
+            name='openedx_ext_uploade_a7ddc5_idx',
+        ),
+        migrations.AddField(
+            model_name='externalenrollmentevent',
+            name='event_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='externalenrollmentevent',
+            name='quarantined_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='externalenrollmentevent',
+            index=models.Index(fields=['uploaded_at', 'quarantined_at', 'event_time', 'id'], name='openedx_ext_uploade_e7c8b1_idx'),
+        ),
+        migrations.RunPython(set_pending_events_time, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.24 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openedx_external_enrollments', '0006_externalenrollmentevent_event_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ICCUser',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('icc_user_id', models.CharField(max_length=32)),
+                ('username', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'ICC user',
+            },
+        ),
+    ]
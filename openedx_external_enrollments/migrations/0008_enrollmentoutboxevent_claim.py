@@ -0,0 +1,23 @@
+# Generated by Django 2.2.24 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openedx_external_enrollments', '0007_iccuser'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enrollmentoutboxevent',
+            name='claim_id',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='enrollmentoutboxevent',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
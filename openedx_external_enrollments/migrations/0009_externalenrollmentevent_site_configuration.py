@@ -0,0 +1,20 @@
+# Generated by Django 2.2.24 on 2026-10-18 20:00
+
+from django.db import migrations
+import jsonfield.encoder
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openedx_external_enrollments', '0008_enrollmentoutboxevent_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='externalenrollmentevent',
+            name='site_configuration',
+            field=jsonfield.fields.JSONField(blank=True, default=dict, dump_kwargs={'cls': jsonfield.encoder.JSONEncoder, 'separators': (',', ':')}, load_kwargs={}),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.24 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openedx_external_enrollments', '0009_externalenrollmentevent_site_configuration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enrollmentoutboxevent',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
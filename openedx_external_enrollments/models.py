@@ -101,3 +101,128 @@ class ExternalEnrollment(models.Model):
         Model meta class.
         """
         app_label = "openedx_external_enrollments"
+
+
+class ExternalEnrollmentEvent(models.Model):
+    """
+    Model to persist the enrollment events that a periodic task exports to the partner.
+
+    The upload state lives in an indexed column, so the pending events are found with
+    an index range scan instead of searching the ExternalEnrollment meta.
+
+    Fields:
+        enrollment: ExternalEnrollment the event belongs to.
+        data: Formatted line that is exported for the event.
+        event_time: Datetime written in the formatted line, used to export the events in order.
+        created_at: Datetime when the event happened.
+        uploaded_at: Datetime when the event was exported, None while it is pending.
+        quarantined_at: Datetime when the event was excluded from the export because its line is malformed.
+        site_configuration: Site configuration values of the controller when the event happened, since the
+            periodic task runs outside of any site.
+    """
+    enrollment = models.ForeignKey(ExternalEnrollment, on_delete=models.CASCADE, related_name='events')
+    data = models.TextField()
+    event_time = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    uploaded_at = models.DateTimeField(null=True, blank=True)
+    quarantined_at = models.DateTimeField(null=True, blank=True)
+    site_configuration = JSONField(default=dict, blank=True)
+
+    class Meta:
+        """
+        Model meta class.
+        """
+        app_label = "openedx_external_enrollments"
+        indexes = [
+            models.Index(fields=['uploaded_at', 'quarantined_at', 'event_time', 'id']),
+        ]
+
+
+class EnrollmentOutboxEvent(models.Model):
+    """
+    Model to persist the external enrollment events before they are delivered.
+
+    The events are written in the same database transaction as the enrollment that
+    triggered them, so an enrollment can't be lost if the process dies before the
+    partner is called. The run_enrollment_outbox_relay task delivers them in batches.
+
+    Fields:
+        controller_name: Controller name.
+        course_id: Course id from the platform course.
+        email: Email of the learner.
+        payload: enrollment data, course settings and site configuration required by the controller. e.g:
+            {
+                'data': {'user_email': 'learner@example.com', 'is_active': True, ...},
+                'course_settings': {'external_platform_target': 'icc', ...},
+                'site_configuration': {'ICC_AUTH_METHOD_OVERRIDE': 'saml2', ...},
+            }
+        status: pending, delivered, coalesced or failed.
+        attempts: Number of failed deliveries.
+        created_at: Datetime when the event happened.
+        processed_at: Datetime when the event left the pending status.
+        claim_id: Id of the relay run that is delivering the event.
+        claimed_until: Datetime when the claim expires, then another relay run can deliver the event.
+        next_attempt_at: Datetime when a failed event can be delivered again.
+    """
+    PENDING = 'pending'
+    DELIVERED = 'delivered'
+    COALESCED = 'coalesced'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (DELIVERED, 'Delivered'),
+        (COALESCED, 'Coalesced'),
+        (FAILED, 'Failed'),
+    )
+
+    controller_name = models.CharField(max_length=50)
+    course_id = models.CharField(max_length=255)
+    email = models.EmailField()
+    payload = JSONField(null=False, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    claim_id = models.UUIDField(null=True, blank=True)
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        """
+        Model meta class.
+        """
+        app_label = "openedx_external_enrollments"
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+
+
+class ICCUser(models.Model):
+    """
+    Model to persist the ICC user that belongs to every learner email.
+
+    The ICC user is looked up, or created, through the ICC web services the first time the learner
+    is enrolled, later enrollments read it from this table instead.
+
+    Fields:
+        email: Email of the learner, in lowercase.
+        icc_user_id: Id of the user in ICC.
+        username: Username of the user in ICC.
+        created_at: Datetime when the user was stored.
+        updated_at: Datetime when the user was updated.
+    """
+    email = models.EmailField(unique=True)
+    icc_user_id = models.CharField(max_length=32)
+    username = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        """
+        Model meta class.
+        """
+        app_label = "openedx_external_enrollments"
+        verbose_name = "ICC user"
+
+    def __str__(self):
+        return self.email
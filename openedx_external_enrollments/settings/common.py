@@ -10,6 +10,9 @@ https://docs.djangoproject.com/en/1.11/ref/settings/
 
 from __future__ import unicode_literals
 
+import os
+import tempfile
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/1.11/howto/deployment/checklist/
 
@@ -49,6 +52,7 @@ def plugin_settings(settings):  # pylint: disable=R0915
     settings.OEE_SITE_CONFIGURATION_BACKEND = \
         'openedx_external_enrollments.edxapp_wrapper.backends.site_configuration_module_i_v1'
     settings.OEE_STUDENT_BACKEND = 'openedx_external_enrollments.edxapp_wrapper.backends.student_i_v1'
+    settings.OEE_SUBMISSIONS_BACKEND = 'openedx_external_enrollments.edxapp_wrapper.backends.submissions_i_v1'
     settings.EDX_ENTERPRISE_API_CLIENT_ID = "client-id"
     settings.EDX_ENTERPRISE_API_CLIENT_SECRET = "client-secret"
     settings.EDX_ENTERPRISE_API_TOKEN_URL = "https://api.edx.org/oauth2/v1/access_token"
@@ -67,14 +71,26 @@ def plugin_settings(settings):  # pylint: disable=R0915
     settings.SALESFORCE_ENROLLMENT_API_PATH = "pa-edx/lead"
     settings.DROPBOX_API_ARG_DOWNLOAD = '{"path":"%s"}'
     settings.DROPBOX_API_DOWNLOAD_URL = "/files/download"
-    settings.DROPBOX_API_ARG_UPLOAD = '{"path":"%s","mode":{".tag":"overwrite"}}'
     settings.DROPBOX_API_UPLOAD_URL = "/files/upload"
+    settings.DROPBOX_API_UPLOAD_SESSION_START_URL = "/files/upload_session/start"
+    settings.DROPBOX_API_UPLOAD_SESSION_APPEND_URL = "/files/upload_session/append_v2"
+    settings.DROPBOX_API_UPLOAD_SESSION_FINISH_URL = "/files/upload_session/finish"
+    settings.DROPBOX_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
     settings.DROPBOX_DATE_FORMAT = "%m-%d-%Y %H:%M:%S"
+    settings.DROPBOX_API_URL = "https://content.dropboxapi.com/2"
+    settings.DROPBOX_API_RPC_URL = "https://api.dropboxapi.com/2"
+    settings.DROPBOX_API_GET_METADATA_URL = "/files/get_metadata"
+    settings.DROPBOX_LOCAL_COPY_DIR = os.path.join(tempfile.gettempdir(), 'openedx_external_enrollments')
+    settings.DROPBOX_FILE_PATH = "/courses.txt"
+    settings.DROPBOX_TOKEN = "token"
+    settings.OEE_GREENFIG_FLUSH_BATCH_SIZE = 1000
+    settings.OEE_GREENFIG_FLUSH_LOCK_TIMEOUT = 10 * 60
     settings.ICC_API_TOKEN = "icc-api-token"
     settings.ICC_BASE_URL = "https://icchas11.stage.kineoplatforms.net/webservice/rest/server.php"
     settings.ICC_ENROLLMENT_API_FUNCTION = "enrol_manual_enrol_users"
     settings.ICC_GET_USER_API_FUNCTION = "core_user_get_users"
     settings.ICC_CREATE_USER_API_FUNCTION = "core_user_create_users"
+    settings.ICC_GET_USERS_BY_FIELD_API_FUNCTION = "core_user_get_users_by_field"
     settings.ICC_LEARNER_ROLE_ID = "5"
     settings.ICC_HASH_LENGTH = 10
     settings.ICC_AUTH_METHOD = "saml2"
@@ -87,6 +103,8 @@ def plugin_settings(settings):  # pylint: disable=R0915
     settings.MIT_HZ_REFRESH_PATH = "/partner_api/pearson/refresh_user"
     settings.MIT_HZ_ID = "mit-hz-id"
     settings.MIT_HZ_SECRET = "mit-hz-secret"
+    settings.MIT_HZ_PROVIDER = "samlp"
+    settings.MIT_HZ_ORG = "Pearson"
     settings.OEE_VIPER_MUTATIONS_API_KEY = 'viper-mutations-api-key'
     settings.OEE_VIPER_API_URL = 'https://vip-demo-api.virtual-academies.com/holistic'
     settings.OEE_VIPER_IDP = 'okta'
@@ -94,4 +112,32 @@ def plugin_settings(settings):  # pylint: disable=R0915
     settings.OEE_PATHSTREAM_S3_BUCKET = 'remoteloggerpathstream'
     settings.OOE_PATHSTREAM_S3_ACCESS_KEY = 'access_key'
     settings.OOE_PATHSTREAM_S3_SECRET_KEY = 'secret_access_key'
-    settings.OOE_PATHSTREAM_S3_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+    settings.OEE_PATHSTREAM_S3_APPEND_MODE = False
+    settings.OEE_PATHSTREAM_S3_PARTS_PREFIX = 'pathstream_external_enrollments_parts'
+    settings.OEE_PATHSTREAM_S3_CHUNK_SIZE = 8 * 1024 * 1024
+    settings.OEE_PATHSTREAM_UPLOAD_BATCH_SIZE = 1000
+    settings.OEE_PATHSTREAM_COMPACTION_LOCK_TIMEOUT = 10 * 60
+    settings.OEE_HTTP_POOL_CONNECTIONS = 10
+    settings.OEE_HTTP_POOL_MAXSIZE = 10
+    settings.OEE_HTTP_POOL_BLOCK = False
+    settings.OEE_HTTP_KEEP_ALIVE = True
+    settings.OEE_TOKEN_CACHE_DEFAULT_EXPIRES_IN = 15 * 60
+    settings.OEE_TOKEN_CACHE_REFRESH_MARGIN = 60
+    settings.OEE_TOKEN_CACHE_LOCK_TIMEOUT = 10
+    settings.OEE_ASYNC_EXTERNAL_ENROLLMENT_CONTROLLERS = []
+    settings.OEE_ASYNC_EXTERNAL_ENROLLMENT_RETRY_POLICIES = {}
+    settings.OEE_OUTBOX_EXTERNAL_ENROLLMENT_CONTROLLERS = []
+    settings.OEE_ENROLLMENT_OUTBOX_BATCH_SIZE = 100
+    settings.OEE_ENROLLMENT_OUTBOX_LEASE_TIMEOUT = 10 * 60
+    settings.OEE_COURSE_SETTINGS_CACHE_TIMEOUT = 60 * 60
+    settings.OEE_COURSE_SETTINGS_LOCAL_CACHE_TIMEOUT = 60
+    settings.OEE_COURSE_SETTINGS_LOCAL_CACHE_SIZE = 1000
+    settings.OEE_COURSE_HOME_CACHE_TIMEOUT = 60
+    settings.OEE_ANONYMOUS_ID_CACHE_TIMEOUT = 24 * 60 * 60
+    settings.OEE_ENTRY_POINTS_COMPLETION_CACHE_TIMEOUT = 60 * 60
+    settings.OEE_ICC_USER_CACHE_TIMEOUT = 24 * 60 * 60
+    settings.OEE_ICC_BULK_REQUEST_SIZE = 100
+    settings.OEE_MIT_HZ_REFRESH_BATCH_SIZE = 500
+    settings.OEE_MIT_HZ_REFRESH_MAX_WORKERS = 8
+    settings.OEE_MIT_HZ_USER_MISS_CACHE_TIMEOUT = 5 * 60
+    settings.OEE_MIT_HZ_USER_MISS_CACHE_MAX_TIMEOUT = 24 * 60 * 60
@@ -5,7 +5,7 @@ Production Django settings for openedx_external_enrollments project.
 from __future__ import unicode_literals
 
 
-def plugin_settings(settings):
+def plugin_settings(settings):  # pylint: disable=R0915
     """
     Set of plugin settings used by the Open Edx platform.
     More info: https://github.com/edx/edx-platform/blob/master/openedx/core/djangoapps/plugins/README.rst
@@ -70,10 +70,6 @@ def plugin_settings(settings):
         'DROPBOX_API_ARG_DOWNLOAD',
         settings.DROPBOX_API_ARG_DOWNLOAD,
     )
-    settings.DROPBOX_API_ARG_UPLOAD = getattr(settings, 'ENV_TOKENS', {}).get(
-        'DROPBOX_API_ARG_UPLOAD',
-        settings.DROPBOX_API_ARG_UPLOAD,
-    )
     settings.DROPBOX_API_DOWNLOAD_URL = getattr(settings, 'ENV_TOKENS', {}).get(
         'DROPBOX_API_DOWNLOAD_URL',
         settings.DROPBOX_API_DOWNLOAD_URL,
@@ -82,10 +78,58 @@ def plugin_settings(settings):
         'DROPBOX_API_UPLOAD_URL',
         settings.DROPBOX_API_UPLOAD_URL,
     )
+    settings.DROPBOX_API_UPLOAD_SESSION_START_URL = getattr(settings, 'ENV_TOKENS', {}).get(
+        'DROPBOX_API_UPLOAD_SESSION_START_URL',
+        settings.DROPBOX_API_UPLOAD_SESSION_START_URL,
+    )
+    settings.DROPBOX_API_UPLOAD_SESSION_APPEND_URL = getattr(settings, 'ENV_TOKENS', {}).get(
+        'DROPBOX_API_UPLOAD_SESSION_APPEND_URL',
+        settings.DROPBOX_API_UPLOAD_SESSION_APPEND_URL,
+    )
+    settings.DROPBOX_API_UPLOAD_SESSION_FINISH_URL = getattr(settings, 'ENV_TOKENS', {}).get(
+        'DROPBOX_API_UPLOAD_SESSION_FINISH_URL',
+        settings.DROPBOX_API_UPLOAD_SESSION_FINISH_URL,
+    )
+    settings.DROPBOX_UPLOAD_CHUNK_SIZE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'DROPBOX_UPLOAD_CHUNK_SIZE',
+        settings.DROPBOX_UPLOAD_CHUNK_SIZE,
+    )
     settings.DROPBOX_DATE_FORMAT = getattr(settings, 'ENV_TOKENS', {}).get(
         'DROPBOX_DATE_FORMAT',
         settings.DROPBOX_DATE_FORMAT,
     )
+    settings.DROPBOX_API_URL = getattr(settings, 'ENV_TOKENS', {}).get(
+        'DROPBOX_API_URL',
+        settings.DROPBOX_API_URL,
+    )
+    settings.DROPBOX_API_RPC_URL = getattr(settings, 'ENV_TOKENS', {}).get(
+        'DROPBOX_API_RPC_URL',
+        settings.DROPBOX_API_RPC_URL,
+    )
+    settings.DROPBOX_API_GET_METADATA_URL = getattr(settings, 'ENV_TOKENS', {}).get(
+        'DROPBOX_API_GET_METADATA_URL',
+        settings.DROPBOX_API_GET_METADATA_URL,
+    )
+    settings.DROPBOX_LOCAL_COPY_DIR = getattr(settings, 'ENV_TOKENS', {}).get(
+        'DROPBOX_LOCAL_COPY_DIR',
+        settings.DROPBOX_LOCAL_COPY_DIR,
+    )
+    settings.DROPBOX_FILE_PATH = getattr(settings, 'ENV_TOKENS', {}).get(
+        'DROPBOX_FILE_PATH',
+        settings.DROPBOX_FILE_PATH,
+    )
+    settings.DROPBOX_TOKEN = getattr(settings, 'AUTH_TOKENS', {}).get(
+        'DROPBOX_TOKEN',
+        settings.DROPBOX_TOKEN,
+    )
+    settings.OEE_GREENFIG_FLUSH_BATCH_SIZE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_GREENFIG_FLUSH_BATCH_SIZE',
+        settings.OEE_GREENFIG_FLUSH_BATCH_SIZE,
+    )
+    settings.OEE_GREENFIG_FLUSH_LOCK_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_GREENFIG_FLUSH_LOCK_TIMEOUT',
+        settings.OEE_GREENFIG_FLUSH_LOCK_TIMEOUT,
+    )
     settings.ICC_API_TOKEN = getattr(settings, 'ENV_TOKENS', {}).get(
         'ICC_API_TOKEN',
         settings.ICC_API_TOKEN,
@@ -106,6 +150,10 @@ def plugin_settings(settings):
         'ICC_CREATE_USER_API_FUNCTION',
         settings.ICC_CREATE_USER_API_FUNCTION,
     )
+    settings.ICC_GET_USERS_BY_FIELD_API_FUNCTION = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ICC_GET_USERS_BY_FIELD_API_FUNCTION',
+        settings.ICC_GET_USERS_BY_FIELD_API_FUNCTION,
+    )
     settings.ICC_LEARNER_ROLE_ID = getattr(settings, 'ENV_TOKENS', {}).get(
         'ICC_LEARNER_ROLE_ID',
         settings.ICC_LEARNER_ROLE_ID,
@@ -138,6 +186,14 @@ def plugin_settings(settings):
         'MIT_HZ_SECRET',
         settings.MIT_HZ_SECRET,
     )
+    settings.MIT_HZ_PROVIDER = getattr(settings, 'ENV_TOKENS', {}).get(
+        'MIT_HZ_PROVIDER',
+        settings.MIT_HZ_PROVIDER,
+    )
+    settings.MIT_HZ_ORG = getattr(settings, 'ENV_TOKENS', {}).get(
+        'MIT_HZ_ORG',
+        settings.MIT_HZ_ORG,
+    )
     settings.OEE_VIPER_MUTATIONS_API_KEY = getattr(settings, 'ENV_TOKENS', {}).get(
         'OEE_VIPER_MUTATIONS_API_KEY',
         settings.OEE_VIPER_MUTATIONS_API_KEY,
@@ -166,7 +222,119 @@ def plugin_settings(settings):
         'OOE_PATHSTREAM_S3_SECRET_KEY',
         settings.OOE_PATHSTREAM_S3_SECRET_KEY,
     )
-    settings.OOE_PATHSTREAM_S3_DATETIME_FORMAT = getattr(settings, 'ENV_TOKENS', {}).get(
-        'OOE_PATHSTREAM_S3_DATETIME_FORMAT',
-        settings.OOE_PATHSTREAM_S3_DATETIME_FORMAT,
+    settings.OEE_PATHSTREAM_S3_APPEND_MODE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_PATHSTREAM_S3_APPEND_MODE',
+        settings.OEE_PATHSTREAM_S3_APPEND_MODE,
+    )
+    settings.OEE_PATHSTREAM_S3_PARTS_PREFIX = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_PATHSTREAM_S3_PARTS_PREFIX',
+        settings.OEE_PATHSTREAM_S3_PARTS_PREFIX,
+    )
+    settings.OEE_PATHSTREAM_S3_CHUNK_SIZE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_PATHSTREAM_S3_CHUNK_SIZE',
+        settings.OEE_PATHSTREAM_S3_CHUNK_SIZE,
+    )
+    settings.OEE_PATHSTREAM_UPLOAD_BATCH_SIZE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_PATHSTREAM_UPLOAD_BATCH_SIZE',
+        settings.OEE_PATHSTREAM_UPLOAD_BATCH_SIZE,
+    )
+    settings.OEE_PATHSTREAM_COMPACTION_LOCK_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_PATHSTREAM_COMPACTION_LOCK_TIMEOUT',
+        settings.OEE_PATHSTREAM_COMPACTION_LOCK_TIMEOUT,
+    )
+    settings.OEE_HTTP_POOL_CONNECTIONS = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_HTTP_POOL_CONNECTIONS',
+        settings.OEE_HTTP_POOL_CONNECTIONS,
+    )
+    settings.OEE_HTTP_POOL_MAXSIZE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_HTTP_POOL_MAXSIZE',
+        settings.OEE_HTTP_POOL_MAXSIZE,
+    )
+    settings.OEE_HTTP_POOL_BLOCK = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_HTTP_POOL_BLOCK',
+        settings.OEE_HTTP_POOL_BLOCK,
+    )
+    settings.OEE_HTTP_KEEP_ALIVE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_HTTP_KEEP_ALIVE',
+        settings.OEE_HTTP_KEEP_ALIVE,
+    )
+    settings.OEE_TOKEN_CACHE_DEFAULT_EXPIRES_IN = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_TOKEN_CACHE_DEFAULT_EXPIRES_IN',
+        settings.OEE_TOKEN_CACHE_DEFAULT_EXPIRES_IN,
+    )
+    settings.OEE_TOKEN_CACHE_REFRESH_MARGIN = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_TOKEN_CACHE_REFRESH_MARGIN',
+        settings.OEE_TOKEN_CACHE_REFRESH_MARGIN,
+    )
+    settings.OEE_TOKEN_CACHE_LOCK_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_TOKEN_CACHE_LOCK_TIMEOUT',
+        settings.OEE_TOKEN_CACHE_LOCK_TIMEOUT,
+    )
+    settings.OEE_ASYNC_EXTERNAL_ENROLLMENT_CONTROLLERS = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_ASYNC_EXTERNAL_ENROLLMENT_CONTROLLERS',
+        settings.OEE_ASYNC_EXTERNAL_ENROLLMENT_CONTROLLERS,
+    )
+    settings.OEE_ASYNC_EXTERNAL_ENROLLMENT_RETRY_POLICIES = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_ASYNC_EXTERNAL_ENROLLMENT_RETRY_POLICIES',
+        settings.OEE_ASYNC_EXTERNAL_ENROLLMENT_RETRY_POLICIES,
+    )
+    settings.OEE_OUTBOX_EXTERNAL_ENROLLMENT_CONTROLLERS = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_OUTBOX_EXTERNAL_ENROLLMENT_CONTROLLERS',
+        settings.OEE_OUTBOX_EXTERNAL_ENROLLMENT_CONTROLLERS,
+    )
+    settings.OEE_ENROLLMENT_OUTBOX_BATCH_SIZE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_ENROLLMENT_OUTBOX_BATCH_SIZE',
+        settings.OEE_ENROLLMENT_OUTBOX_BATCH_SIZE,
+    )
+    settings.OEE_ENROLLMENT_OUTBOX_LEASE_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_ENROLLMENT_OUTBOX_LEASE_TIMEOUT',
+        settings.OEE_ENROLLMENT_OUTBOX_LEASE_TIMEOUT,
+    )
+    settings.OEE_COURSE_SETTINGS_CACHE_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_COURSE_SETTINGS_CACHE_TIMEOUT',
+        settings.OEE_COURSE_SETTINGS_CACHE_TIMEOUT,
+    )
+    settings.OEE_COURSE_SETTINGS_LOCAL_CACHE_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_COURSE_SETTINGS_LOCAL_CACHE_TIMEOUT',
+        settings.OEE_COURSE_SETTINGS_LOCAL_CACHE_TIMEOUT,
+    )
+    settings.OEE_COURSE_SETTINGS_LOCAL_CACHE_SIZE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_COURSE_SETTINGS_LOCAL_CACHE_SIZE',
+        settings.OEE_COURSE_SETTINGS_LOCAL_CACHE_SIZE,
+    )
+    settings.OEE_COURSE_HOME_CACHE_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_COURSE_HOME_CACHE_TIMEOUT',
+        settings.OEE_COURSE_HOME_CACHE_TIMEOUT,
+    )
+    settings.OEE_ANONYMOUS_ID_CACHE_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_ANONYMOUS_ID_CACHE_TIMEOUT',
+        settings.OEE_ANONYMOUS_ID_CACHE_TIMEOUT,
+    )
+    settings.OEE_ENTRY_POINTS_COMPLETION_CACHE_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_ENTRY_POINTS_COMPLETION_CACHE_TIMEOUT',
+        settings.OEE_ENTRY_POINTS_COMPLETION_CACHE_TIMEOUT,
+    )
+    settings.OEE_ICC_USER_CACHE_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_ICC_USER_CACHE_TIMEOUT',
+        settings.OEE_ICC_USER_CACHE_TIMEOUT,
+    )
+    settings.OEE_ICC_BULK_REQUEST_SIZE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_ICC_BULK_REQUEST_SIZE',
+        settings.OEE_ICC_BULK_REQUEST_SIZE,
+    )
+    settings.OEE_MIT_HZ_REFRESH_BATCH_SIZE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_MIT_HZ_REFRESH_BATCH_SIZE',
+        settings.OEE_MIT_HZ_REFRESH_BATCH_SIZE,
+    )
+    settings.OEE_MIT_HZ_REFRESH_MAX_WORKERS = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_MIT_HZ_REFRESH_MAX_WORKERS',
+        settings.OEE_MIT_HZ_REFRESH_MAX_WORKERS,
+    )
+    settings.OEE_MIT_HZ_USER_MISS_CACHE_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_MIT_HZ_USER_MISS_CACHE_TIMEOUT',
+        settings.OEE_MIT_HZ_USER_MISS_CACHE_TIMEOUT,
+    )
+    settings.OEE_MIT_HZ_USER_MISS_CACHE_MAX_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OEE_MIT_HZ_USER_MISS_CACHE_MAX_TIMEOUT',
+        settings.OEE_MIT_HZ_USER_MISS_CACHE_MAX_TIMEOUT,
     )
@@ -26,6 +26,7 @@ OEE_OPENEDX_PERMISSIONS = 'openedx_external_enrollments.tests.tests_backends'
 OEE_OPENEDX_AUTH = 'openedx_external_enrollments.tests.tests_backends'
 OEE_SITE_CONFIGURATION_BACKEND = 'openedx_external_enrollments.tests.tests_backends'
 OEE_STUDENT_BACKEND = 'openedx_external_enrollments.tests.tests_backends'
+OEE_SUBMISSIONS_BACKEND = 'openedx_external_enrollments.tests.tests_backends'
 
 EDX_API_KEY = 'edx-text-api-key'
 EDX_ENTERPRISE_API_CLIENT_ID = 'edx-test-api-client-id'
@@ -45,9 +46,20 @@ SALESFORCE_ENABLE_AUTHENTICATION = True
 
 DROPBOX_API_ARG_DOWNLOAD = '%s-download'
 DROPBOX_API_DOWNLOAD_URL = 'dropbox-tets-api-download-url'
-DROPBOX_API_ARG_UPLOAD = '%s-upload'
 DROPBOX_API_UPLOAD_URL = 'dropbox-tets-api-upload-url'
+DROPBOX_API_UPLOAD_SESSION_START_URL = '/start'
+DROPBOX_API_UPLOAD_SESSION_APPEND_URL = '/append'
+DROPBOX_API_UPLOAD_SESSION_FINISH_URL = '/finish'
+DROPBOX_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
 DROPBOX_DATE_FORMAT = '%m-%d-%Y %H:%M:%S'
+DROPBOX_API_URL = 'dropbox-test-api-url'
+DROPBOX_API_RPC_URL = 'dropbox-test-api-rpc-url'
+DROPBOX_API_GET_METADATA_URL = '/get_metadata'
+DROPBOX_LOCAL_COPY_DIR = None
+DROPBOX_FILE_PATH = '/courses.txt'
+DROPBOX_TOKEN = 'dropbox-test-token'
+OEE_GREENFIG_FLUSH_BATCH_SIZE = 1000
+OEE_GREENFIG_FLUSH_LOCK_TIMEOUT = 10 * 60
 
 MIT_HZ_API_URL = 'root-url'
 MIT_HZ_LOGIN_PATH = '/partner_api/login'
@@ -55,9 +67,13 @@ MIT_HZ_GET_USER_PATH = '/partner_api/pearson/user?user_id='
 MIT_HZ_REFRESH_PATH = '/partner_api/pearson/refresh_user'
 MIT_HZ_ID = 'login-id'
 MIT_HZ_SECRET = 'secret-key'
+MIT_HZ_PROVIDER = 'samlp'
+MIT_HZ_ORG = 'Pearson'
 
 ICC_CREATE_USER_API_FUNCTION = 'icc-create-user-api-function'
 ICC_ENROLLMENT_API_FUNCTION = 'icc-enrollment-api-function'
+ICC_GET_USER_API_FUNCTION = 'icc-get-user-api-function'
+ICC_GET_USERS_BY_FIELD_API_FUNCTION = 'icc-get-users-by-field-api-function'
 ICC_API_TOKEN = 'icc-api-token'
 ICC_LEARNER_ROLE_ID = '5'
 ICC_BASE_URL = "icc-base-url"
@@ -72,4 +88,35 @@ OEE_PATHSTREAM_S3_FILE = 'test.log'
 OEE_PATHSTREAM_S3_BUCKET = 'test'
 OOE_PATHSTREAM_S3_ACCESS_KEY = 'access_key'
 OOE_PATHSTREAM_S3_SECRET_KEY = 'secret_access_key'
-OOE_PATHSTREAM_S3_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+OEE_PATHSTREAM_S3_APPEND_MODE = False
+OEE_PATHSTREAM_S3_PARTS_PREFIX = 'test_parts'
+OEE_PATHSTREAM_S3_CHUNK_SIZE = 8 * 1024 * 1024
+OEE_PATHSTREAM_UPLOAD_BATCH_SIZE = 1000
+OEE_PATHSTREAM_COMPACTION_LOCK_TIMEOUT = 10 * 60
+
+OEE_HTTP_POOL_CONNECTIONS = 10
+OEE_HTTP_POOL_MAXSIZE = 10
+OEE_HTTP_POOL_BLOCK = False
+OEE_HTTP_KEEP_ALIVE = True
+
+OEE_TOKEN_CACHE_DEFAULT_EXPIRES_IN = 15 * 60
+OEE_TOKEN_CACHE_REFRESH_MARGIN = 60
+OEE_TOKEN_CACHE_LOCK_TIMEOUT = 10
+
+OEE_ASYNC_EXTERNAL_ENROLLMENT_CONTROLLERS = []
+OEE_ASYNC_EXTERNAL_ENROLLMENT_RETRY_POLICIES = {}
+OEE_OUTBOX_EXTERNAL_ENROLLMENT_CONTROLLERS = []
+OEE_ENROLLMENT_OUTBOX_BATCH_SIZE = 100
+OEE_ENROLLMENT_OUTBOX_LEASE_TIMEOUT = 10 * 60
+OEE_COURSE_SETTINGS_CACHE_TIMEOUT = 60 * 60
+OEE_COURSE_SETTINGS_LOCAL_CACHE_TIMEOUT = 60
+OEE_COURSE_SETTINGS_LOCAL_CACHE_SIZE = 1000
+OEE_COURSE_HOME_CACHE_TIMEOUT = 60
+OEE_ANONYMOUS_ID_CACHE_TIMEOUT = 24 * 60 * 60
+OEE_ENTRY_POINTS_COMPLETION_CACHE_TIMEOUT = 60 * 60
+OEE_ICC_USER_CACHE_TIMEOUT = 24 * 60 * 60
+OEE_ICC_BULK_REQUEST_SIZE = 100
+OEE_MIT_HZ_REFRESH_BATCH_SIZE = 500
+OEE_MIT_HZ_REFRESH_MAX_WORKERS = 8
+OEE_MIT_HZ_USER_MISS_CACHE_TIMEOUT = 5 * 60
+OEE_MIT_HZ_USER_MISS_CACHE_MAX_TIMEOUT = 24 * 60 * 60
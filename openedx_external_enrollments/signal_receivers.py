@@ -1,15 +1,18 @@
 """Openedx external enrollments receivers file."""
 import logging
 
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
+from openedx_external_enrollments.course_home_cache import invalidate_course_home, invalidate_entry_points_completion
 from openedx_external_enrollments.edxapp_wrapper.course_module import get_course_mode
-from openedx_external_enrollments.edxapp_wrapper.get_courseware import get_course_by_id
 from openedx_external_enrollments.edxapp_wrapper.get_site_configuration import configuration_helpers
 from openedx_external_enrollments.edxapp_wrapper.get_student import (
     get_enrollment_track_updated_signal,
     get_unenroll_done_signal,
+    user_by_anonymous_id,
 )
+from openedx_external_enrollments.edxapp_wrapper.get_submissions import get_submission_model
 from openedx_external_enrollments.external_enrollments import execute_external_enrollment
 
 LOG = logging.getLogger(__name__)
@@ -23,7 +26,10 @@ def update_external_enrollment(sender, **kwargs):  # pylint: disable=unused-argu
     the required action when course mode is 'verified'.
     If kwargs['course_enrollment'].is_active is True, an external 'enrollment' request
     will be trigger, otherwise the 'unenroll' action will be called.
+    The cached course home of the learner is invalidated on every event.
     """
+    invalidate_course_home(kwargs['course_enrollment'].user.id, kwargs['course_enrollment'].course_id)
+
     if not configuration_helpers.get_value('ENABLE_EXTERNAL_ENROLLMENTS', False):
         return
 
@@ -45,5 +51,19 @@ def update_external_enrollment(sender, **kwargs):  # pylint: disable=unused-argu
 
         execute_external_enrollment(
             data=data,
-            course=get_course_by_id(kwargs['course_enrollment'].course_id)
+            course_key=kwargs['course_enrollment'].course_id,
         )
+
+
+@receiver(post_save, sender=get_submission_model())
+@receiver(post_delete, sender=get_submission_model())
+def update_entry_points_completion(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    This receiver is attached to the submission changes, e.g. a submission can be created,
+    or removed by a staff reset. It invalidates the cached entry points completion of the
+    learner, so the course home is calculated again.
+    """
+    user = user_by_anonymous_id(instance.student_item.student_id)
+
+    if user:
+        invalidate_entry_points_completion(user.id, instance.student_item.course_id)
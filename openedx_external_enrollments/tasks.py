@@ -1,13 +1,25 @@
 """Openedx external enrollments task file."""
+import logging
+
 from celery import task
+from django.conf import settings
 from rest_framework import status
 
+from openedx_external_enrollments.external_enrollments.greenfig_external_enrollment import (
+    GreenfigInstanceExternalEnrollment,
+    GreenfigTaskExecutionError,
+)
+from openedx_external_enrollments.external_enrollments.mit_hz_external_enrollment import MITHzInstanceExternalEnrollment
+from openedx_external_enrollments.external_enrollments.outbox import relay_outbox_events
 from openedx_external_enrollments.external_enrollments.pathstream_external_enrollment import (
     PathstreamExternalEnrollment,
     PathstreamTaskExecutionError,
 )
 from openedx_external_enrollments.external_enrollments.salesforce_external_enrollment import SalesforceEnrollment
 from openedx_external_enrollments.external_enrollments.viper_external_enrollment import ViperExternalEnrollment
+from openedx_external_enrollments.factory import ExternalEnrollmentFactory
+
+LOG = logging.getLogger(__name__)
 
 
 @task(default_retry_delay=5, max_retries=5)  # pylint: disable=not-callable
@@ -52,3 +64,74 @@ def run_pathstream_task(self, *args, **kwargs):  # pylint: disable=unused-argume
         raise self.retry(exc=PathstreamTaskExecutionError(message))
 
     return {'message': message}
+
+
+@task(bind=True, default_retry_delay=5*60)  # pylint: disable=not-callable
+def run_pathstream_compaction_task(self, *args, **kwargs):  # pylint: disable=unused-argument
+    """
+    Merges the objects uploaded by the Pathstream controller in append mode into the remote S3 file.
+    """
+    is_completed, message = PathstreamExternalEnrollment().compact_parts()
+
+    if not is_completed:
+        raise self.retry(exc=PathstreamTaskExecutionError(message))
+
+    return {'message': message}
+
+
+@task(bind=True, default_retry_delay=5*60)  # pylint: disable=not-callable
+def run_greenfig_flush_task(self, *args, **kwargs):  # pylint: disable=unused-argument
+    """
+    Appends the enrollment lines queued by the Greenfig controller to the remote dropbox file.
+    """
+    is_completed, message = GreenfigInstanceExternalEnrollment().flush_enrollments()
+
+    if not is_completed:
+        raise self.retry(exc=GreenfigTaskExecutionError(message))
+
+    return {'message': message}
+
+
+@task(bind=True)  # pylint: disable=not-callable
+def run_external_enrollment(self, controller_name, data, course_settings, site_configuration=None):
+    """
+    Executes the enrollment of the given controller outside the request that triggered it.
+    The task is retried following the retry policy of the controller when the enrollment fails.
+
+    Args:
+        controller_name: Name of the external enrollment controller, e.g. 'icc'.
+        data: Serialized enrollment data.
+        course_settings: The course other_course_settings.
+        site_configuration: Site configuration values of the controller, read in the request.
+    """
+    enrollment_controller = ExternalEnrollmentFactory.get_enrollment_controller(controller=controller_name)
+    enrollment_controller.set_site_configuration(site_configuration)
+    response, succeeded = enrollment_controller.run_enrollment(data, course_settings)
+
+    if not succeeded:
+        LOG.error('External enrollment for [%s] failed, retrying. Reason: %s', controller_name, response)
+        raise self.retry(
+            exc=Exception(response),
+            **enrollment_controller.get_retry_policy(controller_name)
+        )
+
+    return {'message': response}
+
+
+@task()  # pylint: disable=not-callable
+def run_enrollment_outbox_relay(*args, **kwargs):  # pylint: disable=unused-argument
+    """
+    Delivers the pending external enrollment events stored in the outbox.
+    """
+    return relay_outbox_events(settings.OEE_ENROLLMENT_OUTBOX_BATCH_SIZE)
+
+
+@task()  # pylint: disable=not-callable
+def run_mit_hz_subscriptions_refresh(*args, **kwargs):  # pylint: disable=unused-argument
+    """
+    Refreshes the subscription of every learner enrolled in MIT HZ courses.
+    """
+    return MITHzInstanceExternalEnrollment().refresh_subscriptions(
+        settings.OEE_MIT_HZ_REFRESH_BATCH_SIZE,
+        settings.OEE_MIT_HZ_REFRESH_MAX_WORKERS,
+    )
@@ -1,26 +1,65 @@
 """Tests EdxInstanceExternalEnrollment class file."""
+import hashlib
+import io
+import json
+import shutil
+import tempfile
+
 from django.conf import settings
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
 from mock import Mock, patch
+from requests.exceptions import HTTPError
+from rest_framework import status
 
 from openedx_external_enrollments.external_enrollments.greenfig_external_enrollment import (
+    FLUSH_LOCK_CACHE_KEY,
     GreenfigInstanceExternalEnrollment,
 )
+from openedx_external_enrollments.models import ExternalEnrollment, ExternalEnrollmentEvent
+from openedx_external_enrollments.tests.tests_backends import CourseOverview
+
+# Site configuration of the controllers of the tests, every dropbox setting is 'setting_value'.
+SITE_CONFIGURATION = dict.fromkeys(GreenfigInstanceExternalEnrollment.SITE_CONFIGURATION_KEYS, 'setting_value')
+
+
+def create_events(*lines, site_configuration=None):
+    """Create a queued event for every line, the first one being the oldest."""
+    course = CourseOverview.objects.create()  # pylint: disable=no-member
+    enrollment = ExternalEnrollment.objects.create(  # pylint: disable=no-member
+        controller_name='greenfig',
+        course_shell=course,
+        email='test@email.com',
+        meta=[],
+    )
+
+    return [
+        ExternalEnrollmentEvent.objects.create(  # pylint: disable=no-member
+            enrollment=enrollment,
+            data=line,
+            event_time=timezone.now(),
+            site_configuration=SITE_CONFIGURATION if site_configuration is None else site_configuration,
+        )
+        for line in lines
+    ]
 
 
 class GreenfigInstanceExternalEnrollmentTest(TestCase):
     """Test class for GreenfigInstanceExternalEnrollment."""
 
-    @patch('openedx_external_enrollments.external_enrollments.greenfig_external_enrollment.configuration_helpers')
-    def setUp(self, configuration_helpers_mock):  # pylint: disable=arguments-differ
+    def setUp(self):
         """setUp."""
-        configuration_helpers_mock.get_value.return_value = 'setting_value'
+        configuration_helpers_patcher = patch(
+            'openedx_external_enrollments.external_enrollments.base_external_enrollment.configuration_helpers',
+        )
+        configuration_helpers_patcher.start().get_value.return_value = 'setting_value'
+        self.addCleanup(configuration_helpers_patcher.stop)
         self.base = GreenfigInstanceExternalEnrollment()
 
     @patch('openedx_external_enrollments.external_enrollments.greenfig_external_enrollment.get_user')
-    @patch('openedx_external_enrollments.external_enrollments.greenfig_external_enrollment.GreenfigInstanceExternalEnrollment._get_course_list')  # noqa pylint: disable=I0021, C0301
     @patch('openedx_external_enrollments.external_enrollments.greenfig_external_enrollment.datetime')
-    def test_get_enrollment_data(self, datetime_now_mock, _get_course_list_mock, get_user_mock):
+    def test_get_enrollment_data(self, datetime_now_mock, get_user_mock):
         """Test _get_enrollment_data method."""
         data = {
             'user_email': 'test@email.com',
@@ -29,8 +68,7 @@ class GreenfigInstanceExternalEnrollmentTest(TestCase):
         course_settings = {
             'external_course_run_id': 'course_id+10',
         }
-        expected_data = u'08-04-2020 10:50:34, John Doe, John, Doe, johndoe@email.com, course_id+10, true\n'
-        expected_data += u'08-04-2020 10:50:34, Mary Brown, Mary, Brown, marybrown@email.com, course_id+10, true\n'
+        expected_data = u'08-04-2020 10:50:34, Mary Brown, Mary, Brown, marybrown@email.com, course_id+10, true\n'
         user = Mock()
         user.first_name = 'Mary'
         user.last_name = 'Brown'
@@ -38,9 +76,6 @@ class GreenfigInstanceExternalEnrollmentTest(TestCase):
         user.profile.name = 'Mary Brown'
         get_user_mock.return_value = (user, '')
         datetime_now_mock.now.return_value.strftime.return_value = '08-04-2020 10:50:34'
-        dropbox_response = Mock()
-        dropbox_response.text = u'08-04-2020 10:50:34, John Doe, John, Doe, johndoe@email.com, course_id+10, true\n'
-        _get_course_list_mock.return_value = dropbox_response
 
         self.assertEqual(
             self.base._get_enrollment_data(data, course_settings),  # pylint: disable=protected-access
@@ -62,9 +97,18 @@ class GreenfigInstanceExternalEnrollmentTest(TestCase):
         expected_headers = {
             'Authorization': 'Bearer {token}'.format(token='setting_value'),
             'Content-Type': 'application/octet-stream',
-            'Dropbox-API-Arg': settings.DROPBOX_API_ARG_UPLOAD % 'setting_value',
+            'Dropbox-API-Arg': '{"path":"setting_value","mode":{".tag":"update","update":"rev"},"autorename":false}',
         }
-        self.assertEqual(self.base._get_enrollment_headers(), expected_headers)  # pylint: disable=protected-access
+        self.assertEqual(self.base._get_enrollment_headers('rev'), expected_headers)  # pylint: disable=protected-access
+
+    def test_get_enrollment_headers_without_rev(self):
+        """The file is only added when there is no known revision."""
+        headers = self.base._get_enrollment_headers()  # pylint: disable=protected-access
+
+        self.assertEqual(
+            json.loads(headers['Dropbox-API-Arg']),
+            {'path': 'setting_value', 'mode': {'.tag': 'add'}, 'autorename': False},
+        )
 
     def test_get_download_headers(self):
         """Test _get_download_headers method with default settings."""
@@ -74,9 +118,10 @@ class GreenfigInstanceExternalEnrollmentTest(TestCase):
         }
         self.assertEqual(self.base._get_download_headers(), expected_headers)  # pylint: disable=protected-access
 
-    @patch('openedx_external_enrollments.external_enrollments.greenfig_external_enrollment.requests.post')
-    def test_execute_post(self, mock_post):
+    @patch('openedx_external_enrollments.external_enrollments.greenfig_external_enrollment.get_http_session')
+    def test_execute_post(self, http_session_mock):
         """Testing _execute_post method."""
+        mock_post = http_session_mock.return_value.post
         url = 'test_url'
         data = 'data'
         headers = 'headers'
@@ -104,3 +149,314 @@ class GreenfigInstanceExternalEnrollmentTest(TestCase):
             'greenfig',
             self.base.__str__(),
         )
+
+    @patch.object(GreenfigInstanceExternalEnrollment, '_get_enrollment_data')
+    def test_post_enrollment(self, get_enrollment_data_mock):
+        """The enrollment line is queued as an event instead of being uploaded to dropbox."""
+        course = CourseOverview.objects.create()  # pylint: disable=no-member
+        data = {
+            'user_email': 'test@email.com',
+            'is_active': True,
+            'course_id': course.id,
+        }
+        get_enrollment_data_mock.return_value = 'line\n'
+
+        with patch.object(GreenfigInstanceExternalEnrollment, '_execute_post') as execute_post_mock:
+            response = self.base._post_enrollment(data, {})  # pylint: disable=protected-access
+            self.base._post_enrollment(data, {})  # pylint: disable=protected-access
+
+        execute_post_mock.assert_not_called()
+        self.assertEqual(response, ('line\n', status.HTTP_200_OK))
+        self.assertEqual(ExternalEnrollment.objects.count(), 1)  # pylint: disable=no-member
+        self.assertEqual(
+            list(ExternalEnrollmentEvent.objects.values_list('data', flat=True)),  # pylint: disable=no-member
+            ['line\n', 'line\n'],
+        )
+        self.assertEqual(
+            ExternalEnrollmentEvent.objects.first().site_configuration,  # pylint: disable=no-member
+            SITE_CONFIGURATION,
+        )
+
+    def test_post_enrollment_with_missing_data(self):
+        """Enrollments without course can't be queued."""
+        response = self.base._post_enrollment({'user_email': 'test@email.com'})  # pylint: disable=protected-access
+
+        self.assertEqual(response[1], status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(ExternalEnrollmentEvent.objects.exists())  # pylint: disable=no-member
+
+    @staticmethod
+    def _download_course_list_side_effect(content):
+        """Return a _download_course_list replacement that writes the given content."""
+        def download_course_list(file_object):
+            file_object.write(content)
+
+        return download_course_list
+
+    @patch.object(GreenfigInstanceExternalEnrollment, '_execute_post')
+    @patch.object(GreenfigInstanceExternalEnrollment, '_download_course_list')
+    @patch.object(GreenfigInstanceExternalEnrollment, '_get_course_list_metadata')
+    def test_flush_enrollments(self, metadata_mock, download_mock, execute_post_mock):
+        """All the queued lines are appended to the dropbox file with a single upload."""
+        events = create_events('second\n', 'third\n')
+        metadata_mock.return_value = {'rev': 'rev', 'content_hash': 'hash'}
+        download_mock.side_effect = self._download_course_list_side_effect(b'first\n')
+
+        self.assertEqual(self.base.flush_enrollments(), (True, 'flush_enrollments completed'))
+
+        download_mock.assert_called_once()
+        execute_post_mock.assert_called_once_with(
+            url=self.base._get_enrollment_url(None),  # pylint: disable=protected-access
+            headers=self.base._get_enrollment_headers('rev'),  # pylint: disable=protected-access
+            json_data=b'first\nsecond\nthird\n',
+        )
+
+        for event in events:
+            event.refresh_from_db()
+            self.assertIsNotNone(event.uploaded_at)
+
+    @patch.object(GreenfigInstanceExternalEnrollment, '_execute_post')
+    @patch.object(GreenfigInstanceExternalEnrollment, '_get_course_list_metadata')
+    def test_flush_enrollments_by_site(self, metadata_mock, execute_post_mock):
+        """The lines of every site are appended to the dropbox file of the site."""
+        create_events('first\n', 'second\n')
+        create_events('other\n', site_configuration={'DROPBOX_TOKEN': 'other-token', 'DROPBOX_FILE_PATH': '/other.txt'})
+        metadata_mock.return_value = None
+
+        self.assertEqual(self.base.flush_enrollments(), (True, 'flush_enrollments completed'))
+
+        self.assertEqual(
+            [(call[1]['headers']['Authorization'], call[1]['json_data']) for call in execute_post_mock.call_args_list],
+            [('Bearer setting_value', b'first\nsecond\n'), ('Bearer other-token', b'other\n')],
+        )
+        self.assertIn('"path":"/other.txt"', execute_post_mock.call_args[1]['headers']['Dropbox-API-Arg'])
+        self.assertEqual(self.base.DROPBOX_TOKEN, 'setting_value')
+        self.assertFalse(
+            ExternalEnrollmentEvent.objects.filter(uploaded_at__isnull=True).exists(),  # pylint: disable=no-member
+        )
+
+    @patch.object(GreenfigInstanceExternalEnrollment, '_download_course_list')
+    def test_flush_enrollments_while_running(self, download_mock):
+        """The lines are not appended again while another flush is running."""
+        event = create_events('line\n')[0]
+        cache.add(FLUSH_LOCK_CACHE_KEY, True)
+        self.addCleanup(cache.delete, FLUSH_LOCK_CACHE_KEY)
+
+        self.assertEqual(self.base.flush_enrollments(), (True, 'flush_enrollments is already running'))
+
+        download_mock.assert_not_called()
+        event.refresh_from_db()
+        self.assertIsNone(event.uploaded_at)
+
+    @patch.object(GreenfigInstanceExternalEnrollment, '_download_course_list')
+    def test_flush_enrollments_without_events(self, download_mock):
+        """Dropbox is not called when there are no queued lines."""
+        self.assertEqual(self.base.flush_enrollments(), (True, 'flush_enrollments completed'))
+
+        download_mock.assert_not_called()
+
+    @patch.object(GreenfigInstanceExternalEnrollment, '_execute_post')
+    @patch.object(GreenfigInstanceExternalEnrollment, '_download_course_list')
+    @patch.object(GreenfigInstanceExternalEnrollment, '_get_course_list_metadata')
+    def test_flush_enrollments_download_error(self, metadata_mock, download_mock, execute_post_mock):
+        """The dropbox file is not overwritten when it can't be downloaded."""
+        event = create_events('line\n')[0]
+        metadata_mock.return_value = {'rev': 'rev', 'content_hash': 'hash'}
+        download_mock.side_effect = HTTPError('error')
+
+        is_completed, _ = self.base.flush_enrollments()
+
+        self.assertFalse(is_completed)
+        execute_post_mock.assert_not_called()
+        event.refresh_from_db()
+        self.assertIsNone(event.uploaded_at)
+
+    @patch.object(GreenfigInstanceExternalEnrollment, '_execute_post')
+    @patch.object(GreenfigInstanceExternalEnrollment, '_get_course_list_metadata')
+    def test_flush_enrollments_upload_error(self, metadata_mock, execute_post_mock):
+        """The lines stay queued when the upload fails, e.g. when the file was changed by someone else."""
+        event = create_events('line\n')[0]
+        metadata_mock.return_value = None
+        execute_post_mock.return_value.raise_for_status.side_effect = HTTPError('409 Conflict')
+
+        is_completed, _ = self.base.flush_enrollments()
+
+        self.assertFalse(is_completed)
+        event.refresh_from_db()
+        self.assertIsNone(event.uploaded_at)
+
+    @override_settings(DROPBOX_UPLOAD_CHUNK_SIZE=4)
+    @patch('openedx_external_enrollments.external_enrollments.greenfig_external_enrollment.get_http_session')
+    def test_download_course_list(self, http_session_mock):
+        """The dropbox file is streamed into the file object."""
+        response = http_session_mock.return_value.post.return_value
+        response.iter_content.return_value = [b'abcd', b'ef']
+        file_object = io.BytesIO()
+
+        self.base._download_course_list(file_object)  # pylint: disable=protected-access
+
+        http_session_mock.return_value.post.assert_called_once_with(
+            'setting_valuedropbox-tets-api-download-url',
+            headers=self.base._get_download_headers(),  # pylint: disable=protected-access
+            stream=True,
+        )
+        response.iter_content.assert_called_once_with(chunk_size=4)
+        self.assertEqual(file_object.getvalue(), b'abcdef')
+
+    @override_settings(DROPBOX_UPLOAD_CHUNK_SIZE=4)
+    @patch.object(GreenfigInstanceExternalEnrollment, '_execute_post')
+    def test_upload_course_list_with_session(self, execute_post_mock):
+        """Content bigger than a chunk is uploaded with an upload session."""
+        execute_post_mock.return_value.json.return_value = {'session_id': 'session'}
+
+        self.base._upload_course_list(io.BytesIO(b'abcdefghij'), 'rev')  # pylint: disable=protected-access
+
+        self.assertEqual(
+            [
+                (kwargs['url'], kwargs['headers']['Dropbox-API-Arg'], kwargs['json_data'])
+                for _, kwargs in execute_post_mock.call_args_list
+            ],
+            [
+                ('setting_value/start', '{"close":false}', b'abcd'),
+                (
+                    'setting_value/append',
+                    '{"cursor":{"session_id":"session","offset":4},"close":false}',
+                    b'efgh',
+                ),
+                (
+                    'setting_value/finish',
+                    '{"cursor":{"session_id":"session","offset":8},"commit":'
+                    '{"path":"setting_value","mode":{".tag":"update","update":"rev"},"autorename":false}}',
+                    b'ij',
+                ),
+            ],
+        )
+
+    @override_settings(DROPBOX_UPLOAD_CHUNK_SIZE=4)
+    @patch.object(GreenfigInstanceExternalEnrollment, '_execute_post')
+    def test_upload_course_list_single_request(self, execute_post_mock):
+        """Content that fits in a chunk is uploaded with a single request."""
+        self.base._upload_course_list(io.BytesIO(b'abcd'))  # pylint: disable=protected-access
+
+        execute_post_mock.assert_called_once_with(
+            url='setting_valuedropbox-tets-api-upload-url',
+            headers=self.base._get_enrollment_headers(),  # pylint: disable=protected-access
+            json_data=b'abcd',
+        )
+
+    @patch('openedx_external_enrollments.external_enrollments.greenfig_external_enrollment.get_http_session')
+    def test_get_course_list_metadata(self, http_session_mock):
+        """The revision of the dropbox file is read from its metadata."""
+        response = http_session_mock.return_value.post.return_value
+        response.status_code = status.HTTP_200_OK
+        response.json.return_value = {'rev': 'rev', 'content_hash': 'hash'}
+
+        metadata = self.base._get_course_list_metadata()  # pylint: disable=protected-access
+
+        self.assertEqual(metadata, {'rev': 'rev', 'content_hash': 'hash'})
+        http_session_mock.return_value.post.assert_called_once_with(
+            'setting_value/get_metadata',
+            json={'path': 'setting_value'},
+            headers={'Authorization': 'Bearer setting_value'},
+        )
+
+    @patch('openedx_external_enrollments.external_enrollments.greenfig_external_enrollment.get_http_session')
+    def test_get_course_list_metadata_not_found(self, http_session_mock):
+        """None is returned when the dropbox file doesn't exist yet."""
+        response = http_session_mock.return_value.post.return_value
+        response.status_code = status.HTTP_409_CONFLICT
+        response.text = '{"error_summary": "path/not_found/..."}'
+
+        self.assertIsNone(self.base._get_course_list_metadata())  # pylint: disable=protected-access
+        response.raise_for_status.assert_not_called()
+
+
+class GreenfigLocalCopyTest(TestCase):
+    """Test class for the local copy of the Greenfig dropbox file."""
+
+    def setUp(self):
+        """Use a temporary directory for the local copy."""
+        configuration_helpers_patcher = patch(
+            'openedx_external_enrollments.external_enrollments.base_external_enrollment.configuration_helpers',
+        )
+        configuration_helpers_patcher.start().get_value.return_value = 'setting_value'
+        self.addCleanup(configuration_helpers_patcher.stop)
+        self.base = GreenfigInstanceExternalEnrollment()
+        self.local_copy_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.local_copy_dir)
+        settings_override = override_settings(DROPBOX_LOCAL_COPY_DIR=self.local_copy_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    @staticmethod
+    def _get_content_hash(content):
+        """Return the dropbox content hash of content smaller than a block."""
+        return hashlib.sha256(hashlib.sha256(content).digest()).hexdigest()
+
+    def test_save_and_read_local_copy(self):
+        """The uploaded content is used again while the dropbox revision doesn't change."""
+        metadata = {'rev': 'rev', 'content_hash': self._get_content_hash(b'content')}
+        file_object = io.BytesIO()
+
+        self.base._save_local_copy(io.BytesIO(b'content'), metadata)  # pylint: disable=protected-access
+
+        self.assertTrue(self.base._read_local_copy(file_object, metadata))  # pylint: disable=protected-access
+        self.assertEqual(file_object.getvalue(), b'content')
+        self.assertEqual(file_object.tell(), len(b'content'))
+
+    def test_read_local_copy_with_other_rev(self):
+        """The local copy is not used when the dropbox file was changed by someone else."""
+        metadata = {'rev': 'rev', 'content_hash': self._get_content_hash(b'content')}
+        self.base._save_local_copy(io.BytesIO(b'content'), metadata)  # pylint: disable=protected-access
+        file_object = io.BytesIO()
+
+        self.assertFalse(
+            self.base._read_local_copy(file_object, dict(metadata, rev='other')),  # pylint: disable=protected-access
+        )
+        self.assertEqual(file_object.getvalue(), b'')
+
+    def test_read_corrupted_local_copy(self):
+        """The local copy is discarded when its content doesn't match the dropbox content hash."""
+        metadata = {'rev': 'rev', 'content_hash': self._get_content_hash(b'content')}
+        self.base._save_local_copy(io.BytesIO(b'content'), metadata)  # pylint: disable=protected-access
+        file_object = io.BytesIO()
+
+        with open(self.base._get_local_copy_path(), 'wb') as local_copy:  # pylint: disable=protected-access
+            local_copy.write(b'changed')
+
+        self.assertFalse(self.base._read_local_copy(file_object, metadata))  # pylint: disable=protected-access
+        self.assertEqual(file_object.getvalue(), b'')
+
+    def test_read_missing_local_copy(self):
+        """The file is downloaded when there is no local copy."""
+        self.assertFalse(
+            self.base._read_local_copy(io.BytesIO(), {'rev': 'rev'}),  # pylint: disable=protected-access
+        )
+
+    @patch.object(GreenfigInstanceExternalEnrollment, '_execute_post')
+    @patch.object(GreenfigInstanceExternalEnrollment, '_download_course_list')
+    @patch.object(GreenfigInstanceExternalEnrollment, '_get_course_list_metadata')
+    def test_flush_enrollments_with_local_copy(self, metadata_mock, download_mock, execute_post_mock):
+        """The dropbox file is not downloaded when the local copy is the current revision."""
+        metadata_mock.return_value = {'rev': 'rev', 'content_hash': self._get_content_hash(b'first\n')}
+        execute_post_mock.return_value.json.return_value = {
+            'rev': 'new-rev',
+            'content_hash': self._get_content_hash(b'first\nsecond\n'),
+        }
+        self.base._save_local_copy(  # pylint: disable=protected-access
+            io.BytesIO(b'first\n'),
+            metadata_mock.return_value,
+        )
+        create_events('second\n')
+
+        self.assertEqual(self.base.flush_enrollments(), (True, 'flush_enrollments completed'))
+
+        download_mock.assert_not_called()
+        self.assertEqual(execute_post_mock.call_args[1]['json_data'], b'first\nsecond\n')
+
+        local_copy_path = self.base._get_local_copy_path()  # pylint: disable=protected-access
+
+        with open('{}.json'.format(local_copy_path)) as metadata_file:
+            self.assertEqual(json.load(metadata_file)['rev'], 'new-rev')
+
+        with open(local_copy_path, 'rb') as local_copy:
+            self.assertEqual(local_copy.read(), b'first\nsecond\n')
@@ -1,8 +1,8 @@
 """Tests BaseExternalEnrollment class file."""
 import logging
 
-from django.test import TestCase
-from mock import patch
+from django.test import TestCase, override_settings
+from mock import Mock, patch
 from rest_framework import status
 from testfixtures import LogCapture
 
@@ -20,9 +20,10 @@ class BaseExternalEnrollmentTest(TestCase):
         self.base = BaseExternalEnrollment()
         self.base.__str__ = lambda: 'test-class'
 
-    @patch('openedx_external_enrollments.external_enrollments.base_external_enrollment.requests.post')
-    def test_execute_post(self, mock_post):
+    @patch('openedx_external_enrollments.external_enrollments.base_external_enrollment.get_http_session')
+    def test_execute_post(self, http_session_mock):
         """Testing _execute_post method."""
+        mock_post = http_session_mock.return_value.post
         url = 'test_url'
         data = 'data'
         headers = 'headers'
@@ -111,6 +112,78 @@ class BaseExternalEnrollmentTest(TestCase):
         )
         self.assertEqual(len(request_log), 1)
 
+    @patch.object(BaseExternalEnrollment, '_forget_token')
+    @patch.object(BaseExternalEnrollment, '_get_enrollment_url')
+    @patch.object(BaseExternalEnrollment, '_get_enrollment_headers')
+    @patch.object(BaseExternalEnrollment, '_get_enrollment_data')
+    @patch.object(BaseExternalEnrollment, '_execute_post')
+    def test_post_enrollment_rejected_token(self, post_mock, data_mock, headers_mock, url_mock, forget_token_mock):
+        """Testing that _post_enrollment retries once with a new token when the partner rejects it."""
+        data_mock.return_value = {'test': 'data'}
+        url_mock.return_value = 'https://fake-testing.com'
+        headers_mock.side_effect = [{'token': 'old'}, {'token': 'new'}]
+        post_mock.return_value.status_code = status.HTTP_401_UNAUTHORIZED
+        post_mock.return_value.json.return_value = {'error': 'invalid_token'}
+        forget_token_mock.return_value = True
+
+        self.base._post_enrollment({}, {})  # pylint: disable=protected-access
+
+        forget_token_mock.assert_called_once()
+        self.assertEqual(post_mock.call_count, 2)
+        post_mock.assert_called_with(
+            url='https://fake-testing.com',
+            headers={'token': 'new'},
+            json_data={'test': 'data'},
+        )
+
+        # Controllers without token don't retry.
+        post_mock.reset_mock()
+        headers_mock.side_effect = None
+        forget_token_mock.return_value = False
+
+        self.base._post_enrollment({}, {})  # pylint: disable=protected-access
+
+        post_mock.assert_called_once()
+
+    @patch.object(BaseExternalEnrollment, '_get_enrollment_url')
+    @patch.object(BaseExternalEnrollment, '_get_enrollment_headers')
+    @patch.object(BaseExternalEnrollment, '_get_enrollment_data')
+    @patch.object(BaseExternalEnrollment, '_execute_post')
+    def test_post_enrollment_rejected_by_partner(self, post_mock, data_mock, headers_mock, url_mock):
+        """Testing that the enrollments rejected by the partner are returned as failed."""
+        data_mock.return_value = {'test': 'data'}
+        headers_mock.return_value = {}
+        url_mock.return_value = 'https://fake-testing.com'
+        post_mock.return_value.ok = False
+        post_mock.return_value.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        post_mock.return_value.json.return_value = {'error': 'partner-error'}
+
+        self.assertEqual(
+            self.base._post_enrollment({}, {}),  # pylint: disable=protected-access
+            ({'error': 'partner-error'}, status.HTTP_500_INTERNAL_SERVER_ERROR),
+        )
+        self.assertEqual(self.base.run_enrollment({}, {}), ({'error': 'partner-error'}, False))
+
+    @patch.object(BaseExternalEnrollment, '_is_successful_response', Mock(return_value=False))
+    @patch.object(BaseExternalEnrollment, '_get_enrollment_url')
+    @patch.object(BaseExternalEnrollment, '_get_enrollment_headers')
+    @patch.object(BaseExternalEnrollment, '_get_enrollment_data')
+    @patch.object(BaseExternalEnrollment, '_execute_post')
+    def test_post_enrollment_rejected_with_successful_status(self, post_mock, data_mock, headers_mock, url_mock):
+        """Testing that the enrollments rejected with a successful status are returned as bad requests."""
+        data_mock.return_value = {'test': 'data'}
+        headers_mock.return_value = {}
+        url_mock.return_value = 'https://fake-testing.com'
+        post_mock.return_value.ok = True
+        post_mock.return_value.status_code = status.HTTP_200_OK
+        post_mock.return_value.json.return_value = {'exception': 'partner-error'}
+
+        self.assertEqual(
+            self.base._post_enrollment({}, {}),  # pylint: disable=protected-access
+            ({'exception': 'partner-error'}, status.HTTP_400_BAD_REQUEST),
+        )
+        self.assertEqual(self.base.run_enrollment({}, {}), ({'exception': 'partner-error'}, False))
+
     def test_get_enrollment_data(self):
         """Testing _get_enrollment_data method."""
         with self.assertRaises(NotImplementedError):
@@ -124,3 +197,64 @@ class BaseExternalEnrollmentTest(TestCase):
         """Testing _get_enrollment_url method."""
         with self.assertRaises(NotImplementedError):
             self.base._get_enrollment_url({})  # pylint: disable=protected-access
+
+    @patch.object(BaseExternalEnrollment, '_post_enrollment')
+    def test_run_enrollment(self, post_enrollment_mock):
+        """Testing run_enrollment method, the result of _post_enrollment is returned as (response, succeeded)."""
+        post_enrollment_mock.return_value = {'id': 1}, status.HTTP_200_OK
+        self.assertEqual(self.base.run_enrollment({}, {}), ({'id': 1}, True))
+
+        post_enrollment_mock.return_value = 'error', status.HTTP_400_BAD_REQUEST
+        self.assertEqual(self.base.run_enrollment({}, {}), ('error', False))
+
+        # Controllers that only store the enrollment don't return a response.
+        post_enrollment_mock.return_value = None
+        self.assertEqual(self.base.run_enrollment({}, {}), (None, True))
+
+        post_enrollment_mock.side_effect = Exception('unexpected-error')
+        self.assertEqual(self.base.run_enrollment({}, {}), ('unexpected-error', False))
+
+    @patch.object(BaseExternalEnrollment, 'run_enrollment')
+    def test_run_enrollments(self, run_enrollment_mock):
+        """Testing run_enrollments method, every enrollment is executed one by one."""
+        run_enrollment_mock.side_effect = [({'id': 1}, True), ('error', False)]
+
+        self.assertEqual(
+            self.base.run_enrollments([({'user_email': 'first'}, {}), ({'user_email': 'second'}, {})]),
+            [({'id': 1}, True), ('error', False)],
+        )
+        run_enrollment_mock.assert_called_with({'user_email': 'second'}, {})
+
+    @override_settings(OEE_ASYNC_EXTERNAL_ENROLLMENT_RETRY_POLICIES={'viper': {'max_retries': 10}})
+    def test_get_retry_policy(self):
+        """Testing get_retry_policy method, the policy defined in settings overrides the controller defaults."""
+        self.assertEqual(
+            self.base.get_retry_policy('viper'),
+            {'max_retries': 10, 'countdown': BaseExternalEnrollment.ASYNC_RETRY_DELAY},
+        )
+        self.assertEqual(
+            self.base.get_retry_policy('icc'),
+            {
+                'max_retries': BaseExternalEnrollment.ASYNC_MAX_RETRIES,
+                'countdown': BaseExternalEnrollment.ASYNC_RETRY_DELAY,
+            },
+        )
+
+    @patch('{}.configuration_helpers'.format(module))
+    def test_site_configuration(self, configuration_helpers_mock):
+        """The site configuration values are read from the current site until they are set."""
+        site_values = {'FIRST_KEY': 'first-value'}
+        configuration_helpers_mock.get_value.side_effect = lambda key, default=None: site_values.get(key, default)
+        self.base.SITE_CONFIGURATION_KEYS = ('FIRST_KEY', 'SECOND_KEY')
+
+        self.assertEqual(self.base.get_site_configuration(), {'FIRST_KEY': 'first-value'})
+        self.assertEqual(self.base._get_site_value('FIRST_KEY'), 'first-value')  # pylint: disable=protected-access
+
+        self.base.set_site_configuration({'FIRST_KEY': 'captured-value'})
+        site_values['FIRST_KEY'] = 'other-site-value'
+
+        self.assertEqual(self.base._get_site_value('FIRST_KEY'), 'captured-value')  # pylint: disable=protected-access
+        self.assertEqual(
+            self.base._get_site_value('SECOND_KEY', 'default'),  # pylint: disable=protected-access
+            'default',
+        )
@@ -3,6 +3,7 @@ import logging
 from collections import OrderedDict
 
 from django.conf import settings
+from django.core.cache import cache
 from django.test import TestCase
 from mock import patch
 from testfixtures import LogCapture
@@ -19,6 +20,7 @@ class EdxEnterpriseExternalEnrollmentTest(TestCase):
 
     def setUp(self):
         """Set test database."""
+        cache.clear()
         self.base = EdxEnterpriseExternalEnrollment()
 
     def test_get_enrollment_data(self):
@@ -89,6 +91,11 @@ class EdxEnterpriseExternalEnrollmentTest(TestCase):
         self.assertEqual(self.base._get_enrollment_headers(), expected_headers)  # pylint: disable=protected-access
         post_mock.assert_called_with(settings.EDX_ENTERPRISE_API_TOKEN_URL, data)
 
+        # The token is cached, so the following headers don't request a new one.
+        self.assertEqual(self.base._get_enrollment_headers(), expected_headers)  # pylint: disable=protected-access
+        post_mock.assert_called_once()
+
+        cache.clear()
         post_mock.return_value.ok = False
         self.assertIsNone(self.base._get_enrollment_headers())  # pylint: disable=protected-access
 
@@ -99,6 +106,24 @@ class EdxEnterpriseExternalEnrollmentTest(TestCase):
                 (module, 'ERROR', 'Failed to get token: test-exception'),
             )
 
+    @patch.object(EdxEnterpriseExternalEnrollment, '_get_access_token')
+    def test_forget_token(self, access_token_mock):
+        """Testing that _forget_token removes the cached token, so the next headers request a new one."""
+        access_token_mock.side_effect = [
+            {'token_type': 'JWT', 'access_token': 'old-token'},
+            {'token_type': 'JWT', 'access_token': 'new-token'},
+        ]
+
+        self.assertEqual(
+            self.base._get_enrollment_headers()['Authorization'],  # pylint: disable=protected-access
+            'JWT old-token',
+        )
+        self.assertTrue(self.base._forget_token())  # pylint: disable=protected-access
+        self.assertEqual(
+            self.base._get_enrollment_headers()['Authorization'],  # pylint: disable=protected-access
+            'JWT new-token',
+        )
+
     def test_get_enrollment_url(self):
         """Testing _get_enrollment_url method."""
         expected_url = '{}/enterprise-customer/{}/course-enrollments'.format(
@@ -1,8 +1,9 @@
 """Tests External enrollments file."""
 import logging
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from mock import Mock, patch
+from opaque_keys.edx.keys import CourseKey
 from testfixtures import LogCapture
 
 from openedx_external_enrollments.external_enrollments import execute_external_enrollment
@@ -13,17 +14,17 @@ MODULE = 'openedx_external_enrollments.external_enrollments'
 class ExecuteExternalEnrollmentTest(TestCase):
     """Test class for execute_external_enrollment method."""
 
+    @patch('openedx_external_enrollments.external_enrollments.get_other_course_settings')
     @patch('openedx_external_enrollments.external_enrollments.configuration_helpers')
-    def test_execute_external_enrollment(self, configuration_helpers_mock):
+    def test_execute_external_enrollment(self, configuration_helpers_mock, get_settings_mock):
         """Testing execute_external_enrollment method."""
-        course = Mock()
-        course.id = 'test-course-id'
+        course_key = CourseKey.from_string('course-v1:test+CS102+2019_T3')
         data = {'fake': 'data'}
-        course.other_course_settings.get.return_value = 'edx'
+        get_settings_mock.return_value = {'external_platform_target': 'edx'}
         configuration_helpers_mock.get_value.return_value = ['openedx']
 
         with LogCapture(level=logging.WARNING) as log_capture:
-            execute_external_enrollment(data, course)
+            execute_external_enrollment(data, course_key)
             log = 'The controller {} is not present in the valid external targets list {}.'.format(
                 'edx',
                 ['openedx'],
@@ -32,26 +33,119 @@ class ExecuteExternalEnrollmentTest(TestCase):
                 (MODULE, 'WARNING', log),
             )
 
+        get_settings_mock.assert_called_once_with(course_key)
+
         with patch('openedx_external_enrollments.external_enrollments.ExternalEnrollmentFactory') as factory_mock:
             controller_mock = Mock()
-            course.other_course_settings.get.return_value = 'openedx'
+            get_settings_mock.return_value = {'external_platform_target': 'openedx'}
             factory_mock.get_enrollment_controller.return_value = controller_mock
 
-            execute_external_enrollment(data, course)
+            execute_external_enrollment(data, course_key)
 
             controller_mock._post_enrollment.assert_called_once_with(  # pylint: disable=protected-access
                 data,
-                course.other_course_settings,
+                get_settings_mock.return_value,
             )
             factory_mock.get_enrollment_controller.assert_called_once_with(
                 controller='openedx',
             )
 
-        course.other_course_settings.get.side_effect = AttributeError('test-exception')
+        get_settings_mock.return_value = {}
+
+        with LogCapture(level=logging.WARNING) as log_capture:
+            execute_external_enrollment(data, course_key)
+            log = 'The controller {} is not present in the valid external targets list {}.'.format(
+                '',
+                ['openedx'],
+            )
+            log_capture.check(
+                (MODULE, 'WARNING', log),
+            )
+
+    @override_settings(OEE_ASYNC_EXTERNAL_ENROLLMENT_CONTROLLERS=['icc'])
+    @patch('openedx_external_enrollments.tasks.run_external_enrollment')
+    @patch('openedx_external_enrollments.external_enrollments.ExternalEnrollmentFactory')
+    @patch('openedx_external_enrollments.external_enrollments.get_other_course_settings')
+    @patch('openedx_external_enrollments.external_enrollments.configuration_helpers')
+    def test_execute_external_enrollment_async(self, configuration_helpers_mock, get_settings_mock, factory_mock,
+                                               task_mock):
+        """Controllers configured as asynchronous are queued instead of being executed in the request."""
+        get_settings_mock.return_value = {'external_platform_target': 'ICC'}
+        course_key = CourseKey.from_string('course-v1:test+CS102+2019_T3')
+        data = {
+            'user_email': 'test-email',
+            'course_id': course_key,
+            'is_active': True,
+        }
+        configuration_helpers_mock.get_value.return_value = ['icc']
+        controller_mock = factory_mock.get_enrollment_controller.return_value
+
+        execute_external_enrollment(data, course_key)
+
+        task_mock.delay.assert_called_once_with(
+            'icc',
+            {
+                'user_email': 'test-email',
+                'course_id': str(course_key),
+                'is_active': True,
+            },
+            get_settings_mock.return_value,
+            controller_mock.get_site_configuration.return_value,
+        )
+        controller_mock._post_enrollment.assert_not_called()  # pylint: disable=protected-access
+
+    @override_settings(OEE_ASYNC_EXTERNAL_ENROLLMENT_CONTROLLERS=['icc'])
+    @patch('openedx_external_enrollments.tasks.run_external_enrollment')
+    @patch('openedx_external_enrollments.external_enrollments.ExternalEnrollmentFactory')
+    @patch('openedx_external_enrollments.external_enrollments.get_other_course_settings')
+    @patch('openedx_external_enrollments.external_enrollments.configuration_helpers')
+    def test_execute_external_enrollment_async_without_broker(self, configuration_helpers_mock, get_settings_mock,
+                                                              factory_mock, task_mock):
+        """The error of an enrollment that can't be queued is logged instead of being raised."""
+        get_settings_mock.return_value = {'external_platform_target': 'ICC'}
+        course_key = CourseKey.from_string('course-v1:test+CS102+2019_T3')
+        data = {'user_email': 'test-email', 'course_id': course_key}
+        configuration_helpers_mock.get_value.return_value = ['icc']
+        task_mock.delay.side_effect = Exception('broker-error')
+        controller_mock = factory_mock.get_enrollment_controller.return_value
+
+        log = 'Failed to queue the external enrollment for [ICC] with data: {}. Reason: broker-error'.format(data)
 
         with LogCapture(level=logging.ERROR) as log_capture:
-            execute_external_enrollment(data, course)
-            log = 'Course [{}] not configured as external.'.format(course.id)
+            execute_external_enrollment(data, course_key)
+
             log_capture.check(
                 (MODULE, 'ERROR', log),
             )
+
+        controller_mock._post_enrollment.assert_not_called()  # pylint: disable=protected-access
+
+    @override_settings(OEE_OUTBOX_EXTERNAL_ENROLLMENT_CONTROLLERS=['icc'])
+    @patch('openedx_external_enrollments.external_enrollments.add_outbox_event')
+    @patch('openedx_external_enrollments.external_enrollments.ExternalEnrollmentFactory')
+    @patch('openedx_external_enrollments.external_enrollments.get_other_course_settings')
+    @patch('openedx_external_enrollments.external_enrollments.configuration_helpers')
+    def test_execute_external_enrollment_outbox(self, configuration_helpers_mock, get_settings_mock, factory_mock,
+                                                add_outbox_event_mock):
+        """Controllers configured to use the outbox store the event instead of executing the enrollment."""
+        get_settings_mock.return_value = {'external_platform_target': 'icc'}
+        course_key = CourseKey.from_string('course-v1:test+CS102+2019_T3')
+        data = {
+            'user_email': 'test-email',
+            'course_id': course_key,
+        }
+        configuration_helpers_mock.get_value.return_value = ['icc']
+        controller_mock = factory_mock.get_enrollment_controller.return_value
+
+        execute_external_enrollment(data, course_key)
+
+        add_outbox_event_mock.assert_called_once_with(
+            'icc',
+            {
+                'user_email': 'test-email',
+                'course_id': 'course-v1:test+CS102+2019_T3',
+            },
+            get_settings_mock.return_value,
+            controller_mock.get_site_configuration.return_value,
+        )
+        controller_mock._post_enrollment.assert_not_called()  # pylint: disable=protected-access
@@ -0,0 +1,45 @@
+"""Tests for the http_session module."""
+from django.test import TestCase, override_settings
+from mock import patch
+
+from openedx_external_enrollments.external_enrollments import http_session
+from openedx_external_enrollments.external_enrollments.http_session import get_http_session
+
+
+class GetHttpSessionTest(TestCase):
+    """Test class for get_http_session method."""
+
+    def setUp(self):
+        """Start every test without cached sessions."""
+        http_session._SESSIONS.clear()  # pylint: disable=protected-access
+
+    def test_same_host_reuses_session(self):
+        """Requests to the same host must share the session and therefore its connection pool."""
+        session = get_http_session('https://partner.com/api/login')
+
+        self.assertIs(session, get_http_session('https://partner.com/api/enroll'))
+
+    def test_different_hosts_get_different_sessions(self):
+        """Every host gets its own session."""
+        self.assertIsNot(
+            get_http_session('https://partner.com/api'),
+            get_http_session('https://other-partner.com/api'),
+        )
+
+    @patch('openedx_external_enrollments.external_enrollments.http_session.os.getpid')
+    def test_new_process_gets_new_session(self, getpid_mock):
+        """Sessions created by a parent process must not be reused after a fork."""
+        getpid_mock.return_value = 1
+        session = get_http_session('https://partner.com/api')
+        getpid_mock.return_value = 2
+
+        self.assertIsNot(session, get_http_session('https://partner.com/api'))
+
+    @override_settings(OEE_HTTP_POOL_MAXSIZE=25, OEE_HTTP_KEEP_ALIVE=False)
+    def test_session_configuration(self):
+        """The pool size and keep-alive behavior are taken from settings."""
+        session = get_http_session('https://partner.com/api')
+        adapter = session.get_adapter('https://partner.com/api')
+
+        self.assertEqual(adapter._pool_maxsize, 25)  # pylint: disable=protected-access
+        self.assertEqual(session.headers['Connection'], 'close')
@@ -1,9 +1,14 @@
 """ICCExternalEnrollment class tests file."""
 from django.conf import settings
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from mock import Mock, patch
 
-from openedx_external_enrollments.external_enrollments.icc_external_enrollment import ICCExternalEnrollment
+from openedx_external_enrollments.external_enrollments.icc_external_enrollment import (
+    ICCExternalEnrollment,
+    ICCResponseError,
+)
+from openedx_external_enrollments.models import EnrollmentRequestLog, ICCUser
 
 
 class ICCExternalEnrollmentTest(TestCase):
@@ -11,6 +16,7 @@ class ICCExternalEnrollmentTest(TestCase):
 
     def setUp(self):
         """Set test instance."""
+        cache.clear()
         self.base = ICCExternalEnrollment()
 
     @patch.object(ICCExternalEnrollment, '_get_icc_user')
@@ -49,6 +55,7 @@ class ICCExternalEnrollmentTest(TestCase):
         expected_data = {
             'wstoken': settings.ICC_API_TOKEN,
             'wsfunction': settings.ICC_ENROLLMENT_API_FUNCTION,
+            'moodlewsrestformat': 'json',
             'enrolments[0][roleid]': '5',
             'enrolments[0][userid]': '14',
             'enrolments[0][courseid]': '33',
@@ -85,18 +92,17 @@ class ICCExternalEnrollmentTest(TestCase):
             'ICC',
         )
 
-    @patch('openedx_external_enrollments.external_enrollments.icc_external_enrollment.configuration_helpers')
+    @patch('openedx_external_enrollments.external_enrollments.base_external_enrollment.configuration_helpers')
     def test_get_random_string(self, configuration_helpers_mock):
         """
         Testing _get_random_string method.
         """
-        USERNAME_SUFFIX_LENGTH = 5
+        configuration_helpers_mock.get_value.return_value = None
+
+        self.assertEqual(len(self.base._get_random_string(8)), 8)  # pylint: disable=protected-access
+
         configuration_helpers_mock.get_value.return_value = 'setting_value'
 
-        self.assertEqual(
-            len(self.base._get_random_string(USERNAME_SUFFIX_LENGTH)),  # pylint: disable=protected-access
-            USERNAME_SUFFIX_LENGTH,
-        )
         self.assertEqual(
             self.base._get_random_string(8),  # pylint: disable=protected-access
             'setting_value',
@@ -281,16 +287,24 @@ class ICCExternalEnrollmentTest(TestCase):
             self.base._validate_icc_user({}, {}),  # pylint: disable=protected-access
             expected_icc_user,
         )
-        create_icc_user_mock.assert_called_once_with({}, False)
+        create_icc_user_mock.assert_called_once_with({})
 
     @patch('openedx_external_enrollments.external_enrollments.icc_external_enrollment.get_user')
-    @patch('openedx_external_enrollments.external_enrollments.icc_external_enrollment.requests.post')
-    @patch('openedx_external_enrollments.external_enrollments.icc_external_enrollment.configuration_helpers')
+    @patch('openedx_external_enrollments.external_enrollments.icc_external_enrollment.get_http_session')
+    @patch('openedx_external_enrollments.external_enrollments.base_external_enrollment.configuration_helpers')
     @patch.object(ICCExternalEnrollment, '_get_random_string')
-    def test_create_icc_user(self, get_random_string_mock, configuration_helpers_mock, mock_post, get_user_mock):
+    @patch.object(ICCExternalEnrollment, '_get_available_usernames', Mock(return_value=['user-test-username']))
+    def test_create_icc_user(
+            self,
+            get_random_string_mock,
+            configuration_helpers_mock,
+            http_session_mock,
+            get_user_mock,
+    ):
         """
         Testing _create_icc_user method.
         """
+        mock_post = http_session_mock.return_value.post
         data = {
             'user_email': 'test-email',
         }
@@ -302,39 +316,35 @@ class ICCExternalEnrollmentTest(TestCase):
         get_user_mock.return_value = (user_mock, Mock())
         get_random_string_mock.return_value = 'test-password'
         configuration_helpers_mock.get_value.return_value = 'test-auth-method'
-        mock_post.return_value.content = '''<?xml version="1.0" encoding="UTF-8" ?>
-        <RESPONSE>
-            <MULTIPLE>
-                <SINGLE>
-                    <KEY name="id">
-                        <VALUE>1223</VALUE>
-                    </KEY>
-                    <KEY name="username">
-                        <VALUE>testuser</VALUE>
-                    </KEY>
-                </SINGLE>
-            </MULTIPLE>
-        </RESPONSE>'''
+        mock_post.return_value.json.return_value = [{'id': 1223, 'username': 'testuser'}]
         expected_icc_user = {
             'id': '1223',
             'username': 'testuser',
         }
 
         self.assertEqual(
-            self.base._create_icc_user(data, False),  # pylint: disable=protected-access
+            self.base._create_icc_user(data),  # pylint: disable=protected-access
             expected_icc_user,
         )
         get_random_string_mock.assert_called_once()
         get_user_mock.assert_called_once_with(email=data.get('user_email'))
 
     @patch('openedx_external_enrollments.external_enrollments.icc_external_enrollment.get_user')
-    @patch('openedx_external_enrollments.external_enrollments.icc_external_enrollment.requests.post')
-    @patch('openedx_external_enrollments.external_enrollments.icc_external_enrollment.configuration_helpers')
+    @patch('openedx_external_enrollments.external_enrollments.icc_external_enrollment.get_http_session')
+    @patch('openedx_external_enrollments.external_enrollments.base_external_enrollment.configuration_helpers')
     @patch.object(ICCExternalEnrollment, '_get_random_string')
-    def test_create_icc_user_fail(self, get_random_string_mock, configuration_helpers_mock, mock_post, get_user_mock):
+    @patch.object(ICCExternalEnrollment, '_get_available_usernames', Mock(return_value=['user-test-username']))
+    def test_create_icc_user_fail(
+            self,
+            get_random_string_mock,
+            configuration_helpers_mock,
+            http_session_mock,
+            get_user_mock,
+    ):
         """
         Testing fail _create_icc_user method.
         """
+        mock_post = http_session_mock.return_value.post
         data = {
             'user_email': 'test-email',
         }
@@ -349,6 +359,345 @@ class ICCExternalEnrollmentTest(TestCase):
         mock_post.side_effect = Exception('Test')
 
         self.assertEqual(
-            self.base._create_icc_user(data, False),  # pylint: disable=protected-access
+            self.base._create_icc_user(data),  # pylint: disable=protected-access
             {},
         )
+
+        request_log = EnrollmentRequestLog.objects.get()  # pylint: disable=no-member
+        self.assertEqual(request_log.details['request_payload']['wstoken'], 'icc-api-token')
+        self.assertNotIn('users[0][password]', request_log.details['request_payload'])
+
+    @patch('openedx_external_enrollments.external_enrollments.icc_external_enrollment.get_user')
+    @patch('openedx_external_enrollments.external_enrollments.icc_external_enrollment.get_http_session')
+    @patch.object(ICCExternalEnrollment, '_get_available_usernames', Mock(return_value=['michael']))
+    def test_create_icc_user_with_duplicated_username(self, http_session_mock, get_user_mock):
+        """The next username candidate is tried when ICC rejects the username as duplicated."""
+        user_mock = Mock(username='michael', email='michael@example.com', first_name='first', last_name='last')
+        get_user_mock.return_value = (user_mock, Mock())
+        self.base.set_site_configuration({'DEFAULT_USER_TESTING_PASSWORD': 'test-password'})
+        duplicated_username_response = Mock()
+        duplicated_username_response.json.return_value = {
+            'exception': 'invalid_parameter_exception',
+            'errorcode': 'invalidparameter',
+            'message': 'Invalid parameter value detected',
+            'debuginfo': 'Username already exists: michael',
+        }
+        created_user_response = Mock()
+        created_user_response.json.return_value = [{'id': 1002, 'username': 'michael-suffixed'}]
+        http_session_mock.return_value.post.side_effect = [duplicated_username_response, created_user_response]
+
+        self.assertEqual(
+            self.base._create_icc_user({'user_email': 'michael@example.com'}),  # pylint: disable=protected-access
+            {'id': '1002', 'username': 'michael-suffixed'},
+        )
+        self.assertEqual(
+            [kwargs['data']['users[0][username]'] for _, kwargs in http_session_mock.return_value.post.call_args_list],
+            self.base._get_username_candidates(user_mock)[:2],  # pylint: disable=protected-access
+        )
+
+    @patch('openedx_external_enrollments.external_enrollments.icc_external_enrollment.get_http_session')
+    @patch.object(ICCExternalEnrollment, '_validate_icc_user')
+    @patch.object(ICCExternalEnrollment, '_get_icc_user_from_response')
+    def test_get_icc_user_is_stored(self, get_user_from_response_mock, validate_icc_user_mock, http_session_mock):
+        """The ICC user is looked up through the API only the first time."""
+        validate_icc_user_mock.return_value = {'id': '1002', 'username': 'michael'}
+
+        self.assertEqual(
+            self.base._get_icc_user({'user_email': 'Michael@example.com'}),  # pylint: disable=protected-access
+            {'id': '1002', 'username': 'michael'},
+        )
+        cache.clear()
+        self.assertEqual(
+            self.base._get_icc_user({'user_email': 'michael@example.com'}),  # pylint: disable=protected-access
+            {'id': '1002', 'username': 'michael'},
+        )
+
+        http_session_mock.return_value.post.assert_called_once()
+        get_user_from_response_mock.assert_called_once()
+        self.assertEqual(ICCUser.objects.get().email, 'michael@example.com')  # pylint: disable=no-member
+
+    def test_get_stored_icc_user_from_cache(self):
+        """The stored ICC user is read from the cache after the first read."""
+        ICCUser.objects.create(email='michael@example.com', icc_user_id='1002')  # pylint: disable=no-member
+
+        with self.assertNumQueries(1):
+            for _ in range(2):
+                self.assertEqual(
+                    self.base._get_stored_icc_user('michael@example.com'),  # pylint: disable=protected-access
+                    {'id': '1002', 'username': ''},
+                )
+
+    def test_store_icc_user_without_id(self):
+        """Failed lookups are not stored."""
+        self.base._store_icc_user('michael@example.com', {})  # pylint: disable=protected-access
+
+        self.assertFalse(ICCUser.objects.exists())  # pylint: disable=no-member
+        self.assertEqual(self.base._get_stored_icc_user('michael@example.com'), {})  # pylint: disable=protected-access
+
+    @patch('openedx_external_enrollments.external_enrollments.icc_external_enrollment.get_http_session')
+    def test_execute_post_forgets_rejected_icc_user(self, http_session_mock):
+        """The stored ICC user is forgotten when ICC rejects the enrollment."""
+        self.base._store_icc_user('michael@example.com', {'id': '1002'})  # pylint: disable=protected-access
+        http_session_mock.return_value.post.return_value.json.return_value = {
+            'exception': 'dml_missing_record_exception',
+            'errorcode': 'invalidrecord',
+            'message': 'Can\'t find data record in database table user.',
+        }
+
+        self.base._execute_post(  # pylint: disable=protected-access
+            url=settings.ICC_BASE_URL,
+            json_data={'enrolments[0][userid]': '1002'},
+        )
+
+        self.assertFalse(ICCUser.objects.exists())  # pylint: disable=no-member
+        self.assertEqual(self.base._get_stored_icc_user('michael@example.com'), {})  # pylint: disable=protected-access
+
+    def test_get_icc_user_from_json_response(self):
+        """The user is read from the JSON response, an empty dict is returned when it doesn't exist."""
+        response = Mock()
+        response.json.return_value = {'users': [{'id': 1002, 'username': 'michael'}], 'warnings': []}
+
+        self.assertEqual(
+            self.base._get_icc_user_from_response(response, 'get_user'),  # pylint: disable=protected-access
+            {'id': '1002', 'username': 'michael'},
+        )
+
+        response.json.return_value = {'users': [], 'warnings': []}
+
+        self.assertEqual(
+            self.base._get_icc_user_from_response(response, 'get_user'),  # pylint: disable=protected-access
+            {},
+        )
+
+    def test_get_icc_user_from_json_error_response(self):
+        """Error responses are raised instead of being taken as a not found user."""
+        response = Mock()
+        response.json.return_value = {
+            'exception': 'webservice_access_exception',
+            'errorcode': 'accessexception',
+            'message': 'Access control exception',
+        }
+
+        with self.assertRaisesRegex(ICCResponseError, 'accessexception: Access control exception'):
+            self.base._get_icc_user_from_response(response, 'get_user')  # pylint: disable=protected-access
+
+        response.json.return_value = {'unexpected': []}
+
+        with self.assertRaises(ICCResponseError):
+            self.base._get_icc_user_from_response(response, 'get_user')  # pylint: disable=protected-access
+
+    @patch.object(ICCExternalEnrollment, '_get_icc_user_from_xml_response')
+    def test_get_icc_user_from_xml_response_fallback(self, get_icc_user_from_xml_response_mock):
+        """Responses that are not JSON are parsed as XML."""
+        response = Mock()
+        response.json.side_effect = ValueError('No JSON object could be decoded')
+
+        self.assertEqual(
+            self.base._get_icc_user_from_response(response, 'get_user'),  # pylint: disable=protected-access
+            get_icc_user_from_xml_response_mock.return_value,
+        )
+        get_icc_user_from_xml_response_mock.assert_called_once_with(response, 'get_user')
+
+    @patch('openedx_external_enrollments.external_enrollments.icc_external_enrollment.get_http_session')
+    @patch.object(ICCExternalEnrollment, '_create_icc_user')
+    def test_get_icc_user_with_error_response(self, create_icc_user_mock, http_session_mock):
+        """The user is not created when the lookup fails."""
+        http_session_mock.return_value.post.return_value.json.return_value = {
+            'exception': 'moodle_exception',
+            'errorcode': 'servicenotavailable',
+            'message': 'Web service is not available',
+        }
+
+        self.assertEqual(
+            self.base._get_icc_user({'user_email': 'michael@example.com'}),  # pylint: disable=protected-access
+            {},
+        )
+        create_icc_user_mock.assert_not_called()
+        self.assertFalse(ICCUser.objects.exists())  # pylint: disable=no-member
+
+
+@override_settings(OEE_ICC_BULK_REQUEST_SIZE=2)
+class ICCBulkEnrollmentTest(TestCase):
+    """Test class for the ICC bulk enrollments."""
+
+    def setUp(self):
+        """Set test instance and the ICC responses by web service function."""
+        cache.clear()
+        self.base = ICCExternalEnrollment()
+        self.responses = {}
+        self.requests = []
+        http_session_patcher = patch(
+            'openedx_external_enrollments.external_enrollments.icc_external_enrollment.get_http_session',
+        )
+        http_session_mock = http_session_patcher.start()
+        http_session_mock.return_value.post.side_effect = self._post
+        self.addCleanup(http_session_patcher.stop)
+
+    def _post(self, url, data):  # pylint: disable=unused-argument
+        """Record the request and return the response of its web service function."""
+        self.requests.append(data)
+        response = Mock()
+        response.json.return_value = self.responses.get(data['wsfunction'])
+
+        return response
+
+    @staticmethod
+    def _get_enrollment(email, course_id='33'):
+        """Return the enrollment data and course settings of the learner."""
+        return {'user_email': email}, {'external_course_run_id': course_id}
+
+    def test_run_enrollments_with_stored_users(self):
+        """Learners with a stored ICC user are enrolled in bulk requests of OEE_ICC_BULK_REQUEST_SIZE."""
+        for icc_user_id, email in enumerate(['first@example.com', 'second@example.com', 'third@example.com']):
+            ICCUser.objects.create(email=email, icc_user_id=str(icc_user_id))  # pylint: disable=no-member
+
+        results = self.base.run_enrollments([
+            self._get_enrollment('first@example.com'),
+            self._get_enrollment('Second@example.com'),
+            self._get_enrollment('third@example.com'),
+        ])
+
+        self.assertEqual(results, [(None, True)] * 3)
+        self.assertEqual(
+            [request['wsfunction'] for request in self.requests],
+            [settings.ICC_ENROLLMENT_API_FUNCTION] * 2,
+        )
+        self.assertEqual(self.requests[0]['enrolments[1][userid]'], '1')
+        self.assertEqual(self.requests[0]['enrolments[1][courseid]'], '33')
+        self.assertEqual(self.requests[1]['enrolments[0][userid]'], '2')
+
+    @patch('openedx_external_enrollments.external_enrollments.base_external_enrollment.configuration_helpers')
+    @patch('openedx_external_enrollments.external_enrollments.icc_external_enrollment.get_user')
+    def test_run_enrollments_with_unknown_users(self, get_user_mock, configuration_helpers_mock):
+        """Unknown ICC users are looked up and created in bulk before the enrollment."""
+        configuration_helpers_mock.get_value.return_value = 'setting_value'
+        user_mock = Mock(username='Second', first_name='first-name', last_name='last-name', email='second@example.com')
+        get_user_mock.return_value = (user_mock, Mock())
+        self.responses = {
+            settings.ICC_GET_USERS_BY_FIELD_API_FUNCTION: [
+                {'id': 1, 'username': 'first', 'email': 'First@example.com'},
+            ],
+            settings.ICC_CREATE_USER_API_FUNCTION: [{'id': 2, 'username': 'second'}],
+        }
+
+        results = self.base.run_enrollments([
+            self._get_enrollment('first@example.com'),
+            self._get_enrollment('second@example.com'),
+        ])
+
+        self.assertEqual(results, [(None, True)] * 2)
+        self.assertEqual(
+            [request['wsfunction'] for request in self.requests],
+            [
+                settings.ICC_GET_USERS_BY_FIELD_API_FUNCTION,
+                settings.ICC_GET_USERS_BY_FIELD_API_FUNCTION,
+                settings.ICC_CREATE_USER_API_FUNCTION,
+                settings.ICC_ENROLLMENT_API_FUNCTION,
+            ],
+        )
+        self.assertEqual(self.requests[1]['field'], 'username')
+        self.assertEqual(self.requests[2]['users[0][username]'], 'second')
+        self.assertEqual(
+            dict(ICCUser.objects.values_list('email', 'icc_user_id')),  # pylint: disable=no-member
+            {'first@example.com': '1', 'second@example.com': '2'},
+        )
+
+    @patch.object(ICCExternalEnrollment, 'run_enrollment')
+    def test_run_enrollments_with_failed_users_lookup(self, run_enrollment_mock):
+        """Unknown ICC users aren't created when the lookup fails, they are enrolled one by one."""
+        run_enrollment_mock.return_value = (None, True)
+        self.responses = {
+            settings.ICC_GET_USERS_BY_FIELD_API_FUNCTION: {
+                'exception': 'webservice_access_exception',
+                'errorcode': 'accessexception',
+                'message': 'Access control exception',
+            },
+        }
+        enrollments = [self._get_enrollment('first@example.com'), self._get_enrollment('second@example.com')]
+
+        results = self.base.run_enrollments(enrollments)
+
+        self.assertEqual(results, [(None, True)] * 2)
+        self.assertEqual(
+            [request['wsfunction'] for request in self.requests],
+            [settings.ICC_GET_USERS_BY_FIELD_API_FUNCTION],
+        )
+        self.assertEqual([call[0] for call in run_enrollment_mock.call_args_list], enrollments)
+        self.assertFalse(ICCUser.objects.exists())  # pylint: disable=no-member
+
+    def test_get_available_usernames(self):
+        """Taken usernames are replaced by the first free candidate, which is always the same."""
+        ICCUser.objects.create(  # pylint: disable=no-member
+            email='other@example.com',
+            icc_user_id='1',
+            username='michael',
+        )
+        first_user = Mock(username='Michael', email='michael@example.com')
+        second_user = Mock(username='michael', email='michael@example.org')
+        candidates = self.base._get_username_candidates(first_user)  # pylint: disable=protected-access
+        self.responses = {
+            settings.ICC_GET_USERS_BY_FIELD_API_FUNCTION: [{'id': 2, 'username': candidates[1]}],
+        }
+
+        usernames = self.base._get_available_usernames([first_user, second_user])  # pylint: disable=protected-access
+
+        self.assertEqual(usernames[0], candidates[2])
+        self.assertNotIn(usernames[1], [usernames[0], 'michael'])
+        self.assertEqual(candidates, self.base._get_username_candidates(first_user))  # pylint: disable=protected-access
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(self.requests[0]['field'], 'username')
+
+    def test_get_available_usernames_without_free_candidates(self):
+        """None is returned when all the candidates are taken."""
+        user = Mock(username='michael', email='michael@example.com')
+        self.responses = {
+            settings.ICC_GET_USERS_BY_FIELD_API_FUNCTION: [
+                {'id': position, 'username': candidate}
+                for position, candidate in enumerate(
+                    self.base._get_username_candidates(user),  # pylint: disable=protected-access
+                )
+            ],
+        }
+
+        self.assertEqual(self.base._get_available_usernames([user]), [None])  # pylint: disable=protected-access
+
+    @patch.object(ICCExternalEnrollment, 'run_enrollment')
+    def test_run_enrollments_with_failed_bulk_request(self, run_enrollment_mock):
+        """The learners of a failed bulk request, or without external course, are enrolled one by one."""
+        ICCUser.objects.create(email='first@example.com', icc_user_id='1')  # pylint: disable=no-member
+        ICCUser.objects.create(email='second@example.com', icc_user_id='2')  # pylint: disable=no-member
+        self.responses = {
+            settings.ICC_ENROLLMENT_API_FUNCTION: {
+                'exception': 'moodle_exception',
+                'errorcode': 'wsusercannotassign',
+                'message': 'You don\'t have the permission to assign this role',
+            },
+        }
+        run_enrollment_mock.return_value = ('error', False)
+        enrollments = [
+            self._get_enrollment('first@example.com'),
+            self._get_enrollment('second@example.com', course_id=None),
+        ]
+
+        self.assertEqual(self.base.run_enrollments(enrollments), [('error', False)] * 2)
+        self.assertEqual(run_enrollment_mock.call_count, 2)
+        self.assertEqual(len(self.requests), 1)
+
+    def test_run_enrollments_with_rejected_enrollment(self):
+        """Learners rejected by ICC are returned as failed, even if ICC answers with a 200 status."""
+        ICCUser.objects.create(email='first@example.com', icc_user_id='1')  # pylint: disable=no-member
+        self.responses = {
+            settings.ICC_ENROLLMENT_API_FUNCTION: {
+                'exception': 'moodle_exception',
+                'errorcode': 'wsusercannotassign',
+                'message': 'You don\'t have the permission to assign this role',
+            },
+        }
+
+        results = self.base.run_enrollments([self._get_enrollment('first@example.com')])
+
+        self.assertEqual(results, [(self.responses[settings.ICC_ENROLLMENT_API_FUNCTION], False)])
+        self.assertEqual(
+            [request['wsfunction'] for request in self.requests],
+            [settings.ICC_ENROLLMENT_API_FUNCTION] * 2,
+        )
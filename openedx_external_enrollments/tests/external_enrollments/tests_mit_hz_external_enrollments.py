@@ -1,21 +1,25 @@
 """Tests MITHzInstanceExternalEnrollment class file."""
 from urllib.parse import quote_plus
 
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
 from django.test import TestCase
 from mock import Mock, patch
+from requests.exceptions import ConnectionError as RequestsConnectionError
 
 from openedx_external_enrollments.external_enrollments.mit_hz_external_enrollment import MITHzInstanceExternalEnrollment
+from openedx_external_enrollments.models import ExternalEnrollment
+from openedx_external_enrollments.tests.tests_backends import CourseOverview
 
 
 class MITHzInstanceExternalEnrollmentTest(TestCase):
     """Test class for MITHzInstanceExternalEnrollment."""
 
-    @patch('openedx_external_enrollments.external_enrollments.mit_hz_external_enrollment.configuration_helpers')
-    def setUp(self, configuration_helpers_mock):  # pylint: disable=arguments-differ
+    def setUp(self):
         """setUp."""
-        configuration_helpers_mock.get_value.return_value = 'setting_value'
         self.base = MITHzInstanceExternalEnrollment()
+        self.base.set_site_configuration({'MIT_HZ_PROVIDER': 'setting_value', 'MIT_HZ_ORG': 'setting_value'})
 
     def test_str(self):
         """
@@ -127,7 +131,10 @@ class MITHzInstanceExternalEnrollmentTest(TestCase):
             email=data.get('user_email'),
             meta={},
         )
-        check_user_mock.assert_called_once_with('setting_value%7Csetting_value%7Cuser_email')
+        check_user_mock.assert_called_once_with(
+            'setting_value%7Csetting_value%7Cuser_email',
+            skip_recent_misses=True,
+        )
         enrollment_mock.save.assert_called_once()
 
     @patch('openedx_external_enrollments.external_enrollments.mit_hz_external_enrollment.ExternalEnrollment')
@@ -155,12 +162,13 @@ class MITHzInstanceExternalEnrollmentTest(TestCase):
         )
         check_user_mock.assert_not_called()
 
-    @patch('openedx_external_enrollments.external_enrollments.base_external_enrollment.requests.post')
+    @patch('openedx_external_enrollments.external_enrollments.base_external_enrollment.get_http_session')
     @patch('openedx_external_enrollments.external_enrollments.mit_hz_external_enrollment.ExternalEnrollment')
-    def test_execute_post_failed(self, model_mock, post_mock):
+    def test_execute_post_failed(self, model_mock, http_session_mock):
         """
         Test _execute_post method when the post response is unsuccessful.
         """
+        post_mock = http_session_mock.return_value.post
         json_data = {
             'course_id': 'course-id',
             'user_email': 'user-email',
@@ -190,12 +198,13 @@ class MITHzInstanceExternalEnrollmentTest(TestCase):
         model_mock.objects.filter.assert_not_called()
         model_mock.objects.update.assert_not_called()
 
-    @patch('openedx_external_enrollments.external_enrollments.base_external_enrollment.requests.post')
+    @patch('openedx_external_enrollments.external_enrollments.base_external_enrollment.get_http_session')
     @patch('openedx_external_enrollments.external_enrollments.mit_hz_external_enrollment.ExternalEnrollment')
-    def test_execute_post_succeeded(self, model_mock, post_mock):
+    def test_execute_post_succeeded(self, model_mock, http_session_mock):
         """
         Test _execute_post method when the post response is successful.
         """
+        post_mock = http_session_mock.return_value.post
         json_data = {
             'course_id': 'course-id',
             'user_email': 'user-email',
@@ -229,3 +238,149 @@ class MITHzInstanceExternalEnrollmentTest(TestCase):
             email=json_data.get('user_email'),
         )
         queryset_mock.update.assert_called_once_with(meta={'data': 'data'})
+
+
+@patch.object(MITHzInstanceExternalEnrollment, '_get_bearer_token', Mock(return_value='token'))
+@patch('openedx_external_enrollments.external_enrollments.mit_hz_external_enrollment.time')
+@patch('openedx_external_enrollments.external_enrollments.mit_hz_external_enrollment.get_http_session')
+class MITHzCheckUserTest(TestCase):
+    """Test class for the MIT HZ users check."""
+
+    def setUp(self):
+        """setUp."""
+        cache.clear()
+        self.base = MITHzInstanceExternalEnrollment()
+        self.base.set_site_configuration({'MIT_HZ_PROVIDER': 'setting_value', 'MIT_HZ_ORG': 'setting_value'})
+
+    def test_check_user_misses_are_cached(self, http_session_mock, time_mock):
+        """Users that are not found are checked again after a backoff that doubles after every miss."""
+        get_mock = http_session_mock.return_value.get
+        get_mock.return_value = Mock(ok=False, text='User not found.')
+
+        for now, expected_calls in [(0, 1), (299, 1), (300, 2), (899, 2), (900, 3)]:
+            time_mock.time.return_value = now
+            self.assertEqual(
+                self.base._check_user('user-id', skip_recent_misses=True),  # pylint: disable=protected-access
+                {},
+            )
+            self.assertEqual(get_mock.call_count, expected_calls, now)
+
+        # Enrollments always check the user.
+        self.base._check_user('user-id')  # pylint: disable=protected-access
+        self.assertEqual(get_mock.call_count, 4)
+
+    def test_check_user_found_clears_misses(self, http_session_mock, time_mock):
+        """The misses of the user are forgotten once it is found."""
+        get_mock = http_session_mock.return_value.get
+        time_mock.time.return_value = 0
+        get_mock.return_value = Mock(ok=False, text='User not found.')
+        self.base._check_user('user-id', skip_recent_misses=True)  # pylint: disable=protected-access
+
+        time_mock.time.return_value = 300
+        get_mock.return_value = Mock(ok=True, json=Mock(return_value={'user': 'data'}))
+
+        self.assertEqual(
+            self.base._check_user('user-id', skip_recent_misses=True),  # pylint: disable=protected-access
+            {'user': 'data'},
+        )
+        self.assertIsNone(cache.get(self.base._get_user_miss_cache_key('user-id')))  # pylint: disable=protected-access
+
+    @patch('openedx_external_enrollments.external_enrollments.mit_hz_external_enrollment.delete_cached_token')
+    def test_check_user_rejected_token(self, delete_cached_token_mock, http_session_mock, time_mock):
+        """The rejected token is removed from cache and the user is checked again with a new one."""
+        get_mock = http_session_mock.return_value.get
+        time_mock.time.return_value = 0
+        get_mock.side_effect = [
+            Mock(ok=False, status_code=401),
+            Mock(ok=True, status_code=200, json=Mock(return_value={'user': 'data'})),
+        ]
+
+        self.assertEqual(self.base._check_user('user-id'), {'user': 'data'})  # pylint: disable=protected-access
+        delete_cached_token_mock.assert_called_once_with('mit_hz.{}'.format(settings.MIT_HZ_ID))
+        self.assertEqual(get_mock.call_count, 2)
+
+
+class MITHzSubscriptionsRefreshTest(TestCase):
+    """Test class for the MIT HZ subscriptions bulk refresh."""
+
+    def setUp(self):
+        """Create the MIT HZ enrollments of several learners."""
+        self.base = MITHzInstanceExternalEnrollment()
+        self.base.set_site_configuration({'MIT_HZ_PROVIDER': 'setting_value', 'MIT_HZ_ORG': 'setting_value'})
+        self.enrollments = {}
+
+        for email in ['found@example.com', 'not-found@example.com', 'failed@example.com']:
+            self.enrollments[email] = [
+                ExternalEnrollment.objects.create(  # pylint: disable=no-member
+                    controller_name='mit_hz',
+                    course_shell=CourseOverview.objects.create(),  # pylint: disable=no-member
+                    email=email,
+                    meta={'previous': 'subscription'},
+                )
+                for _ in range(2)
+            ]
+
+    @staticmethod
+    def _post(url, headers, json):  # pylint: disable=unused-argument
+        """Return the MIT HZ refresh response of the learner."""
+        if json['user_email'] == 'failed@example.com':
+            raise RequestsConnectionError('connection error')
+
+        if json['user_email'] == 'not-found@example.com':
+            return Mock(ok=False, status_code=404)
+
+        return Mock(ok=True, json=Mock(return_value={'user': {'expiration_date': '2027-01-01'}}))
+
+    @patch.object(MITHzInstanceExternalEnrollment, '_get_bearer_token', Mock(return_value='token'))
+    @patch('openedx_external_enrollments.external_enrollments.mit_hz_external_enrollment.get_http_session')
+    def test_refresh_subscriptions(self, http_session_mock):
+        """Every learner is refreshed once per run and the failed or unknown ones keep their subscription."""
+        http_session_mock.return_value.post.side_effect = self._post
+
+        summary = self.base.refresh_subscriptions(batch_size=3, max_workers=2)
+
+        # The enrollments of not-found@example.com are split between the two batches.
+        self.assertEqual(summary, {'refreshed': 1, 'not_found': 1, 'failed': 1})
+        self.assertEqual(
+            sorted(kwargs['json']['user_email'] for _, kwargs in http_session_mock.return_value.post.call_args_list),
+            sorted(self.enrollments),
+        )
+        self.assertIn(
+            {
+                'user_email': 'found@example.com',
+                'course_id': str(self.enrollments['found@example.com'][0].course_shell_id),
+                'user_id': self.base._get_user_id('found@example.com'),  # pylint: disable=protected-access
+            },
+            [kwargs['json'] for _, kwargs in http_session_mock.return_value.post.call_args_list],
+        )
+        self.assertEqual(
+            http_session_mock.return_value.post.call_args[1]['headers']['Authorization'],
+            'Bearer token',
+        )
+        expected_meta = {
+            'found@example.com': {'expiration_date': '2027-01-01'},
+            'not-found@example.com': {'previous': 'subscription'},
+            'failed@example.com': {'previous': 'subscription'},
+        }
+
+        for email, enrollments in self.enrollments.items():
+            for enrollment in enrollments:
+                enrollment.refresh_from_db()
+                self.assertEqual(enrollment.meta, expected_meta[email])
+
+    @patch.object(MITHzInstanceExternalEnrollment, '_get_bearer_token', Mock(return_value='token'))
+    @patch('openedx_external_enrollments.external_enrollments.mit_hz_external_enrollment.get_http_session')
+    def test_refresh_subscriptions_with_site_configuration(self, http_session_mock):
+        """The user ids are built with the provider and org of the given site configuration."""
+        http_session_mock.return_value.post.side_effect = self._post
+
+        self.base.refresh_subscriptions(
+            batch_size=10,
+            max_workers=1,
+            site_configuration={'MIT_HZ_PROVIDER': 'provider', 'MIT_HZ_ORG': 'org'},
+        )
+
+        self.assertEqual(
+            sorted(kwargs['json']['user_id'] for _, kwargs in http_session_mock.return_value.post.call_args_list),
+            [quote_plus('provider|org|{}'.format(email)) for email in sorted(self.enrollments)],
+        )
@@ -0,0 +1,274 @@
+"""Tests for the outbox module."""
+from datetime import timedelta
+from uuid import uuid4
+
+from django.test import TestCase
+from django.utils import timezone
+from mock import Mock, patch
+
+from openedx_external_enrollments.external_enrollments.outbox import (
+    add_outbox_event,
+    get_outbox_backlog,
+    relay_outbox_events,
+)
+from openedx_external_enrollments.models import EnrollmentOutboxEvent
+
+module = 'openedx_external_enrollments.external_enrollments.outbox'
+
+
+class EnrollmentOutboxTest(TestCase):
+    """Test class for the enrollment outbox."""
+
+    def setUp(self):
+        """Set the controller returned by the factory."""
+        self.course_settings = {'external_platform_target': 'icc'}
+        self.controller_mock = Mock(COALESCE_OUTBOX_EVENTS=True)
+        self.controller_mock.run_enrollment.return_value = {'id': 1}, True
+        self.controller_mock.run_enrollments.side_effect = lambda enrollments: [
+            self.controller_mock.run_enrollment(data, course_settings) for data, course_settings in enrollments
+        ]
+        self.controller_mock.get_retry_policy.return_value = {'max_retries': 1, 'countdown': 60}
+        factory_patcher = patch('{}.ExternalEnrollmentFactory'.format(module))
+        self.factory_mock = factory_patcher.start()
+        self.factory_mock.get_enrollment_controller.return_value = self.controller_mock
+        self.addCleanup(factory_patcher.stop)
+
+    def _add_event(self, email='learner@example.com', is_active=True, controller_name='icc', site_configuration=None):
+        """Store an event in the outbox."""
+        return add_outbox_event(
+            controller_name,
+            {
+                'user_email': email,
+                'course_id': 'course-v1:test+CS102+2019_T3',
+                'is_active': is_active,
+            },
+            self.course_settings,
+            site_configuration,
+        )
+
+    def test_add_outbox_event(self):
+        """The event is stored as pending with the data required by the controller."""
+        event = self._add_event()
+
+        self.assertEqual(event.status, EnrollmentOutboxEvent.PENDING)
+        self.assertEqual(event.course_id, 'course-v1:test+CS102+2019_T3')
+        self.assertEqual(event.email, 'learner@example.com')
+        self.assertEqual(event.payload['course_settings'], self.course_settings)
+        self.assertEqual(get_outbox_backlog(), 1)
+
+    def test_relay_delivers_events(self):
+        """Pending events are delivered to their controller."""
+        event = self._add_event()
+        self._add_event(email='other@example.com')
+
+        summary = relay_outbox_events(batch_size=10)
+
+        self.assertEqual(summary[EnrollmentOutboxEvent.DELIVERED], 2)
+        self.assertEqual(summary['backlog'], 0)
+        self.controller_mock.run_enrollment.assert_any_call(event.payload['data'], self.course_settings)
+        self.factory_mock.get_enrollment_controller.assert_called_once_with(controller='icc')
+        event.refresh_from_db()
+        self.assertEqual(event.status, EnrollmentOutboxEvent.DELIVERED)
+        self.assertIsNotNone(event.processed_at)
+
+    def test_relay_delivers_controller_events_together(self):
+        """The events of a controller are delivered with a single run_enrollments call."""
+        first_event = self._add_event()
+        second_event = self._add_event(email='other@example.com')
+
+        relay_outbox_events(batch_size=10)
+
+        self.controller_mock.run_enrollments.assert_called_once_with([
+            (first_event.payload['data'], self.course_settings),
+            (second_event.payload['data'], self.course_settings),
+        ])
+
+    def test_relay_batch_size(self):
+        """Only batch_size events are processed per run."""
+        self._add_event()
+        self._add_event(email='other@example.com')
+
+        summary = relay_outbox_events(batch_size=1)
+
+        self.assertEqual(summary[EnrollmentOutboxEvent.DELIVERED], 1)
+        self.assertEqual(summary['backlog'], 1)
+
+    def test_relay_coalesces_events(self):
+        """An enroll followed by an unenroll of the same learner only delivers the unenroll."""
+        enroll_event = self._add_event(is_active=True)
+        unenroll_event = self._add_event(is_active=False)
+
+        summary = relay_outbox_events(batch_size=10)
+
+        self.assertEqual(summary[EnrollmentOutboxEvent.COALESCED], 1)
+        self.assertEqual(summary[EnrollmentOutboxEvent.DELIVERED], 1)
+        self.controller_mock.run_enrollment.assert_called_once_with(
+            unenroll_event.payload['data'],
+            self.course_settings,
+        )
+        enroll_event.refresh_from_db()
+        self.assertEqual(enroll_event.status, EnrollmentOutboxEvent.COALESCED)
+
+    def test_relay_without_coalescing(self):
+        """Controllers that export every event don't coalesce them, they are delivered one by one in order."""
+        self.controller_mock.COALESCE_OUTBOX_EVENTS = False
+        enroll_event = self._add_event(is_active=True)
+        unenroll_event = self._add_event(is_active=False)
+
+        summary = relay_outbox_events(batch_size=10)
+
+        self.assertEqual(summary[EnrollmentOutboxEvent.DELIVERED], 1)
+        self.assertEqual(summary['blocked'], 1)
+        self.controller_mock.run_enrollment.assert_called_once_with(
+            enroll_event.payload['data'],
+            self.course_settings,
+        )
+
+        summary = relay_outbox_events(batch_size=10)
+
+        self.assertEqual(summary[EnrollmentOutboxEvent.DELIVERED], 1)
+        self.assertEqual(summary['backlog'], 0)
+        self.controller_mock.run_enrollment.assert_called_with(unenroll_event.payload['data'], self.course_settings)
+
+    def test_relay_without_coalescing_blocked_by_failed_event(self):
+        """Events of controllers that don't coalesce them wait until the previous failed event is delivered."""
+        self.controller_mock.COALESCE_OUTBOX_EVENTS = False
+        self.controller_mock.get_retry_policy.return_value = {'max_retries': 3, 'countdown': 60}
+        failed_event = self._add_event(is_active=True)
+        self.controller_mock.run_enrollment.return_value = 'error', False
+
+        relay_outbox_events(batch_size=10)
+
+        self.controller_mock.run_enrollment.return_value = {'id': 1}, True
+        blocked_event = self._add_event(is_active=False)
+        other_event = self._add_event(email='other@example.com')
+
+        summary = relay_outbox_events(batch_size=10)
+
+        self.assertEqual(summary[EnrollmentOutboxEvent.DELIVERED], 1)
+        self.assertEqual(summary['blocked'], 1)
+        self.controller_mock.run_enrollment.assert_called_with(other_event.payload['data'], self.course_settings)
+        failed_event.refresh_from_db()
+        blocked_event.refresh_from_db()
+        self.assertEqual(blocked_event.status, EnrollmentOutboxEvent.PENDING)
+        self.assertEqual(blocked_event.next_attempt_at, failed_event.next_attempt_at)
+        self.assertIsNone(blocked_event.claim_id)
+
+    def test_relay_failed_events(self):
+        """Failed events stay pending until they exceed the controller max_retries."""
+        event = self._add_event()
+        self.controller_mock.run_enrollment.return_value = 'error', False
+
+        summary = relay_outbox_events(batch_size=10)
+
+        self.assertEqual(summary['retried'], 1)
+        event.refresh_from_db()
+        self.assertEqual(event.status, EnrollmentOutboxEvent.PENDING)
+        self.assertEqual(event.attempts, 1)
+
+        # The event is not retried before its next attempt.
+        summary = relay_outbox_events(batch_size=10)
+
+        self.assertEqual(summary['retried'], 0)
+        self.assertEqual(summary['backlog'], 1)
+
+        EnrollmentOutboxEvent.objects.filter(id=event.id).update(  # pylint: disable=no-member
+            next_attempt_at=timezone.now(),
+        )
+        summary = relay_outbox_events(batch_size=10)
+
+        self.assertEqual(summary[EnrollmentOutboxEvent.FAILED], 1)
+        event.refresh_from_db()
+        self.assertEqual(event.status, EnrollmentOutboxEvent.FAILED)
+
+    def test_relay_retry_delay(self):
+        """The delay before the next attempt of a failed event doubles with every attempt."""
+        self.controller_mock.get_retry_policy.return_value = {'max_retries': 3, 'countdown': 60}
+        self.controller_mock.run_enrollment.return_value = 'error', False
+        event = self._add_event()
+        delays = []
+
+        for _ in range(3):
+            EnrollmentOutboxEvent.objects.filter(id=event.id).update(next_attempt_at=None)  # pylint: disable=no-member
+            now = timezone.now()
+            relay_outbox_events(batch_size=10)
+            event.refresh_from_db()
+            delays.append(round((event.next_attempt_at - now).total_seconds()))
+
+        self.assertEqual(delays, [60, 120, 240])
+
+    def test_relay_unknown_controller(self):
+        """Events of a controller that doesn't exist are marked as failed."""
+        self.factory_mock.get_enrollment_controller.side_effect = NotImplementedError
+        event = self._add_event(controller_name='unknown')
+
+        summary = relay_outbox_events(batch_size=10)
+
+        self.assertEqual(summary[EnrollmentOutboxEvent.FAILED], 1)
+        event.refresh_from_db()
+        self.assertEqual(event.status, EnrollmentOutboxEvent.FAILED)
+
+    def test_relay_delivers_events_with_their_site_configuration(self):
+        """The events are delivered with the site configuration read when they were stored."""
+        self._add_event(site_configuration={'ICC_AUTH_METHOD_OVERRIDE': 'saml2'})
+        self._add_event(email='other@example.com', site_configuration={'ICC_AUTH_METHOD_OVERRIDE': 'manual'})
+        self._add_event(email='third@example.com', site_configuration={'ICC_AUTH_METHOD_OVERRIDE': 'saml2'})
+
+        relay_outbox_events(batch_size=10)
+
+        self.assertEqual(self.controller_mock.run_enrollments.call_count, 2)
+        self.assertEqual(
+            [call[0][0] for call in self.controller_mock.set_site_configuration.call_args_list],
+            [{'ICC_AUTH_METHOD_OVERRIDE': 'saml2'}, {'ICC_AUTH_METHOD_OVERRIDE': 'manual'}],
+        )
+        self.assertEqual(len(self.controller_mock.run_enrollments.call_args_list[0][0][0]), 2)
+
+    def test_relay_skips_claimed_events(self):
+        """Events claimed by another relay run are skipped until their claim expires."""
+        event = self._add_event()
+        other_event = self._add_event(email='other@example.com')
+        EnrollmentOutboxEvent.objects.filter(id=event.id).update(  # pylint: disable=no-member
+            claim_id=uuid4(),
+            claimed_until=timezone.now() + timedelta(minutes=5),
+        )
+        EnrollmentOutboxEvent.objects.filter(id=other_event.id).update(  # pylint: disable=no-member
+            claim_id=uuid4(),
+            claimed_until=timezone.now() - timedelta(minutes=5),
+        )
+
+        summary = relay_outbox_events(batch_size=10)
+
+        self.assertEqual(summary[EnrollmentOutboxEvent.DELIVERED], 1)
+        self.assertEqual(summary['backlog'], 1)
+        self.controller_mock.run_enrollment.assert_called_once_with(other_event.payload['data'], self.course_settings)
+        other_event.refresh_from_db()
+        self.assertEqual(other_event.status, EnrollmentOutboxEvent.DELIVERED)
+        self.assertIsNone(other_event.claim_id)
+        self.assertIsNone(other_event.claimed_until)
+
+    def test_relay_releases_retried_events(self):
+        """Failed events are released, so the next relay run retries them."""
+        event = self._add_event()
+        self.controller_mock.run_enrollment.return_value = 'error', False
+
+        relay_outbox_events(batch_size=10)
+
+        event.refresh_from_db()
+        self.assertEqual(event.status, EnrollmentOutboxEvent.PENDING)
+        self.assertIsNone(event.claim_id)
+        self.assertIsNone(event.claimed_until)
+
+    def test_relay_keeps_events_claimed_by_another_run(self):
+        """The result is not saved when the claim expired and another relay run took the event."""
+        event = self._add_event()
+
+        def run_enrollment(data, course_settings):  # pylint: disable=unused-argument
+            EnrollmentOutboxEvent.objects.filter(id=event.id).update(claim_id=uuid4())  # pylint: disable=no-member
+            return {'id': 1}, True
+
+        self.controller_mock.run_enrollment.side_effect = run_enrollment
+
+        relay_outbox_events(batch_size=10)
+
+        event.refresh_from_db()
+        self.assertEqual(event.status, EnrollmentOutboxEvent.PENDING)
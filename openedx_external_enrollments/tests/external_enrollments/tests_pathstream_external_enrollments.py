@@ -1,21 +1,30 @@
 """Tests PathstreamExternalEnrollment class file"""
+import base64
+import hashlib
 import io
+import json
 import logging
+from datetime import timedelta
 
 import boto3
 import botocore
 import ddt
 from botocore.exceptions import ClientError
+from django.core.cache import cache
 from django.db.utils import IntegrityError
-from django.test import TestCase
-from mock import MagicMock, Mock, call, patch
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from mock import ANY, MagicMock, Mock, call, patch
 from opaque_keys.edx.keys import CourseKey
 from testfixtures import LogCapture
 
 from openedx_external_enrollments.external_enrollments.pathstream_external_enrollment import (
+    COMPACTION_LOCK_CACHE_KEY,
     PathstreamExternalEnrollment,
     PathstreamTaskExecutionError,
 )
+from openedx_external_enrollments.models import ExternalEnrollment, ExternalEnrollmentEvent
+from openedx_external_enrollments.tests.tests_backends import CourseOverview
 
 
 @ddt.ddt
@@ -54,101 +63,36 @@ class PathstreamExternalEnrollmentTest(TestCase):
         )
         self.assertIsInstance(self.base.client, botocore.client.BaseClient)
 
-    def test_download_file(self):
-        """
-        _download_file must return the downloaded content from the S3 file if called with all parameters and the
-        s3 connection is established.
-        """
-        s3_file = 'test.log'
-        s3_bucket = 'test'
-        expected_file_content = 'file_content_test'
-        self.base.client = Mock(spec=boto3.client('s3'))
-        self.base.client.get_object.return_value = {
-            'Body': io.StringIO(expected_file_content),
-            'ResponseMetadata': {
-                'HTTPStatusCode': 200,
-            },
-        }
-        log = 'File content [{}] was downloaded from S3 for [{}]'.format(s3_file, self.base.__str__())
-
-        with LogCapture(level=logging.INFO) as log_capture:
-            file_content = self.base._download_file()  # pylint: disable=protected-access
-
-            log_capture.check(
-                (self.module, 'INFO', log),
-            )
-
-        self.base.client.get_object.assert_called_with(
-            Bucket=s3_bucket,
-            Key=s3_file,
-        )
-        self.assertEqual(file_content, expected_file_content)
-
-    def test_download_file_error(self):
-        """If no connection, credentials or wrong parameter values
-        _download_file should handle ClientError and raise PathstreamTaskExecutionError."""
-        code = '400'
-        message = 'Failed'
-        operation = 'get_object'
-        clienterror_msg = 'An error occurred ({}) when calling the {} operation: {}'.format(
-            code,
-            operation,
-            message,
-        )
-        self.base.client = Mock(spec=boto3.client('s3'))
-        self.base.client.get_object.side_effect = ClientError(
-            {
-                'Error': {
-                    'Code': code,
-                    'Message': message,
-                },
-            },
-            operation,
-        )
-
-        with self.assertRaisesMessage(PathstreamTaskExecutionError, clienterror_msg):
-            self.base._download_file()  # pylint: disable=protected-access
-
     def test_prepare_new_content(self):
-        """This test validates that _prepare_new_content accomplish
-        its task of sorting and encoding."""
+        """This test validates that _prepare_new_content encodes the content keeping its order."""
         enrollment_data_1 = 'course_T1,username,fullname,fname,lname,1@mail,2021-06-29 16:50:00.456900,true\n'
         enrollment_data_2 = 'course_T2,username,fullname,fname,lname,2@mail,2021-06-29 16:51:00.456900,true\n'
-        enrollment_data_3 = 'course_T2,username,fullname,fname,lname,2@mail,2021-06-29 16:52:00.456900,false\n'
-        enrollment_data_4 = 'course_T1,username,fullname,fname,lname,1@mail,2021-06-29 16:53:00.456900,false\n'
         content = [
             enrollment_data_1,
-            enrollment_data_4,
             enrollment_data_2,
-            enrollment_data_3,
         ]
-        expected_result = (
-            enrollment_data_1.encode() +
-            enrollment_data_2.encode() +
-            enrollment_data_3.encode() +
-            enrollment_data_4.encode()
-        )
+        expected_result = enrollment_data_1.encode() + enrollment_data_2.encode()
 
         result = self.base._prepare_new_content(content)  # pylint: disable=protected-access
 
         self.assertEqual(result, expected_result)
 
-    def test_prepare_new_content_error(self):
-        """This test validates that _prepare_new_content raises
-        PathstreamTaskExecutionError when called with invalid data.
-        The 'content' variable will raise an Index error, after applying
-        the split function to it and accessing to a non existing index."""
-        content = [
-            'course_T1,username,fullname,fname,lname,1@mail,2021-06-29 16:53:00.456900,false\n',
-            'invalid_data\n',
-        ]
-        error_tuple = (
-            '_prepare_new_content',
-            'An enrollment data is invalid. Reason: {} \nNew data: {}'.format('list index out of range', content),
+    @ddt.data(
+        ('course,email,uname,fullname,,,2021-07-09 16:53:41.492901,true\n', True),
+        ('course,email,uname,full,name,,,2021-07-09 16:53:41.492901,true\n', False),
+        ('course,email,uname,"Smith, Jr.",,,2021-07-09 16:53:41.492901,true\n', True),
+        ('course,email,uname,"Smith, Jr.,,,2021-07-09 16:53:41.492901,true\n', False),
+        ('course,email,uname,fullname,,,2021-07-09 16:53:41.492901,true', False),
+        ('invalid_data\n', False),
+    )
+    @ddt.unpack
+    def test_is_valid_enrollment_data(self, data, expected_result):
+        """Only complete lines with the expected number of fields can be exported."""
+        self.assertEqual(
+            self.base._is_valid_enrollment_data(data, timezone.now()),  # pylint: disable=protected-access
+            expected_result,
         )
-
-        with self.assertRaisesMessage(PathstreamTaskExecutionError, str(error_tuple)):
-            self.base._prepare_new_content(content)  # pylint: disable=protected-access
+        self.assertFalse(self.base._is_valid_enrollment_data(data, None))  # pylint: disable=protected-access
 
     @patch('openedx_external_enrollments.external_enrollments.pathstream_external_enrollment.base64')
     @patch('openedx_external_enrollments.external_enrollments.pathstream_external_enrollment.hashlib')
@@ -228,99 +172,60 @@ class PathstreamExternalEnrollmentTest(TestCase):
             self.base._upload_file(b'content')  # pylint: disable=protected-access
 
     @patch.object(PathstreamExternalEnrollment, '_init_s3')
-    @patch.object(PathstreamExternalEnrollment, '_download_file')
-    @patch.object(PathstreamExternalEnrollment, '_prepare_new_content')
+    @patch.object(PathstreamExternalEnrollment, '_compact_parts')
     @patch.object(PathstreamExternalEnrollment, '_upload_file')
-    @patch(
-        'openedx_external_enrollments.external_enrollments.pathstream_external_enrollment.ExternalEnrollment',
-        )
-    def test_successful_execute_upload_with_data(
-            self, model_mock, upload_mock, prepare_mock, download_mock, init_s3_mock):
-        """Testing _execute_upload with data and a successfull proccess of
-        downloading, updating, uploading.
-
-        'is_uploaded' value must change from False to True.
+    @patch.object(PathstreamExternalEnrollment, '_get_part_key')
+    @patch.object(PathstreamExternalEnrollment, '_mark_events_as_uploaded')
+    @patch.object(PathstreamExternalEnrollment, '_get_pending_events_batches')
+    def test_successful_execute_upload_with_data(  # pylint: disable=too-many-arguments
+            self, batches_mock, mark_mock, part_key_mock, upload_mock, compact_mock, init_s3_mock):
+        """Testing _execute_upload with data and a successfull proccess of uploading and merging.
+
+        Every batch is uploaded as a part and marked as uploaded, then the parts are merged into the S3 file.
         """
         self.base.client = Mock(spec=boto3.client('s3'))
         enrollment_data1 = 'course1,email,username,fullname,fname,lname,2021-07-09 16:53:41.492901,true\n'
         enrollment_data2 = 'course1,email,username,fullname,fname,lname,2021-07-20 16:53:41.492901,false\n'
-        enrollment_data3 = 'course1,email,username,fullname,fname,lname,2021-07-01 16:53:41.492901,true\n'
         enrollment_data4 = 'course1,email,username,fullname,fname,lname,2021-07-10 16:53:41.492901,false\n'
-        qs = [
-            Mock(
-                controller_name='pathstream',
-                email='test1@gmail.com',
-                meta=[
-                    {
-                        'is_uploaded': False,
-                        'enrollment_data_formated': enrollment_data1,
-                    },
-                    {
-                        'is_uploaded': False,
-                        'enrollment_data_formated': enrollment_data2,
-                    },
-                ],
-            ),
-            Mock(
-                controller_name='pathstream',
-                email='test2@gmail.com',
-                meta=[
-                    {
-                        'is_uploaded': True,
-                        'enrollment_data_formated': enrollment_data3,
-                    },
-                    {
-                        'is_uploaded': False,
-                        'enrollment_data_formated': enrollment_data4,
-                    },
-                ],
-            ),
-        ]
-        model_mock.objects.filter.return_value = qs
-        file_content = b'course,email,username,fullname,fname,lname,2021-07-08 10:50:41.492901,true\n'
-        download_mock.return_value = file_content
-        new_content = enrollment_data1.encode() + enrollment_data4.encode() + enrollment_data2.encode()
-        prepare_mock.return_value = new_content
-        new_file_content = file_content + new_content
+        batches_mock.return_value = iter([
+            [(1, enrollment_data1, timezone.now()), (4, enrollment_data4, timezone.now())],
+            [(2, enrollment_data2, timezone.now())],
+        ])
+        part_key_mock.side_effect = ['test_parts/part1.log', 'test_parts/part2.log']
+        parent_mock = MagicMock()  # Used to record calls.
+        parent_mock.attach_mock(upload_mock, 'upload_mock')
+        parent_mock.attach_mock(mark_mock, 'mark_mock')
+        parent_mock.attach_mock(compact_mock, 'compact_mock')
 
         result = self.base.execute_upload()
 
-        model_mock.objects.filter.assert_called_with(
-            controller_name='pathstream',
-            meta__icontains='"is_uploaded":false',
-        )
         init_s3_mock.assert_called_once()
-        download_mock.assert_called_once()
-        prepare_mock.assert_called_once_with(
+        self.assertEqual(
+            parent_mock.mock_calls,
             [
-                enrollment_data1,
-                enrollment_data2,
-                enrollment_data4,
+                call.upload_mock((enrollment_data1 + enrollment_data4).encode(), key='test_parts/part1.log'),
+                call.mark_mock([1, 4]),
+                call.upload_mock(enrollment_data2.encode(), key='test_parts/part2.log'),
+                call.mark_mock([2]),
+                call.compact_mock(),
             ],
         )
-        upload_mock.assert_called_once_with(new_file_content)
-        model_mock.objects.bulk_update.assert_called_with(qs, ['meta'])
-        self.assertEqual(qs[0].meta[0]['is_uploaded'], True)
-        self.assertEqual(qs[0].meta[1]['is_uploaded'], True)
-        self.assertEqual(qs[1].meta[1]['is_uploaded'], True)
-        self.assertEqual(result[0], True)
-        self.assertEqual(result[1], 'execute_upload completed')
+        self.assertEqual(result, (True, 'execute_upload completed'))
 
     @patch.object(PathstreamExternalEnrollment, '_init_s3')
-    @patch.object(PathstreamExternalEnrollment, '_download_file')
+    @patch.object(PathstreamExternalEnrollment, '_compact_parts')
     @patch.object(PathstreamExternalEnrollment, '_prepare_new_content')
     @patch.object(PathstreamExternalEnrollment, '_upload_file')
-    @patch(
-        'openedx_external_enrollments.external_enrollments.pathstream_external_enrollment.ExternalEnrollment',
-        )
-    def test_successful_execute_upload_without_data(
-            self, model_mock, upload_mock, prepare_mock, download_mock, init_s3_mock):
+    @patch.object(PathstreamExternalEnrollment, '_mark_events_as_uploaded')
+    @patch.object(PathstreamExternalEnrollment, '_get_pending_events_batches')
+    def test_successful_execute_upload_without_data(  # pylint: disable=too-many-arguments
+            self, batches_mock, mark_mock, upload_mock, prepare_mock, compact_mock, init_s3_mock):
         """Testing _execute_upload without data, In this case the method
         must not call any other method.
 
-        Does not have to update any ExternalEnrollment meta
+        Does not have to update any ExternalEnrollmentEvent
         """
-        model_mock.objects.filter.return_value = []
+        batches_mock.return_value = iter([])
         log = 'There are no new enrollments to update the S3 file.'
 
         with LogCapture(level=logging.INFO) as log_capture:
@@ -331,39 +236,29 @@ class PathstreamExternalEnrollmentTest(TestCase):
             )
 
         init_s3_mock.assert_not_called()
-        download_mock.assert_not_called()
         prepare_mock.assert_not_called()
         upload_mock.assert_not_called()
-        model_mock.objects.bulk_update.assert_not_called()
+        mark_mock.assert_not_called()
+        compact_mock.assert_not_called()
         self.assertEqual(result[0], True)
         self.assertEqual(result[1], 'execute_upload completed')
 
     @patch.object(PathstreamExternalEnrollment, '_init_s3')
-    @patch.object(PathstreamExternalEnrollment, '_download_file')
-    @patch.object(PathstreamExternalEnrollment, '_prepare_new_content')
+    @patch.object(PathstreamExternalEnrollment, '_compact_parts')
     @patch.object(PathstreamExternalEnrollment, '_upload_file')
-    @patch(
-        'openedx_external_enrollments.external_enrollments.pathstream_external_enrollment.ExternalEnrollment',
-        )
-    def test_failed_execute_upload(self, model_mock, upload_mock, prepare_mock, download_mock, init_s3_mock):
+    @patch.object(PathstreamExternalEnrollment, '_mark_events_as_uploaded')
+    @patch.object(PathstreamExternalEnrollment, '_get_pending_events_batches')
+    def test_failed_execute_upload(  # pylint: disable=too-many-arguments
+            self, batches_mock, mark_mock, upload_mock, compact_mock, init_s3_mock):
         """When any of the methods related to S3 file management fails, it must raise an PathstreamTaskExecutionError
         which should be capture by _execute_upload in order to log the error."""
         self.base.client = Mock(spec=boto3.client('s3'))
-        model_mock.objects.filter.return_value = [
-            Mock(
-                controller_name='pathstream',
-                email='test1@gmail.com',
-                meta=[
-                    {
-                        'is_uploaded': False,
-                        'enrollment_data_formated': 'course,email,uname,fullname,,,2021-07-09 16:53:41.492901,true\n',
-                    },
-                ],
-            ),
-        ]
-        error_operation_msg = ('_download_file', 'error.')
+        batches_mock.return_value = iter([
+            [(1, 'course,email,uname,fullname,,,2021-07-09 16:53:41.492901,true\n', timezone.now())],
+        ])
+        error_operation_msg = ('_upload_file', 'error.')
         log = 'The proccess to update the remote S3 file has failed. Reason: ' + str(error_operation_msg)
-        download_mock.side_effect = PathstreamTaskExecutionError(error_operation_msg[0], error_operation_msg[1])
+        upload_mock.side_effect = PathstreamTaskExecutionError(error_operation_msg[0], error_operation_msg[1])
 
         with LogCapture(level=logging.ERROR) as log_capture:
             result = self.base.execute_upload()
@@ -373,35 +268,24 @@ class PathstreamExternalEnrollmentTest(TestCase):
             )
 
         init_s3_mock.assert_called()
-        prepare_mock.assert_not_called()
-        upload_mock.assert_not_called()
-        model_mock.objects.bulk_update.assert_not_called()
+        mark_mock.assert_not_called()
+        compact_mock.assert_not_called()
         self.assertEqual(result[0], False)
         self.assertEqual(result[1], str(error_operation_msg))
 
     @patch.object(PathstreamExternalEnrollment, '_init_s3')
-    @patch.object(PathstreamExternalEnrollment, '_download_file')
+    @patch.object(PathstreamExternalEnrollment, '_compact_parts')
     @patch.object(PathstreamExternalEnrollment, '_prepare_new_content')
     @patch.object(PathstreamExternalEnrollment, '_upload_file')
-    @patch(
-        'openedx_external_enrollments.external_enrollments.pathstream_external_enrollment.ExternalEnrollment',
-        )
-    def test_execute_upload_init_s3_failed(
-            self, model_mock, upload_mock, prepare_mock, download_mock, init_s3_mock):
+    @patch.object(PathstreamExternalEnrollment, '_mark_events_as_uploaded')
+    @patch.object(PathstreamExternalEnrollment, '_get_pending_events_batches')
+    def test_execute_upload_init_s3_failed(  # pylint: disable=too-many-arguments
+            self, batches_mock, mark_mock, upload_mock, prepare_mock, compact_mock, init_s3_mock):
         """This test checks that if _init_s3 is called but it does not define self.client as a BaseClient instance,
         then execute_upload must log an error and return the tuple (False, "error_message")."""
-        model_mock.objects.filter.return_value = [
-            Mock(
-                controller_name='pathstream',
-                email='test1@gmail.com',
-                meta=[
-                    {
-                        'is_uploaded': False,
-                        'enrollment_data_formated': 'course,email,uname,fullname,,,2021-07-09 16:53:41.492901,true\n',
-                    },
-                ],
-            ),
-        ]
+        batches_mock.return_value = iter([
+            [(1, 'course,email,uname,fullname,,,2021-07-09 16:53:41.492901,true\n', timezone.now())],
+        ])
         log = '_init_s3 has not been called yet or failed.'
 
         with LogCapture(level=logging.ERROR) as log_capture:
@@ -416,58 +300,457 @@ class PathstreamExternalEnrollmentTest(TestCase):
         self.assertEqual(result[1], log)
         prepare_mock.assert_not_called()
         upload_mock.assert_not_called()
-        download_mock.assert_not_called()
-        model_mock.objects.bulk_update.assert_not_called()
+        compact_mock.assert_not_called()
+        mark_mock.assert_not_called()
 
     @patch.object(PathstreamExternalEnrollment, '_init_s3')
-    @patch.object(PathstreamExternalEnrollment, '_download_file')
-    @patch.object(PathstreamExternalEnrollment, '_prepare_new_content')
+    @patch.object(PathstreamExternalEnrollment, '_compact_parts')
     @patch.object(PathstreamExternalEnrollment, '_upload_file')
-    @patch(
-        'openedx_external_enrollments.external_enrollments.pathstream_external_enrollment.ExternalEnrollment',
-        )
-    def test_execute_upload_calling_methods_in_order(
-            self, model_mock, upload_mock, prepare_mock, download_mock, init_s3_mock):
-        """This test validates that execute_upload calls the following methods strictly in this order:
-            1. _init_s3
-            2. _download_file
-            3. _prepare_new_content
-            4. _upload_file
-            5. ExternalEnrollment.objects.bulk_update
+    @patch.object(PathstreamExternalEnrollment, '_get_part_key', Mock(return_value='test_parts/part1.log'))
+    def test_execute_upload_with_failed_compaction(self, upload_mock, compact_mock, init_s3_mock):
+        """The uploaded batches stay marked as uploaded when their parts can't be merged, they are merged later."""
+        self.base.client = Mock(spec=boto3.client('s3'))
+        course = CourseOverview.objects.create()  # pylint: disable=no-member
+        enrollment = ExternalEnrollment.objects.create(  # pylint: disable=no-member
+            controller_name='pathstream',
+            course_shell=course,
+            email=self.user_email,
+            meta=[],
+        )
+        event = ExternalEnrollmentEvent.objects.create(  # pylint: disable=no-member
+            enrollment=enrollment,
+            data='course,email,uname,fullname,,,2021-07-09 16:53:41.492901,true\n',
+            event_time=timezone.now(),
+        )
+        compact_mock.side_effect = ClientError({'Error': {'Code': '503'}}, 'UploadPartCopy')
+
+        is_completed, _ = self.base.execute_upload()
+
+        self.assertFalse(is_completed)
+        init_s3_mock.assert_called_once()
+        upload_mock.assert_called_once_with(event.data.encode(), key='test_parts/part1.log')
+        event.refresh_from_db()
+        self.assertIsNotNone(event.uploaded_at)
+
+    def test_execute_upload_marks_pending_events(self):
         """
+        Only the pending events of the controller are uploaded, in the order of their event_time, and then
+        marked as uploaded. Malformed events are quarantined.
+        """
+        course = CourseOverview.objects.create()  # pylint: disable=no-member
+        enrollment = ExternalEnrollment.objects.create(  # pylint: disable=no-member
+            controller_name='pathstream',
+            course_shell=course,
+            email=self.user_email,
+            meta=[],
+        )
+        other_enrollment = ExternalEnrollment.objects.create(  # pylint: disable=no-member
+            controller_name='other',
+            course_shell=course,
+            email=self.user_email,
+            meta=[],
+        )
+        uploaded_event = ExternalEnrollmentEvent.objects.create(  # pylint: disable=no-member
+            enrollment=enrollment,
+            data='course,email,uname,fullname,,,2021-07-09 16:53:41.492901,true\n',
+            event_time=timezone.now(),
+            uploaded_at=timezone.now(),
+        )
+        later_event = ExternalEnrollmentEvent.objects.create(  # pylint: disable=no-member
+            enrollment=enrollment,
+            data='course,email,uname,fullname,,,2021-07-10 16:53:41.492901,true\n',
+            event_time=timezone.now() + timedelta(days=1),
+        )
+        pending_event = ExternalEnrollmentEvent.objects.create(  # pylint: disable=no-member
+            enrollment=enrollment,
+            data='course,email,uname,fullname,,,2021-07-09 16:53:41.492901,true\n',
+            event_time=timezone.now(),
+        )
+        malformed_event = ExternalEnrollmentEvent.objects.create(  # pylint: disable=no-member
+            enrollment=enrollment,
+            data='course,email,uname,full,name,,,2021-07-09 16:53:41.492901,true\n',
+            event_time=timezone.now(),
+        )
+        ExternalEnrollmentEvent.objects.create(  # pylint: disable=no-member
+            enrollment=other_enrollment,
+            data='course,email,uname,fullname,,,2021-07-09 16:53:41.492901,true\n',
+            event_time=timezone.now(),
+        )
         self.base.client = Mock(spec=boto3.client('s3'))
-        file_content = b'filecontent\n'
-        new_content = b'course1,email,uname,fullname,,,2021-07-09 16:53:41.492901,true\n'
-        download_mock.return_value = file_content
-        prepare_mock.return_value = new_content
+
+        with patch.object(PathstreamExternalEnrollment, '_init_s3'), \
+                patch.object(PathstreamExternalEnrollment, '_prepare_new_content', return_value=b'') as prepare_mock, \
+                patch.object(PathstreamExternalEnrollment, '_upload_file'), \
+                patch.object(PathstreamExternalEnrollment, '_compact_parts'):
+            self.base.execute_upload()
+
+        prepare_mock.assert_called_once_with([pending_event.data, later_event.data])
+        pending_event.refresh_from_db()
+        self.assertIsNotNone(pending_event.uploaded_at)
+        malformed_event.refresh_from_db()
+        self.assertIsNone(malformed_event.uploaded_at)
+        self.assertIsNotNone(malformed_event.quarantined_at)
+        uploaded_events = ExternalEnrollmentEvent.objects.filter(  # pylint: disable=no-member
+            uploaded_at=uploaded_event.uploaded_at,
+        )
+        self.assertEqual(uploaded_events.count(), 1)
+
+    @override_settings(OEE_PATHSTREAM_S3_APPEND_MODE=True)
+    @patch.object(PathstreamExternalEnrollment, '_init_s3')
+    @patch.object(PathstreamExternalEnrollment, '_compact_parts')
+    @patch.object(PathstreamExternalEnrollment, '_upload_file')
+    @patch.object(PathstreamExternalEnrollment, '_get_part_key')
+    @patch.object(PathstreamExternalEnrollment, '_mark_events_as_uploaded')
+    @patch.object(PathstreamExternalEnrollment, '_get_pending_events_batches')
+    def test_execute_upload_append_mode(  # pylint: disable=too-many-arguments
+            self, batches_mock, mark_mock, part_key_mock, upload_mock, compact_mock, init_s3_mock,
+    ):
+        """
+        In append mode every batch is uploaded as a new part and marked as uploaded right away,
+        and the parts are not merged into the S3 file. A failed batch doesn't undo the previous ones.
+        """
+        self.base.client = Mock(spec=boto3.client('s3'))
+        batches_mock.return_value = iter([
+            [(1, 'course,email,uname,fullname,,,2021-07-09 16:53:41.492901,true\n', timezone.now())],
+            [(2, 'course,email,uname,fullname,,,2021-07-10 16:53:41.492901,true\n', timezone.now())],
+        ])
+        part_key_mock.side_effect = ['test_parts/2020/01/01/part1.log', 'test_parts/2020/01/01/part2.log']
+        upload_mock.side_effect = [None, PathstreamTaskExecutionError('_upload_file', 'error.')]
         parent_mock = MagicMock()  # Used to record calls.
-        parent_mock.attach_mock(init_s3_mock, 'init_s3_mock')
-        parent_mock.attach_mock(download_mock, 'download_mock')
-        parent_mock.attach_mock(prepare_mock, 'prepare_mock')
         parent_mock.attach_mock(upload_mock, 'upload_mock')
-        parent_mock.attach_mock(model_mock.objects.bulk_update, 'bulk_update')
-        record = Mock(
+        parent_mock.attach_mock(mark_mock, 'mark_mock')
+
+        is_completed, _ = self.base.execute_upload()
+
+        self.assertFalse(is_completed)
+        init_s3_mock.assert_called_once()
+        compact_mock.assert_not_called()
+        self.assertEqual(
+            [name for name, _, _ in parent_mock.mock_calls],
+            ['upload_mock', 'mark_mock', 'upload_mock'],
+        )
+        upload_mock.assert_any_call(
+            b'course,email,uname,fullname,,,2021-07-09 16:53:41.492901,true\n',
+            key='test_parts/2020/01/01/part1.log',
+        )
+        mark_mock.assert_called_once_with([1])
+
+    @override_settings(OEE_PATHSTREAM_UPLOAD_BATCH_SIZE=2)
+    def test_get_pending_events_batches(self):
+        """The pending events are read in batches with keyset pagination, and the malformed ones are quarantined."""
+        course = CourseOverview.objects.create()  # pylint: disable=no-member
+        enrollment = ExternalEnrollment.objects.create(  # pylint: disable=no-member
             controller_name='pathstream',
-            email='test1@gmail.com',
-            meta=[
-                {
-                    'is_uploaded': False,
-                    'enrollment_data_formated': 'course1,email,uname,fullname,,,2021-07-09 16:53:41.492901,true\n',
-                },
+            course_shell=course,
+            email=self.user_email,
+            meta=[],
+        )
+        event_time = timezone.now()
+        data = 'course,email,uname,fullname,,,2021-07-09 16:53:41.492901,true\n'
+        events = [
+            ExternalEnrollmentEvent.objects.create(  # pylint: disable=no-member
+                enrollment=enrollment,
+                data=event_data,
+                event_time=time,
+            )
+            for event_data, time in [
+                (data, event_time + timedelta(seconds=1)),
+                (data, event_time),
+                ('malformed\n', event_time),
+                (data, event_time),
+                ('without_time\n', None),
+            ]
+        ]
+
+        batches = list(self.base._get_pending_events_batches())  # pylint: disable=protected-access
+
+        self.assertEqual(
+            [[event_id for event_id, _, _ in batch] for batch in batches],
+            [[events[1].id], [events[3].id, events[0].id]],
+        )
+        self.assertEqual(
+            ExternalEnrollmentEvent.objects.filter(  # pylint: disable=no-member
+                quarantined_at__isnull=False,
+            ).count(),
+            2,
+        )
+
+    def test_get_part_key(self):
+        """Part keys are placed under the parts prefix and partitioned by date."""
+        key = self.base._get_part_key()  # pylint: disable=protected-access
+
+        self.assertRegex(key, r'^test_parts/\d{4}/\d{2}/\d{2}/\d{12}-[0-9a-f]{32}\.log$')
+        self.assertNotEqual(key, self.base._get_part_key())  # pylint: disable=protected-access
+
+    def _get_compaction_client(self, objects, metadata=None):
+        """Return a S3 client mock that serves the given objects, and the metadata of the S3 file."""
+        client = Mock(spec=boto3.client('s3'))
+        parts = [
+            {'Key': key, 'Size': len(content)} for key, content in objects.items()
+            if key.startswith('test_parts/')
+        ]
+        client.get_paginator.return_value.paginate.return_value = [{'Contents': parts}]
+        client.upload_part.return_value = {'ETag': 'uploaded'}
+        client.upload_part_copy.return_value = {'CopyPartResult': {'ETag': 'copied'}}
+        metadata = {} if metadata is None else metadata
+
+        def create_multipart_upload(Metadata, **kwargs):  # pylint: disable=invalid-name,unused-argument
+            client.upload_metadata = Metadata
+            return {'UploadId': 'upload-id'}
+
+        def complete_multipart_upload(**kwargs):  # pylint: disable=unused-argument
+            metadata.clear()
+            metadata.update(client.upload_metadata)
+
+        def head_object(Key, **kwargs):  # pylint: disable=invalid-name,unused-argument
+            if Key not in objects:
+                raise ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+            return {'ContentLength': len(objects[Key]), 'Metadata': metadata if Key == 'test.log' else {}}
+
+        def get_object(Key, Range='bytes=0-', **kwargs):  # pylint: disable=invalid-name,unused-argument
+            if Key not in objects:
+                raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+            start, end = Range.replace('bytes=', '').split('-')
+            return {'Body': io.BytesIO(objects[Key][int(start):int(end) + 1 if end else None])}
+
+        def put_object(Key, Body, **kwargs):  # pylint: disable=invalid-name,unused-argument
+            objects[Key] = Body.encode()
+
+        def delete_object(Key, **kwargs):  # pylint: disable=invalid-name,unused-argument
+            objects.pop(Key, None)
+
+        client.create_multipart_upload.side_effect = create_multipart_upload
+        client.complete_multipart_upload.side_effect = complete_multipart_upload
+        client.head_object.side_effect = head_object
+        client.get_object.side_effect = get_object
+        client.put_object.side_effect = put_object
+        client.delete_object.side_effect = delete_object
+        client.delete_objects.return_value = {}
+
+        return client
+
+    @patch('openedx_external_enrollments.external_enrollments.pathstream_external_enrollment.S3_MIN_PART_SIZE', 4)
+    def test_compact_parts(self):
+        """
+        The S3 file and the parts are merged in order, big sources are copied inside S3,
+        small ones are buffered, and the parts are deleted afterwards.
+        """
+        objects = {
+            'test.log': b'123456',
+            'test_parts/2020/01/02/b.log': b'cd',
+            'test_parts/2020/01/01/a.log': b'ab',
+            'test_parts/2020/01/03/c.log': b'efghij',
+        }
+        client = self._get_compaction_client(objects)
+
+        with patch.object(PathstreamExternalEnrollment, '_init_s3'):
+            self.base.client = client
+            result = self.base.compact_parts()
+
+        self.assertEqual(result, (True, 'compact_parts completed'))
+        copied_ranges = [
+            (kwargs['CopySource']['Key'], kwargs['CopySourceRange'])
+            for _, kwargs in client.upload_part_copy.call_args_list
+        ]
+        self.assertEqual(copied_ranges, [('test.log', 'bytes=0-5'), ('test_parts/2020/01/03/c.log', 'bytes=0-5')])
+        uploaded_bodies = [kwargs['Body'] for _, kwargs in client.upload_part.call_args_list]
+        self.assertEqual(uploaded_bodies, [b'abcd'])
+        self.assertEqual(
+            [part['PartNumber'] for part in client.complete_multipart_upload.call_args[1]['MultipartUpload']['Parts']],
+            [1, 2, 3],
+        )
+        self.assertEqual(
+            client.create_multipart_upload.call_args[1]['Metadata'],
+            {'content-md5': base64.b64encode(hashlib.md5(b'123456abcdefghij').digest()).decode()},
+        )
+        client.delete_objects.assert_called_once_with(
+            Bucket='test',
+            Delete={
+                'Objects': [
+                    {'Key': 'test_parts/2020/01/01/a.log'},
+                    {'Key': 'test_parts/2020/01/02/b.log'},
+                    {'Key': 'test_parts/2020/01/03/c.log'},
+                ],
+                'Quiet': True,
+            },
+        )
+
+    @patch('openedx_external_enrollments.external_enrollments.pathstream_external_enrollment.S3_MAX_PART_SIZE', 5)
+    @patch('openedx_external_enrollments.external_enrollments.pathstream_external_enrollment.S3_MIN_PART_SIZE', 4)
+    def test_compact_parts_with_big_s3_file(self):
+        """Sources bigger than S3_MAX_PART_SIZE are copied in several ranges."""
+        client = self._get_compaction_client({'test.log': b'0123456789a', 'test_parts/a.log': b'bcdef'})
+
+        with patch.object(PathstreamExternalEnrollment, '_init_s3'):
+            self.base.client = client
+            self.assertEqual(self.base.compact_parts(), (True, 'compact_parts completed'))
+
+        self.assertEqual(
+            [
+                (kwargs['CopySource']['Key'], kwargs['CopySourceRange'], kwargs['PartNumber'])
+                for _, kwargs in client.upload_part_copy.call_args_list
+            ],
+            [
+                ('test.log', 'bytes=0-3', 1),
+                ('test.log', 'bytes=4-7', 2),
+                ('test.log', 'bytes=8-10', 3),
+                ('test_parts/a.log', 'bytes=0-4', 4),
             ],
         )
-        model_mock.objects.filter.return_value = [record]
-        expected_order_calls = [
-            call.init_s3_mock(),
-            call.download_mock(),
-            call.prepare_mock(['course1,email,uname,fullname,,,2021-07-09 16:53:41.492901,true\n']),
-            call.upload_mock(file_content + new_content),
-            call.bulk_update([record], ['meta']),
+
+    @patch('openedx_external_enrollments.external_enrollments.pathstream_external_enrollment.S3_MIN_PART_SIZE', 4)
+    def test_compact_parts_with_undeleted_parts(self):
+        """Parts that S3 fails to delete are not merged again, the next run only retries their deletion."""
+        objects = {
+            'test.log': b'123456',
+            'test_parts/a.log': b'ab',
+            'test_parts/b.log': b'cd',
+        }
+        client = self._get_compaction_client(objects)
+        client.delete_objects.return_value = {
+            'Errors': [{'Key': 'test_parts/b.log', 'Code': 'InternalError', 'Message': 'Internal error'}],
+        }
+
+        with patch.object(PathstreamExternalEnrollment, '_init_s3'), LogCapture(level=logging.ERROR) as log_capture:
+            self.base.client = client
+            self.assertEqual(self.base.compact_parts(), (True, 'compact_parts completed'))
+            log_capture.check(
+                (self.module, 'ERROR', 'Failed to delete the S3 object [test_parts/b.log]. Reason: Internal error'),
+            )
+
+        self.assertEqual(objects['test_parts.merged.json'], b'["test_parts/b.log"]')
+        client.create_multipart_upload.assert_called_once()
+
+        client.get_paginator.return_value.paginate.return_value = [
+            {'Contents': [{'Key': 'test_parts/b.log', 'Size': 2}]},
         ]
+        client.delete_objects.return_value = {}
+
+        with patch.object(PathstreamExternalEnrollment, '_init_s3'):
+            self.assertEqual(self.base.compact_parts(), (True, 'compact_parts completed'))
+
+        client.create_multipart_upload.assert_called_once()
+        self.assertEqual(client.delete_objects.call_args[1]['Delete']['Objects'], [{'Key': 'test_parts/b.log'}])
+        self.assertNotIn('test_parts.merged.json', objects)
+
+    @patch('openedx_external_enrollments.external_enrollments.pathstream_external_enrollment.S3_MIN_PART_SIZE', 4)
+    def test_compact_parts_after_unrecorded_merge(self):
+        """The parts of a completed merge whose result was not recorded are not merged again."""
+        objects = {
+            'test.log': b'123456ab',
+            'test_parts/a.log': b'ab',
+            'test_parts.merged.json': json.dumps({
+                'merged': [],
+                'merging': ['test_parts/a.log'],
+                'content-md5': base64.b64encode(hashlib.md5(b'123456ab').digest()).decode(),
+            }).encode(),
+        }
+        metadata = {'content-md5': base64.b64encode(hashlib.md5(b'123456ab').digest()).decode()}
+        client = self._get_compaction_client(objects, metadata)
+
+        with patch.object(PathstreamExternalEnrollment, '_init_s3'):
+            self.base.client = client
+            self.assertEqual(self.base.compact_parts(), (True, 'compact_parts completed'))
+
+        client.create_multipart_upload.assert_not_called()
+        self.assertEqual(client.delete_objects.call_args[1]['Delete']['Objects'], [{'Key': 'test_parts/a.log'}])
+        self.assertNotIn('test_parts.merged.json', objects)
+
+    @patch('openedx_external_enrollments.external_enrollments.pathstream_external_enrollment.S3_MIN_PART_SIZE', 4)
+    def test_compact_parts_after_uncompleted_merge(self):
+        """The parts of a merge that was not completed are merged again, the ones already merged are not."""
+        objects = {
+            'test.log': b'123456',
+            'test_parts/a.log': b'ab',
+            'test_parts/b.log': b'cd',
+            'test_parts.merged.json': json.dumps({
+                'merged': ['test_parts/a.log'],
+                'merging': ['test_parts/b.log'],
+                'content-md5': base64.b64encode(hashlib.md5(b'123456cd').digest()).decode(),
+            }).encode(),
+        }
+        client = self._get_compaction_client(objects)
+
+        with patch.object(PathstreamExternalEnrollment, '_init_s3'):
+            self.base.client = client
+            self.assertEqual(self.base.compact_parts(), (True, 'compact_parts completed'))
 
-        self.base.execute_upload()
+        self.assertEqual(
+            [kwargs['CopySource']['Key'] for _, kwargs in client.upload_part_copy.call_args_list],
+            ['test.log'],
+        )
+        self.assertEqual([kwargs['Body'] for _, kwargs in client.upload_part.call_args_list], [b'cd'])
+        self.assertEqual(
+            client.create_multipart_upload.call_args[1]['Metadata'],
+            {'content-md5': base64.b64encode(hashlib.md5(b'123456cd').digest()).decode()},
+        )
 
-        self.assertEqual(parent_mock.mock_calls, expected_order_calls)
+    @patch('openedx_external_enrollments.external_enrollments.pathstream_external_enrollment.S3_MIN_PART_SIZE', 4)
+    def test_compact_parts_without_s3_file(self):
+        """The S3 file is created from the parts when it doesn't exist yet."""
+        client = self._get_compaction_client({'test_parts/a.log': b'ab'})
+
+        with patch.object(PathstreamExternalEnrollment, '_init_s3'):
+            self.base.client = client
+            self.assertEqual(self.base.compact_parts(), (True, 'compact_parts completed'))
+
+        client.upload_part_copy.assert_not_called()
+        client.upload_part.assert_called_once()
+        self.assertEqual(client.upload_part.call_args[1]['Body'], b'ab')
+
+    def test_compact_parts_without_parts(self):
+        """Nothing is uploaded nor deleted when there are no parts."""
+        client = self._get_compaction_client({'test.log': b'content'})
+
+        with patch.object(PathstreamExternalEnrollment, '_init_s3'):
+            self.base.client = client
+            self.assertEqual(self.base.compact_parts(), (True, 'compact_parts completed'))
+
+        client.create_multipart_upload.assert_not_called()
+        client.delete_objects.assert_not_called()
+
+    def test_compact_parts_while_running(self):
+        """The parts are not merged while another compaction holds the lock."""
+        client = self._get_compaction_client({'test.log': b'content', 'test_parts/a.log': b'ab'})
+        cache.add(COMPACTION_LOCK_CACHE_KEY, True)
+
+        try:
+            with patch.object(PathstreamExternalEnrollment, '_init_s3'):
+                self.base.client = client
+                self.assertEqual(self.base.compact_parts(), (True, 'compact_parts completed'))
+        finally:
+            cache.delete(COMPACTION_LOCK_CACHE_KEY)
+
+        client.create_multipart_upload.assert_not_called()
+        client.delete_objects.assert_not_called()
+
+    def test_compact_parts_error(self):
+        """The multipart upload is aborted and the parts are kept when the merge fails."""
+        client = self._get_compaction_client({'test_parts/a.log': b'ab'})
+        client.upload_part.side_effect = ClientError({'Error': {'Code': '500'}}, 'UploadPart')
+
+        with patch.object(PathstreamExternalEnrollment, '_init_s3'):
+            self.base.client = client
+            is_completed, _ = self.base.compact_parts()
+
+        self.assertFalse(is_completed)
+        client.abort_multipart_upload.assert_called_once_with(Bucket='test', Key='test.log', UploadId='upload-id')
+        client.delete_objects.assert_not_called()
+
+    def test_compact_parts_error_with_failed_abort(self):
+        """The merge error is reported even if the multipart upload can't be aborted."""
+        client = self._get_compaction_client({'test_parts/a.log': b'ab'})
+        client.upload_part.side_effect = ClientError({'Error': {'Code': '500'}}, 'UploadPart')
+        client.abort_multipart_upload.side_effect = ClientError({'Error': {'Code': '503'}}, 'AbortMultipartUpload')
+
+        with patch.object(PathstreamExternalEnrollment, '_init_s3'), LogCapture(level=logging.ERROR) as log_capture:
+            self.base.client = client
+            is_completed, message = self.base.compact_parts()
+
+        self.assertFalse(is_completed)
+        self.assertIn('UploadPart', message)
+        self.assertIn('Failed to abort the multipart upload [upload-id]', str(log_capture))
+        client.delete_objects.assert_not_called()
 
     @patch('openedx_external_enrollments.external_enrollments.pathstream_external_enrollment.get_user')
     @patch('openedx_external_enrollments.external_enrollments.pathstream_external_enrollment.datetime')
@@ -494,13 +777,66 @@ class PathstreamExternalEnrollmentTest(TestCase):
 
         self.assertEqual(result, expected_data)
 
+        user.profile.name = 'Smith, Jr.'
+        result = self.base._get_enrollment_data(data)  # pylint: disable=protected-access
+
+        self.assertEqual(result, expected_data.replace(',fullname,', ',"Smith, Jr.",'))
+        self.assertTrue(self.base._is_valid_enrollment_data(result, timezone.now()))  # pylint: disable=protected-access
+
+    @patch('openedx_external_enrollments.external_enrollments.pathstream_external_enrollment.get_user')
+    def test_requeue_quarantined_events(self, get_user_mock):
+        """The line of the quarantined events is rebuilt, unless the user doesn't exist anymore."""
+        user = Mock(username='uname', first_name='fname', last_name='Smith, Jr.', email=self.user_email)
+        user.profile.name = 'fullname'
+        get_user_mock.side_effect = [(user, ''), Exception('User does not exist')]
+        course = CourseOverview.objects.create()  # pylint: disable=no-member
+        enrollment = ExternalEnrollment.objects.create(  # pylint: disable=no-member
+            controller_name='pathstream',
+            course_shell=course,
+            email=self.user_email,
+            meta=[],
+        )
+        event_time = timezone.now()
+        events = [
+            ExternalEnrollmentEvent.objects.create(  # pylint: disable=no-member
+                enrollment=enrollment,
+                data='{},{},uname,fullname,fname,Smith, Jr.,2021-07-09 16:53:41,false\n'.format(
+                    course.id,
+                    self.user_email,
+                ),
+                event_time=event_time,
+                quarantined_at=event_time,
+            )
+            for _ in range(2)
+        ]
+
+        self.assertEqual(self.base.requeue_quarantined_events(), (1, 1))
+
+        for event in events:
+            event.refresh_from_db()
+
+        self.assertIsNone(events[0].quarantined_at)
+        self.assertEqual(
+            events[0].data,
+            '{},{},uname,fullname,fname,"Smith, Jr.",{},false\n'.format(
+                course.id,
+                self.user_email,
+                timezone.make_naive(event_time, timezone.utc),
+            ),
+        )
+        batches = list(self.base._get_pending_events_batches())  # pylint: disable=protected-access
+
+        self.assertEqual([[event_id for event_id, _, _ in batch] for batch in batches], [[events[0].id]])
+        self.assertIsNotNone(events[1].quarantined_at)
+
+    @patch('openedx_external_enrollments.external_enrollments.pathstream_external_enrollment.ExternalEnrollmentEvent')
     @patch(
         'openedx_external_enrollments.external_enrollments.pathstream_external_enrollment.ExternalEnrollment')
     @patch(
         'openedx_external_enrollments.external_enrollments.'
         'pathstream_external_enrollment.PathstreamExternalEnrollment._get_enrollment_data'
     )
-    def test_post_enrollment_new_enrollment(self, get_enrollment_data_mock, model_mock):
+    def test_post_enrollment_new_enrollment(self, get_enrollment_data_mock, model_mock, event_model_mock):
         """This test validates _post_enrollment method for a new enrollment."""
         data = {
             'user_email': self.user_email,
@@ -509,12 +845,6 @@ class PathstreamExternalEnrollmentTest(TestCase):
         }
         enrollment_data = 'course,test@email,uname,fullname,,,2021-06-28 16:40:31.456900,true\n'
         get_enrollment_data_mock.return_value = enrollment_data
-        meta_expected = [
-            {
-                'enrollment_data_formated': enrollment_data,
-                'is_uploaded': False,
-            },
-        ]
         external_enrollment_object = Mock()
         external_enrollment_object.id = 1
         model_mock.objects.get_or_create.return_value = (external_enrollment_object, True)
@@ -538,24 +868,32 @@ class PathstreamExternalEnrollmentTest(TestCase):
                 (self.module, 'INFO', log3),
             )
 
-        get_enrollment_data_mock.assert_called_once_with(data)
+        get_enrollment_data_mock.assert_called_once_with(data, ANY)
         model_mock.objects.get_or_create.assert_called_with(
             controller_name='pathstream',
             course_shell_id=self.course_id,
             email=self.user_email,
+            defaults={'meta': []},
+        )
+        external_enrollment_object.save.assert_not_called()
+        event_model_mock.objects.create.assert_called_once_with(
+            enrollment=external_enrollment_object,
+            data=get_enrollment_data_mock.return_value,
+            event_time=ANY,
         )
-        external_enrollment_object.save.assert_called_once()
-        self.assertListEqual(external_enrollment_object.meta, meta_expected)
 
+    @patch('openedx_external_enrollments.external_enrollments.pathstream_external_enrollment.ExternalEnrollmentEvent')
     @patch('openedx_external_enrollments.external_enrollments.pathstream_external_enrollment.ExternalEnrollment')
     @patch(
         'openedx_external_enrollments.external_enrollments.'
         'pathstream_external_enrollment.PathstreamExternalEnrollment._get_enrollment_data'
     )
-    def test_post_enrollment_update_enrollment(self, get_enrollment_data_mock, model_mock):
+    def test_post_enrollment_update_enrollment(self, get_enrollment_data_mock, model_mock, event_model_mock):
         """This test validates _post_enrollment method when an unenrollment event
         is triggered for user and course, which have been used to create the initial
-        ExternalEnrollment object."""
+        ExternalEnrollment object.
+
+        Only a new event is created, the meta of the enrollment is not modified."""
         initial_meta = [
             {
                 'enrollment_data_formated': 'course,t@email,uname,fullname,,,2021-06-28 16:40:31.4569,true\n',
@@ -572,18 +910,16 @@ class PathstreamExternalEnrollmentTest(TestCase):
         }
         unenrollment_data = 'course,t@email,uname,fullname,,,2021-06-29 16:50:31.456900,false\n'
         get_enrollment_data_mock.return_value = unenrollment_data
-        meta_expected = initial_meta
-        meta_expected.append(
-            {
-                'enrollment_data_formated': unenrollment_data,
-                'is_uploaded': False,
-            },
-        )
 
         self.base._post_enrollment(data)  # pylint: disable=protected-access
 
-        external_enrollment_object.save.assert_called_once()
-        self.assertListEqual(external_enrollment_object.meta, meta_expected)
+        external_enrollment_object.save.assert_not_called()
+        self.assertListEqual(external_enrollment_object.meta, initial_meta)
+        event_model_mock.objects.create.assert_called_once_with(
+            enrollment=external_enrollment_object,
+            data=get_enrollment_data_mock.return_value,
+            event_time=ANY,
+        )
 
     @patch('openedx_external_enrollments.external_enrollments.pathstream_external_enrollment.ExternalEnrollment')
     @patch(
@@ -619,4 +955,5 @@ class PathstreamExternalEnrollmentTest(TestCase):
             controller_name=self.base.__str__(),
             course_shell_id=data.get('course_id'),
             email=data.get('user_email'),
+            defaults={'meta': []},
         )
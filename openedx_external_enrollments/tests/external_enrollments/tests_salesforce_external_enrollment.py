@@ -3,6 +3,7 @@ import logging
 from datetime import datetime, timedelta
 
 from django.conf import settings
+from django.core.cache import cache
 from django.test import TestCase
 from mock import Mock, call, patch
 from opaque_keys.edx.keys import CourseKey
@@ -17,8 +18,12 @@ class SalesforceEnrollmentTest(TestCase):
 
     def setUp(self):
         """Set test database."""
+        cache.clear()
         self.base = SalesforceEnrollment()
         self.module = 'openedx_external_enrollments.external_enrollments.salesforce_external_enrollment'
+        enrollment_patcher = patch('{}.CourseEnrollment'.format(self.module))
+        self.enrollment_mock = enrollment_patcher.start()
+        self.addCleanup(enrollment_patcher.stop)
 
     @patch('openedx_external_enrollments.external_enrollments.salesforce_external_enrollment.get_course_by_id')
     def test_get_course(self, get_course_by_id_mock):
@@ -32,9 +37,38 @@ class SalesforceEnrollmentTest(TestCase):
         expected_course = 'test-course'
         get_course_by_id_mock.return_value = expected_course
 
+        self.assertEqual(self.base._get_course(course_id), expected_course)  # pylint: disable=protected-access
         self.assertEqual(self.base._get_course(course_id), expected_course)  # pylint: disable=protected-access
         get_course_by_id_mock.assert_called_once_with(course_key)
 
+    @patch('openedx_external_enrollments.external_enrollments.salesforce_external_enrollment.get_course_by_id')
+    @patch('openedx_external_enrollments.external_enrollments.salesforce_external_enrollment.OtherCourseSettings')
+    def test_get_order_courses(self, course_settings_mock, get_course_by_id_mock):
+        """Courses with OtherCourseSettings are resolved in a single query, without the modulestore."""
+        course_id = 'course-v1:test+CS102+2019_T3'
+        course_key = CourseKey.from_string(course_id)
+        overview = Mock(id=course_key, display_name='test-course', self_paced=False)
+        course_settings_mock.objects.select_related.return_value.filter.return_value = [
+            Mock(course=overview, other_course_settings={'salesforce_data': {}}),
+        ]
+        lines = [
+            {'course_id': course_id},
+            {'course_id': course_id},
+            {'course_id': 'invalid-course-id'},
+        ]
+
+        self.base._courses = self.base._get_order_courses(lines)  # pylint: disable=protected-access
+        course = self.base._get_course(course_id)  # pylint: disable=protected-access
+
+        course_settings_mock.objects.select_related.return_value.filter.assert_called_once_with(
+            course_id__in={course_key},
+        )
+        get_course_by_id_mock.assert_not_called()
+        self.assertEqual(course.display_name, 'test-course')
+        self.assertEqual(course.start, overview.start)
+        self.assertEqual(course.other_course_settings, {'salesforce_data': {}})
+        self.assertEqual({}, self.base._get_order_courses([]))  # pylint: disable=protected-access
+
     def test_str(self):
         """
         SalesforceEnrollment overrides the __str__ method,
@@ -65,7 +99,7 @@ class SalesforceEnrollmentTest(TestCase):
     def test_get_auth_token(self, backend_mock, oauth_session_mock):
         """Testing _get_auth_token method."""
         oauth_mock = Mock()
-        oauth_mock.fetch_token.return_value = 'test-token'
+        oauth_mock.fetch_token.return_value = {'access_token': 'test-token'}
         backend_mock.return_value = 'test-client'
         oauth_session_mock.return_value = oauth_mock
 
@@ -77,7 +111,11 @@ class SalesforceEnrollmentTest(TestCase):
             'grant_type': 'password',
         }
 
-        self.assertEqual('test-token', self.base._get_auth_token())  # pylint: disable=protected-access
+        expected_token = {'access_token': 'test-token'}
+
+        self.assertEqual(expected_token, self.base._get_auth_token())  # pylint: disable=protected-access
+        # The second call must be served from cache.
+        self.assertEqual(expected_token, self.base._get_auth_token())  # pylint: disable=protected-access
         backend_mock.assert_called_once_with(**request_params)
         oauth_session_mock.assert_called_once_with(client='test-client')
         oauth_mock.fetch_token.assert_called_once_with(token_url=settings.SALESFORCE_API_TOKEN_URL)
@@ -109,6 +147,7 @@ class SalesforceEnrollmentTest(TestCase):
         get_user_mock.assert_called_once_with(email='test-email')
 
         get_user_mock.side_effect = Exception('test')
+        self.base._order_context = None  # pylint: disable=protected-access
         self.assertEqual(self.base._get_openedx_user(data), {})  # pylint: disable=protected-access
 
     @patch.object(SalesforceEnrollment, '_get_program_of_interest_data')
@@ -306,10 +345,11 @@ class SalesforceEnrollmentTest(TestCase):
         self.assertRaises(KeyError, lambda var: var['Institution_Hidden'], program_data)
         self.assertRaises(KeyError, lambda var: var['Program_of_Interest'], program_data)
 
+    @patch.object(SalesforceEnrollment, '_get_order_context')
     @patch.object(SalesforceEnrollment, '_get_course_start_date')
     @patch.object(SalesforceEnrollment, '_get_course_key')
     @patch.object(SalesforceEnrollment, '_get_course')
-    def test_get_courses_data(self, get_course_mock, get_course_key_mock, get_date_mock):
+    def test_get_courses_data(self, get_course_mock, get_course_key_mock, get_date_mock, get_context_mock):
         """Testing _get_courses_data method."""
         self.assertEqual([], self.base._get_courses_data({}, []))  # pylint: disable=protected-access
 
@@ -327,6 +367,8 @@ class SalesforceEnrollmentTest(TestCase):
         course_mock.other_course_settings = {'salesforce_data': {}}
         get_course_mock.return_value = course_mock
         get_course_key_mock.return_value = CourseKey.from_string('course-v1:PX+test-course-run-id+2015')
+        enrollment = Mock()
+        get_context_mock.return_value.enrollments = {'course-v1:PX+test-course-run-id+2015': enrollment}
         get_date_mock.return_value = now_date_format
         expected_data = {
             'CourseName': course_mock.display_name,
@@ -339,7 +381,7 @@ class SalesforceEnrollmentTest(TestCase):
 
         self.assertEqual([expected_data], self.base._get_courses_data({}, lines))  # pylint: disable=protected-access
         get_course_mock.assert_called_with('test-course-id')
-        get_date_mock.assert_called_with(course_mock, 'test-email', 'test-course-id')
+        get_date_mock.assert_called_with(course_mock, enrollment)
 
         course_mock.other_course_settings = {
             'salesforce_data': {
@@ -372,34 +414,49 @@ class SalesforceEnrollmentTest(TestCase):
         }
         self.assertTrue(self.base._is_external_course(course_mock))  # pylint: disable=protected-access
 
-    @patch('openedx_external_enrollments.external_enrollments.salesforce_external_enrollment.get_user')
-    @patch('openedx_external_enrollments.external_enrollments.salesforce_external_enrollment.CourseEnrollment')
-    def test_get_course_start_date(self, enrollment_mock, get_user_mock):
+    def test_get_course_start_date(self):
         """Testing _get_course_start_date method."""
         now = datetime.now()
         course_mock = Mock()
         course_mock.start = now - timedelta(days=1)
         course_mock.self_paced = True
-        user = Mock()
-        get_user_mock.return_value = (user, Mock())
-        course_id = 'course-v1:test+CS102+2019_T3'
-        course_key = CourseKey.from_string(course_id)
         enrollment = Mock()
         enrollment.created = now
-        enrollment_mock.get_enrollment.return_value = enrollment
 
         self.assertEqual(
             now.strftime('%Y-%m-%d'),
-            self.base._get_course_start_date(course_mock, 'test-email', course_id),  # pylint: disable=protected-access
+            self.base._get_course_start_date(course_mock, enrollment),  # pylint: disable=protected-access
         )
-        enrollment_mock.get_enrollment.assert_called_with(user, course_key)
 
         course_mock.self_paced = False
         self.assertEqual(
             (now - timedelta(days=1)).strftime('%Y-%m-%d'),
-            self.base._get_course_start_date(course_mock, 'test-email', course_id),  # pylint: disable=protected-access
+            self.base._get_course_start_date(course_mock, enrollment),  # pylint: disable=protected-access
         )
 
+    @patch('openedx_external_enrollments.external_enrollments.salesforce_external_enrollment.get_user')
+    def test_get_order_context(self, get_user_mock):
+        """The learner data is fetched once per order, with all its enrollments in a single query."""
+        user = Mock()
+        profile = Mock()
+        get_user_mock.return_value = (user, profile)
+        course_key = CourseKey.from_string('course-v1:test+CS102+2019_T3')
+        enrollment = Mock(course_id=course_key)
+        self.enrollment_mock.objects.filter.return_value = [enrollment]
+        lines = [
+            {'user_email': 'test-email', 'course_id': str(course_key)},
+            {'user_email': 'test-email', 'course_id': str(course_key)},
+        ]
+
+        context = self.base._get_order_context(lines)  # pylint: disable=protected-access
+
+        self.assertIs(context, self.base._get_order_context(lines))  # pylint: disable=protected-access
+        self.assertEqual(context.user, user)
+        self.assertEqual(context.profile, profile)
+        self.assertEqual(context.enrollments, {str(course_key): enrollment})
+        get_user_mock.assert_called_once_with(email='test-email')
+        self.enrollment_mock.objects.filter.assert_called_once_with(user=user, course_id__in={course_key})
+
     @patch.object(SalesforceEnrollment, '_get_salesforce_data')
     @patch.object(SalesforceEnrollment, '_get_openedx_user')
     @patch.object(SalesforceEnrollment, '_get_courses_data')
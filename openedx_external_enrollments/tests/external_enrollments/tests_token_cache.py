@@ -0,0 +1,88 @@
+"""Tests for the token_cache module."""
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from mock import Mock, patch
+
+from openedx_external_enrollments.external_enrollments.token_cache import (
+    CACHE_KEY_PREFIX,
+    delete_cached_token,
+    get_cached_token,
+)
+
+module = 'openedx_external_enrollments.external_enrollments.token_cache'
+
+
+class GetCachedTokenTest(TestCase):
+    """Test class for get_cached_token method."""
+
+    def setUp(self):
+        """Start every test with an empty cache."""
+        cache.clear()
+        self.token = {'access_token': 'test-token', 'expires_in': 3600}
+        self.fetch_token = Mock(return_value=self.token)
+
+    def test_token_is_cached(self):
+        """The token is fetched once and then served from cache."""
+        self.assertEqual(get_cached_token('partner', self.fetch_token), self.token)
+        self.assertEqual(get_cached_token('partner', self.fetch_token), self.token)
+        self.fetch_token.assert_called_once()
+
+    def test_failed_fetch_is_not_cached(self):
+        """A failed token request must be retried by the next caller."""
+        self.fetch_token.return_value = None
+
+        self.assertIsNone(get_cached_token('partner', self.fetch_token))
+        self.assertIsNone(get_cached_token('partner', self.fetch_token))
+        self.assertEqual(self.fetch_token.call_count, 2)
+
+    def test_delete_cached_token(self):
+        """A deleted token is fetched again."""
+        get_cached_token('partner', self.fetch_token)
+        delete_cached_token('partner')
+        get_cached_token('partner', self.fetch_token)
+
+        self.assertEqual(self.fetch_token.call_count, 2)
+
+    @patch('{}.cache.set'.format(module))
+    def test_expires_in(self, cache_set_mock):
+        """The cache timeout follows expires_in, or the default value when it is missing."""
+        get_cached_token('partner', self.fetch_token)
+        self.assertEqual(cache_set_mock.call_args[0][2], 3600)
+
+        with override_settings(OEE_TOKEN_CACHE_DEFAULT_EXPIRES_IN=120):
+            get_cached_token('other-partner', Mock(return_value={'access_token': 'test-token'}))
+
+        self.assertEqual(cache_set_mock.call_args[0][2], 120)
+
+    @patch('{}._refresh_in_background'.format(module))
+    @patch('{}.time.time'.format(module))
+    def test_early_refresh(self, time_mock, refresh_in_background_mock):
+        """Within the refresh margin the cached token is returned and only one background refresh starts."""
+        time_mock.return_value = 0
+        get_cached_token('partner', self.fetch_token)
+        time_mock.return_value = 3590
+
+        self.assertEqual(get_cached_token('partner', self.fetch_token), self.token)
+        self.assertEqual(get_cached_token('partner', self.fetch_token), self.token)
+        refresh_in_background_mock.assert_called_once()
+        self.fetch_token.assert_called_once()
+
+    @override_settings(OEE_TOKEN_CACHE_LOCK_TIMEOUT=0)
+    def test_locked_refresh(self):
+        """A worker that doesn't get the lock waits and finally fetches the token by itself."""
+        cache.add('{}.partner.lock'.format(CACHE_KEY_PREFIX), True)
+
+        self.assertEqual(get_cached_token('partner', self.fetch_token), self.token)
+        self.fetch_token.assert_called_once()
+
+    @override_settings(OEE_TOKEN_CACHE_LOCK_TIMEOUT=60)
+    @patch('{}.time.sleep'.format(module))
+    def test_locked_refresh_with_failed_fetch(self, sleep_mock):
+        """The waiting worker stops waiting when the lock is released without a token."""
+        lock_key = '{}.partner.lock'.format(CACHE_KEY_PREFIX)
+        cache.add(lock_key, True)
+        sleep_mock.side_effect = lambda _: cache.delete(lock_key)
+
+        self.assertEqual(get_cached_token('partner', self.fetch_token), self.token)
+        sleep_mock.assert_called_once()
+        self.fetch_token.assert_called_once()
@@ -92,11 +92,12 @@ class ViperExternalEnrollmentTest(TestCase):
         self.assertEqual(result, enrollment_mock.meta.get('course_url'))
 
     @patch('openedx_external_enrollments.external_enrollments.viper_external_enrollment.ExternalEnrollment')
-    @patch('openedx_external_enrollments.external_enrollments.viper_external_enrollment.requests.post')
-    def test_get_course_home_url_with_inactive_enrollment(self, post_mock, model_mock):
+    @patch('openedx_external_enrollments.external_enrollments.viper_external_enrollment.get_http_session')
+    def test_get_course_home_url_with_inactive_enrollment(self, http_session_mock, model_mock):
         """
         This test validates the get_url_home method with a inactive enrollment.
         """
+        post_mock = http_session_mock.return_value.post
         expected_result = {
             'link': 'link',
         }
@@ -117,11 +118,12 @@ class ViperExternalEnrollmentTest(TestCase):
         self.assertEqual(result, expected_result.get('link'))
 
     @patch('openedx_external_enrollments.external_enrollments.viper_external_enrollment.ExternalEnrollment')
-    @patch('openedx_external_enrollments.external_enrollments.viper_external_enrollment.requests.post')
-    def test_get_course_home_url_with_failed_post_enrollment(self, post_mock, model_mock):
+    @patch('openedx_external_enrollments.external_enrollments.viper_external_enrollment.get_http_session')
+    def test_get_course_home_url_with_failed_post_enrollment(self, http_session_mock, model_mock):
         """
         This test validates the get_url_home method with a inactive enrollment.
         """
+        post_mock = http_session_mock.return_value.post
         module = 'openedx_external_enrollments.external_enrollments.viper_external_enrollment'
         enrollment_mock = Mock()
         enrollment_mock.meta = {
@@ -142,11 +144,12 @@ class ViperExternalEnrollmentTest(TestCase):
 
     @patch(
         'openedx_external_enrollments.external_enrollments.viper_external_enrollment.EnrollmentRequestLog.objects.create')  # noqa: disable=E501 pylint: disable=C0301
-    @patch('openedx_external_enrollments.external_enrollments.viper_external_enrollment.requests.post')
-    def test_refresh_api_keys_with_failed_post_request(self, post_mock, request_log_create_mock):
+    @patch('openedx_external_enrollments.external_enrollments.viper_external_enrollment.get_http_session')
+    def test_refresh_api_keys_with_failed_post_request(self, http_session_mock, request_log_create_mock):
         """
         This test validates the _refresh_api_keys method with a failed post request.
         """
+        post_mock = http_session_mock.return_value.post
         module = 'openedx_external_enrollments.external_enrollments.viper_external_enrollment'
         post_mock.side_effect = Exception('Exception reason.')
 
@@ -165,11 +168,12 @@ class ViperExternalEnrollmentTest(TestCase):
 
     @patch(
         'openedx_external_enrollments.external_enrollments.viper_external_enrollment.EnrollmentRequestLog.objects.create')  # noqa: disable=E501 pylint: disable=C0301
-    @patch('openedx_external_enrollments.external_enrollments.viper_external_enrollment.requests.post')
-    def test_refresh_api_keys_with_successful_post_request(self, post_mock, request_log_create_mock):
+    @patch('openedx_external_enrollments.external_enrollments.viper_external_enrollment.get_http_session')
+    def test_refresh_api_keys_with_successful_post_request(self, http_session_mock, request_log_create_mock):
         """
         This test validates the _refresh_api_keys method with a successful post request.
         """
+        post_mock = http_session_mock.return_value.post
         module = 'openedx_external_enrollments.external_enrollments.viper_external_enrollment'
         mock_response = Mock(status_code=status.HTTP_200_OK)
         mock_response.json.return_value = {'message': 'succeeded'}
@@ -190,11 +194,12 @@ class ViperExternalEnrollmentTest(TestCase):
 
     @patch(
         'openedx_external_enrollments.external_enrollments.viper_external_enrollment.EnrollmentRequestLog.objects.create')  # noqa: disable=E501 pylint: disable=C0301
-    @patch('openedx_external_enrollments.external_enrollments.viper_external_enrollment.requests.post')
-    def test_refresh_api_keys_with_failed_request(self, post_mock, request_log_create_mock):
+    @patch('openedx_external_enrollments.external_enrollments.viper_external_enrollment.get_http_session')
+    def test_refresh_api_keys_with_failed_request(self, http_session_mock, request_log_create_mock):
         """
         This test validates the _refresh_api_keys method with a bad post request.
         """
+        post_mock = http_session_mock.return_value.post
         module = 'openedx_external_enrollments.external_enrollments.viper_external_enrollment'
         mock_response = Mock(status_code=status.HTTP_400_BAD_REQUEST)
         mock_response.json.return_value = {'message': 'failed'}
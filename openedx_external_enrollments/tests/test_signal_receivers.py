@@ -1,25 +1,31 @@
 """Tests SalesforceEnrollment class file."""
+from django.core.cache import cache
+from django.db.models.signals import post_delete
 from django.test import TestCase
 from mock import Mock, patch
 
-from openedx_external_enrollments.signal_receivers import update_external_enrollment
+from openedx_external_enrollments.course_home_cache import (
+    get_course_home_cache_key,
+    get_entry_points_completion_cache_key,
+)
+from openedx_external_enrollments.signal_receivers import update_entry_points_completion, update_external_enrollment
+from openedx_external_enrollments.tests.tests_backends import Submission
 
 
 class UpdateExternalEnrollmentTest(TestCase):
     """Test class for update_external_enrollment method."""
 
     @patch('openedx_external_enrollments.signal_receivers.get_course_mode')
-    @patch('openedx_external_enrollments.signal_receivers.get_course_by_id')
     @patch('openedx_external_enrollments.signal_receivers.configuration_helpers')
-    def test_update_enrollments(self, configuration_helpers_mock, get_course_by_id_mock, get_course_mode_mock):
+    def test_update_enrollments(self, configuration_helpers_mock, get_course_mode_mock):
         """Testing update_external_enrollments method."""
         instance = Mock()
         instance.is_active = True
         instance.mode = 'test-mode'
+        instance.user.id = 1
         instance.user.email = 'test-email'
         instance.user.profile.name = 'name'
         instance.course_id = 'test-course-id'
-        get_course_by_id_mock.return_value = 'test-course'
         configuration_helpers_mock.get_value.return_value = False
         data = {
             'user_email': instance.user.email,
@@ -35,24 +41,21 @@ class UpdateExternalEnrollmentTest(TestCase):
         with patch('openedx_external_enrollments.signal_receivers.execute_external_enrollment') as execute_mock:
             update_external_enrollment('fake-sender', course_enrollment=instance)
 
-            get_course_by_id_mock.assert_not_called()
             execute_mock.assert_not_called()
 
             configuration_helpers_mock.get_value.return_value = False
 
             update_external_enrollment('fake-sender', course_enrollment=instance)
 
-            get_course_by_id_mock.assert_not_called()
             execute_mock.assert_not_called()
 
             configuration_helpers_mock.get_value.return_value = True
 
             update_external_enrollment('fake-sender', course_enrollment=instance)
 
-            get_course_by_id_mock.assert_called_once_with(instance.course_id)
             execute_mock.assert_called_once_with(
                 data=data,
-                course='test-course',
+                course_key=instance.course_id,
             )
 
             data['is_active'] = True
@@ -61,7 +64,7 @@ class UpdateExternalEnrollmentTest(TestCase):
             update_external_enrollment('fake-sender', course_enrollment=instance)
             execute_mock.assert_called_with(
                 data=data,
-                course='test-course',
+                course_key=instance.course_id,
             )
 
 
@@ -69,17 +72,16 @@ class DeleteExternalEnrollmentTest(TestCase):
     """Test class for delete_external_enrollment method."""
 
     @patch('openedx_external_enrollments.signal_receivers.get_course_mode')
-    @patch('openedx_external_enrollments.signal_receivers.get_course_by_id')
     @patch('openedx_external_enrollments.signal_receivers.configuration_helpers')
-    def test_delete_enrollments(self, configuration_helpers_mock, get_course_by_id_mock, get_course_mode_mock):
+    def test_delete_enrollments(self, configuration_helpers_mock, get_course_mode_mock):
         """Testing delete_external_enrollments method."""
         instance = Mock()
         instance.is_active = False
         instance.mode = 'test-mode'
+        instance.user.id = 1
         instance.user.email = 'test-email'
         instance.course_id = 'test-course-id'
         instance.user.profile.name = 'name'
-        get_course_by_id_mock.return_value = 'test-course'
         configuration_helpers_mock.get_value.return_value = False
         data = {
             'user_email': instance.user.email,
@@ -95,15 +97,70 @@ class DeleteExternalEnrollmentTest(TestCase):
         with patch('openedx_external_enrollments.signal_receivers.execute_external_enrollment') as execute_mock:
             update_external_enrollment('fake-sender', course_enrollment=instance)
 
-            get_course_by_id_mock.assert_not_called()
             execute_mock.assert_not_called()
 
             configuration_helpers_mock.get_value.return_value = True
 
             update_external_enrollment('fake-sender', course_enrollment=instance)
 
-            get_course_by_id_mock.assert_called_once_with(instance.course_id)
             execute_mock.assert_called_once_with(
                 data=data,
-                course='test-course',
+                course_key=instance.course_id,
             )
+
+
+class InvalidateCourseHomeTest(TestCase):
+    """Test the course home invalidation on enrollment events."""
+
+    @patch('openedx_external_enrollments.signal_receivers.configuration_helpers')
+    def test_invalidate_course_home(self, configuration_helpers_mock):
+        """The cached course home of the learner is removed even if external enrollments are disabled."""
+        instance = Mock()
+        instance.user.id = 1
+        instance.course_id = 'test-course-id'
+        configuration_helpers_mock.get_value.return_value = False
+        cache_key = get_course_home_cache_key(1, 'test-course-id')
+        cache.set(cache_key, {'url': 'test-url'})
+
+        update_external_enrollment('fake-sender', course_enrollment=instance)
+
+        self.assertIsNone(cache.get(cache_key))
+
+
+class UpdateEntryPointsCompletionTest(TestCase):
+    """Test class for update_entry_points_completion method."""
+
+    @patch('openedx_external_enrollments.signal_receivers.user_by_anonymous_id')
+    def test_update_entry_points_completion(self, user_by_anonymous_id_mock):
+        """The completion and course home of the learner are invalidated when a submission is saved or deleted."""
+        instance = Mock()
+        instance.student_item.student_id = 'anonymous-id'
+        instance.student_item.course_id = 'test-course-id'
+        user_by_anonymous_id_mock.return_value = Mock(id=1)
+        cache_keys = [
+            get_entry_points_completion_cache_key(1, 'test-course-id'),
+            get_course_home_cache_key(1, 'test-course-id'),
+        ]
+        cache.set_many({cache_key: 'test-value' for cache_key in cache_keys})
+
+        for signal_kwargs in [{'created': True}, {'created': False}, {}]:
+            cache.set_many({cache_key: 'test-value' for cache_key in cache_keys})
+
+            update_entry_points_completion('fake-sender', instance=instance, **signal_kwargs)
+
+            user_by_anonymous_id_mock.assert_called_with('anonymous-id')
+            self.assertEqual(cache.get_many(cache_keys), {})
+
+    @patch('openedx_external_enrollments.signal_receivers.user_by_anonymous_id')
+    def test_update_entry_points_completion_on_delete(self, user_by_anonymous_id_mock):
+        """The receiver is connected to the deletion of the submissions."""
+        instance = Mock()
+        instance.student_item.student_id = 'anonymous-id'
+        instance.student_item.course_id = 'test-course-id'
+        user_by_anonymous_id_mock.return_value = Mock(id=1)
+        cache_key = get_entry_points_completion_cache_key(1, 'test-course-id')
+        cache.set(cache_key, 'test-value')
+
+        post_delete.send(sender=Submission, instance=instance)
+
+        self.assertIsNone(cache.get(cache_key))
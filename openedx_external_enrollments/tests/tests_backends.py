@@ -7,6 +7,10 @@ class CourseOverview(models.Model):
     """Test model class for openedx.core.djangoapps.content.course_overviews.models."""
 
 
+class Submission(models.Model):
+    """Test model class for submissions.models.Submission."""
+
+
 class ApiKeyHeaderPermissionIsAuthenticated():
     """Test class for openedx.core.lib.api.permissions.ApiKeyHeaderPermissionIsAuthenticated"""
 
@@ -23,6 +27,10 @@ def get_course_enrollment_backend():
     """Test get_course_enrollment_backend method."""
 
 
+def user_by_anonymous_id_backend():
+    """Test user_by_anonymous_id_backend method."""
+
+
 def get_configuration_helpers():
     """Test get_configuration_helpers method."""
 
@@ -44,3 +52,8 @@ def get_unenroll_done_signal():
 def get_course_overview():
     """Test get_course_overview method."""
     return CourseOverview
+
+
+def get_submission_model_backend():
+    """Test get_submission_model_backend method."""
+    return Submission
@@ -0,0 +1,35 @@
+"""Tests for the course_home_cache module."""
+import warnings
+
+from django.core.cache import cache
+from django.core.cache.backends.base import CacheKeyWarning
+from django.test import TestCase
+
+from openedx_external_enrollments.course_home_cache import (
+    get_course_home_cache_key,
+    get_entry_points_completion_cache_key,
+)
+
+
+class CourseHomeCacheKeyTest(TestCase):
+    """Test class for the course home cache keys."""
+
+    def test_cache_keys_are_valid_for_memcached(self):
+        """The keys don't contain spaces nor exceed the memcached length, whatever the ids are."""
+        course_id = 'course-v1:test+{}+2019 T3'.format('a' * 300)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', CacheKeyWarning)
+
+            for cache_key in (
+                    get_course_home_cache_key(1, course_id),
+                    get_entry_points_completion_cache_key(1, course_id),
+            ):
+                cache.validate_key(cache_key)
+
+    def test_cache_keys_depend_on_the_user_and_course(self):
+        """Every user and course has its own keys."""
+        self.assertEqual(get_course_home_cache_key(1, 'course'), get_course_home_cache_key('1', 'course'))
+        self.assertNotEqual(get_course_home_cache_key(1, 'course'), get_course_home_cache_key(2, 'course'))
+        self.assertNotEqual(get_course_home_cache_key(1, 'course'), get_course_home_cache_key(1, 'other'))
+        self.assertNotEqual(get_course_home_cache_key(1, 'course'), get_entry_points_completion_cache_key(1, 'course'))
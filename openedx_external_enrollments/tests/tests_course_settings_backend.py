@@ -0,0 +1,84 @@
+"""Tests for the course settings backend."""
+from importlib import import_module
+
+from django.core.cache import cache
+from django.test import TestCase
+from mock import Mock, patch
+
+from openedx_external_enrollments.models import OtherCourseSettings
+from openedx_external_enrollments.tests.tests_backends import CourseOverview
+
+EDXAPP_MODULES = {
+    'cms': Mock(),
+    'cms.djangoapps': Mock(),
+    'cms.djangoapps.models': Mock(),
+    'cms.djangoapps.models.settings': Mock(),
+    'cms.djangoapps.models.settings.course_metadata': Mock(),
+    'xmodule': Mock(),
+    'xmodule.modulestore': Mock(),
+    'xmodule.modulestore.django': Mock(),
+}
+
+
+class UpdateCourseSettingsTest(TestCase):
+    """Test class for the update_course_settings method."""
+
+    def setUp(self):
+        """Import the backend without the edx-platform modules and create an external course."""
+        cache.clear()
+
+        with patch.dict('sys.modules', EDXAPP_MODULES):
+            self.backend = import_module('openedx_external_enrollments.edxapp_wrapper.backends.course_settings_j_v1')
+
+        self.course = CourseOverview.objects.create()  # pylint: disable=no-member
+        self.course_settings = OtherCourseSettings.objects.create(  # pylint: disable=no-member
+            course=self.course,
+            external_platform='icc',
+            other_course_settings={'external_platform_target': 'icc'},
+        )
+
+    def test_update_course_settings(self):
+        """The settings with valid entry points are stored."""
+        other_course_settings = {
+            'external_platform_target': 'viper',
+            'external_course_run_id': 'external-id',
+            'course_entry_points': [{'valid_from_week': 0, 'valid_through_week': 2, 'block_id': 'block'}],
+        }
+
+        errors = self.backend.update_course_settings(
+            course_key=self.course.id,
+            other_course_settings=other_course_settings,
+        )
+
+        self.course_settings.refresh_from_db()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.course_settings.external_platform, 'viper')
+        self.assertEqual(self.course_settings.external_course_id, 'external-id')
+        self.assertEqual(self.course_settings.other_course_settings, other_course_settings)
+
+    def test_update_course_settings_with_invalid_entry_points(self):
+        """The settings with invalid entry points ranges are not stored and the errors are returned."""
+        errors = self.backend.update_course_settings(
+            course_key=self.course.id,
+            other_course_settings={
+                'external_platform_target': 'viper',
+                'course_entry_points': [
+                    {'valid_from_week': 3, 'valid_through_week': 1},
+                    {'valid_from_week': 'first', 'valid_through_week': 1},
+                ],
+            },
+        )
+
+        self.course_settings.refresh_from_db()
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(self.course_settings.external_platform, 'icc')
+        self.assertEqual(self.course_settings.other_course_settings, {'external_platform_target': 'icc'})
+
+    def test_update_course_settings_without_target(self):
+        """The stored settings are deleted when the course has no external platform."""
+        errors = self.backend.update_course_settings(course_key=self.course.id, other_course_settings={})
+
+        self.assertEqual(errors, [])
+        self.assertFalse(
+            OtherCourseSettings.objects.filter(course_id=self.course.id).exists(),  # pylint: disable=no-member
+        )
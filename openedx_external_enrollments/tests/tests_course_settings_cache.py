@@ -0,0 +1,77 @@
+"""Tests for the course_settings_cache module."""
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from openedx_external_enrollments import course_settings_cache
+from openedx_external_enrollments.course_settings_cache import (
+    get_other_course_settings,
+    invalidate_other_course_settings,
+)
+from openedx_external_enrollments.models import OtherCourseSettings
+from openedx_external_enrollments.tests.tests_backends import CourseOverview
+
+
+class CourseSettingsCacheTest(TestCase):
+    """Test class for the course settings lookup."""
+
+    def setUp(self):
+        """Start every test with empty caches and an external course."""
+        cache.clear()
+        course_settings_cache._LOCAL_CACHE.clear()  # pylint: disable=protected-access
+        self.course = CourseOverview.objects.create()  # pylint: disable=no-member
+        self.course_settings = OtherCourseSettings.objects.create(  # pylint: disable=no-member
+            course=self.course,
+            external_platform='icc',
+            other_course_settings={'external_platform_target': 'icc'},
+        )
+
+    def test_get_settings_from_table(self):
+        """The settings are read from the table once, then served from the caches."""
+        with self.assertNumQueries(1):
+            self.assertEqual(get_other_course_settings(self.course.id), {'external_platform_target': 'icc'})
+            self.assertEqual(get_other_course_settings(self.course.id), {'external_platform_target': 'icc'})
+
+    def test_get_settings_from_django_cache(self):
+        """A process without the local entry reads the settings from the Django cache."""
+        get_other_course_settings(self.course.id)
+        course_settings_cache._LOCAL_CACHE.clear()  # pylint: disable=protected-access
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_other_course_settings(self.course.id), {'external_platform_target': 'icc'})
+
+    def test_course_without_settings(self):
+        """Courses that are not external get an empty dict, which is cached as well."""
+        course = CourseOverview.objects.create()  # pylint: disable=no-member
+
+        with self.assertNumQueries(1):
+            self.assertEqual(get_other_course_settings(course.id), {})
+            self.assertEqual(get_other_course_settings(course.id), {})
+
+    def test_returned_settings_are_copies(self):
+        """Modifying the returned dict doesn't alter the cached one."""
+        get_other_course_settings(self.course.id)['external_platform_target'] = 'edx'
+
+        self.assertEqual(get_other_course_settings(self.course.id), {'external_platform_target': 'icc'})
+
+    def test_invalidate_settings(self):
+        """Updated settings are returned after the invalidation."""
+        get_other_course_settings(self.course.id)
+        self.course_settings.other_course_settings = {'external_platform_target': 'edx'}
+        self.course_settings.save()
+
+        invalidate_other_course_settings(self.course.id)
+
+        self.assertEqual(get_other_course_settings(self.course.id), {'external_platform_target': 'edx'})
+
+    @override_settings(OEE_COURSE_SETTINGS_LOCAL_CACHE_SIZE=1)
+    def test_local_cache_size(self):
+        """The least recently used entries are evicted from the local cache."""
+        course = CourseOverview.objects.create()  # pylint: disable=no-member
+
+        get_other_course_settings(self.course.id)
+        get_other_course_settings(course.id)
+
+        self.assertEqual(
+            list(course_settings_cache._LOCAL_CACHE),  # pylint: disable=protected-access
+            [str(course.id)],
+        )
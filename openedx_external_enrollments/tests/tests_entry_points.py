@@ -0,0 +1,66 @@
+"""Tests for the entry_points module."""
+from django.test import TestCase
+
+from openedx_external_enrollments.entry_points import get_current_entry_point, validate_course_entry_points
+
+
+class GetCurrentEntryPointTest(TestCase):
+    """Test class for get_current_entry_point method."""
+
+    def setUp(self):
+        """Set the course entry points."""
+        self.course_entry_points = [
+            {'block_id': 'first', 'valid_through_week': '1'},
+            {'block_id': 'second', 'valid_from_week': '1', 'valid_through_week': '3'},
+            {'block_id': 'overlapped', 'valid_from_week': '2', 'valid_through_week': '4'},
+        ]
+
+    def test_get_current_entry_point(self):
+        """The first entry point whose range contains the day is returned."""
+        expected_points = {
+            -1: None,
+            0: 'first',
+            7: 'first',
+            8: 'second',
+            21: 'second',
+            22: 'overlapped',
+            28: 'overlapped',
+            29: None,
+        }
+
+        for day, block_id in expected_points.items():
+            entry_point = get_current_entry_point(self.course_entry_points, day)
+            self.assertEqual(entry_point and entry_point['block_id'], block_id, day)
+
+    def test_invalid_entry_points_are_ignored(self):
+        """Entry points with invalid weeks don't break the lookup."""
+        self.course_entry_points.insert(0, {'block_id': 'invalid', 'valid_through_week': 'one'})
+
+        self.assertEqual(get_current_entry_point(self.course_entry_points, 3)['block_id'], 'first')
+
+    def test_without_entry_points(self):
+        """None is returned when the course has no entry points."""
+        self.assertIsNone(get_current_entry_point([], 3))
+
+
+class ValidateCourseEntryPointsTest(TestCase):
+    """Test class for validate_course_entry_points method."""
+
+    def test_valid_entry_points(self):
+        """Valid entry points have no errors."""
+        self.assertEqual(validate_course_entry_points(None), [])
+        self.assertEqual(
+            validate_course_entry_points([{'valid_from_week': 1, 'valid_through_week': '2'}]),
+            [],
+        )
+
+    def test_invalid_entry_points(self):
+        """Every invalid entry point is reported."""
+        errors = validate_course_entry_points([
+            {'valid_from_week': 'one', 'valid_through_week': 2},
+            {'valid_from_week': 3, 'valid_through_week': 2},
+            'not-a-dict',
+        ])
+
+        self.assertEqual(len(errors), 3)
+        self.assertTrue(errors[1].startswith('Entry point 1:'))
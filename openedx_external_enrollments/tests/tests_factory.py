@@ -25,8 +25,7 @@ from openedx_external_enrollments.factory import ExternalEnrollmentFactory
 class ExternalEnrollmentFactoryTest(TestCase):
     """Test class for ExternalEnrollmentFactory class."""
 
-    @patch('openedx_external_enrollments.external_enrollments.mit_hz_external_enrollment.configuration_helpers')
-    @patch('openedx_external_enrollments.external_enrollments.greenfig_external_enrollment.configuration_helpers')
+    @patch('openedx_external_enrollments.external_enrollments.base_external_enrollment.configuration_helpers')
     @data(
         ('edX', EdxEnterpriseExternalEnrollment),
         ('openedX', EdxInstanceExternalEnrollment),
@@ -37,11 +36,9 @@ class ExternalEnrollmentFactoryTest(TestCase):
         ('pathstream', PathstreamExternalEnrollment),
     )
     @unpack
-    def test_get_enrollment_controller(self, controller, instance, greenfig_configuration_helpers_mock,
-                                       mit_hz_configuration_helpers_mock):
+    def test_get_enrollment_controller(self, controller, instance, configuration_helpers_mock):
         """Testing _get_enrollment_controller method."""
-        greenfig_configuration_helpers_mock.get_value.return_value = 'settings-value'
-        mit_hz_configuration_helpers_mock.get_value.return_value = 'settings-value'
+        configuration_helpers_mock.get_value.return_value = 'settings-value'
 
         self.assertTrue(
             isinstance(
@@ -1,12 +1,21 @@
 """Tests for openedx_external_enrollments.tasks file."""
 import unittest
 
-from mock import patch
+from django.test import override_settings
+from mock import Mock, patch
 
+from openedx_external_enrollments.external_enrollments.greenfig_external_enrollment import GreenfigTaskExecutionError
 from openedx_external_enrollments.external_enrollments.pathstream_external_enrollment import (
     PathstreamTaskExecutionError,
 )
-from openedx_external_enrollments.tasks import refresh_viper_api_keys, run_pathstream_task
+from openedx_external_enrollments.tasks import (
+    refresh_viper_api_keys,
+    run_external_enrollment,
+    run_greenfig_flush_task,
+    run_mit_hz_subscriptions_refresh,
+    run_pathstream_compaction_task,
+    run_pathstream_task,
+)
 
 
 class TestViperTasks(unittest.TestCase):
@@ -94,3 +103,118 @@ class TestPathstreamTask(unittest.TestCase):
 
         execute_upload_mock.assert_called_once()
         mock_retry.assert_called_once()
+
+    @patch('openedx_external_enrollments.tasks.run_pathstream_compaction_task.retry')
+    @patch(
+        'openedx_external_enrollments.external_enrollments.pathstream_external_enrollment'
+        '.PathstreamExternalEnrollment.compact_parts'
+    )
+    def test_run_pathstream_compaction_task(self, compact_parts_mock, mock_retry):
+        """
+        This test checks that run_pathstream_compaction_task retries when PathstreamExternalEnrollment.compact_parts
+        fails.
+        """
+        compact_parts_mock.return_value = True, 'compact_parts completed'
+
+        result = run_pathstream_compaction_task()  # pylint: disable=no-value-for-parameter
+
+        self.assertEqual(result, {'message': 'compact_parts completed'})
+        mock_retry.assert_not_called()
+
+        compact_parts_mock.return_value = False, 'test-ExecutionError-message'
+        mock_retry.return_value = PathstreamTaskExecutionError('test-ExecutionError-message')
+
+        with self.assertRaises(PathstreamTaskExecutionError):
+            run_pathstream_compaction_task()  # pylint: disable=no-value-for-parameter
+
+        mock_retry.assert_called_once()
+
+
+class TestGreenfigTask(unittest.TestCase):
+    """Test class for Greenfig tasks."""
+
+    @patch('openedx_external_enrollments.tasks.run_greenfig_flush_task.retry')
+    @patch('openedx_external_enrollments.tasks.GreenfigInstanceExternalEnrollment')
+    def test_run_greenfig_flush_task(self, controller_mock, mock_retry):
+        """
+        This test checks that run_greenfig_flush_task retries when
+        GreenfigInstanceExternalEnrollment.flush_enrollments fails.
+        """
+        flush_enrollments_mock = controller_mock.return_value.flush_enrollments
+        flush_enrollments_mock.return_value = True, 'flush_enrollments completed'
+
+        result = run_greenfig_flush_task()  # pylint: disable=no-value-for-parameter
+
+        self.assertEqual(result, {'message': 'flush_enrollments completed'})
+        mock_retry.assert_not_called()
+
+        flush_enrollments_mock.return_value = False, 'error'
+        mock_retry.return_value = GreenfigTaskExecutionError('error')
+
+        with self.assertRaises(GreenfigTaskExecutionError):
+            run_greenfig_flush_task()  # pylint: disable=no-value-for-parameter
+
+        mock_retry.assert_called_once()
+
+
+class TestMITHzTask(unittest.TestCase):
+    """Test class for MIT HZ tasks."""
+
+    @override_settings(OEE_MIT_HZ_REFRESH_BATCH_SIZE=10, OEE_MIT_HZ_REFRESH_MAX_WORKERS=2)
+    @patch('openedx_external_enrollments.tasks.MITHzInstanceExternalEnrollment')
+    def test_run_mit_hz_subscriptions_refresh(self, controller_mock):
+        """The subscriptions are refreshed with the batch size and workers defined in settings."""
+        refresh_subscriptions_mock = controller_mock.return_value.refresh_subscriptions
+        refresh_subscriptions_mock.return_value = {'refreshed': 1, 'failed': 0}
+
+        self.assertEqual(run_mit_hz_subscriptions_refresh(), {'refreshed': 1, 'failed': 0})
+        refresh_subscriptions_mock.assert_called_once_with(10, 2)
+
+
+class TestRunExternalEnrollmentTask(unittest.TestCase):
+    """Test class for run_external_enrollment task."""
+
+    def setUp(self):
+        """Set the controller returned by the factory."""
+        self.data = {'user_email': 'test-email', 'course_id': 'course-v1:test+CS102+2019_T3'}
+        self.course_settings = {'external_platform_target': 'icc'}
+        self.controller_mock = Mock()
+        self.controller_mock.get_retry_policy.return_value = {'max_retries': 3, 'countdown': 60}
+
+    @patch('openedx_external_enrollments.tasks.run_external_enrollment.retry')
+    @patch('openedx_external_enrollments.tasks.ExternalEnrollmentFactory')
+    def test_run_external_enrollment_completed(self, factory_mock, retry_mock):
+        """The enrollment is executed with the controller and is not retried."""
+        factory_mock.get_enrollment_controller.return_value = self.controller_mock
+        self.controller_mock.run_enrollment.return_value = {'id': 1}, True
+
+        result = run_external_enrollment(
+            'icc',
+            self.data,
+            self.course_settings,
+            {'ICC_AUTH_METHOD_OVERRIDE': 'saml2'},
+        )
+
+        factory_mock.get_enrollment_controller.assert_called_once_with(controller='icc')
+        self.controller_mock.set_site_configuration.assert_called_once_with({'ICC_AUTH_METHOD_OVERRIDE': 'saml2'})
+        self.controller_mock.run_enrollment.assert_called_once_with(
+            self.data,
+            self.course_settings,
+        )
+        retry_mock.assert_not_called()
+        self.assertEqual(result, {'message': {'id': 1}})
+
+    @patch('openedx_external_enrollments.tasks.run_external_enrollment.retry')
+    @patch('openedx_external_enrollments.tasks.ExternalEnrollmentFactory')
+    def test_run_external_enrollment_failed(self, factory_mock, retry_mock):
+        """A failed enrollment is retried with the controller retry policy."""
+        factory_mock.get_enrollment_controller.return_value = self.controller_mock
+        self.controller_mock.run_enrollment.return_value = 'error', False
+        retry_mock.return_value = Exception('error')
+
+        with self.assertRaises(Exception):
+            run_external_enrollment('icc', self.data, self.course_settings)  # pylint: disable=no-value-for-parameter
+
+        self.controller_mock.get_retry_policy.assert_called_once_with('icc')
+        self.assertEqual(retry_mock.call_args[1]['max_retries'], 3)
+        self.assertEqual(retry_mock.call_args[1]['countdown'], 60)